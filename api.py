@@ -4,45 +4,128 @@
 # pylint: disable=line-too-long, invalid-name, trailing-whitespace
 # API is described here: http://docs.gurock.com/testrail-api2/start
 import time
-import urllib.request
-import urllib.error
 import json
 import base64
+import http.client
 
 import configparser
+import threading
+import types
 
 import logging
 
-# Configuration
-conf = configparser.ConfigParser()
-with open("config", "r") as f:
-    conf.read_file(f)
-
-LOGFILE = conf.get('api_logging', 'file')
-LOGLEVEL = conf.get('api_logging', 'level')
-
-print("API Logging level: ", end='')
-if LOGLEVEL == "info":
-    LEVEL = logging.INFO
-    print("info", end='')
-elif LOGLEVEL == "debug":
-    LEVEL = logging.DEBUG
-    print("debug", end='')
-elif LOGLEVEL == "error":
-    LEVEL = logging.ERROR
-    print("error", end='')
-print(" (logfile: {0})".format(LOGFILE))
+from api_metrics import request_event
+from api_models import Case, Plan, Result, Run, Section, Test, to_model
+from api_registry import Registry
+from api_retry import RetryPolicy, retry_after
+from api_sections import SectionTree
+from api_stream import JSONArrayStream
+from api_transport import PooledTransport, Response
 
 logger = logging.getLogger(__name__)
-logger.setLevel(LEVEL)
-fh = logging.FileHandler(LOGFILE)
-formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s')
-fh.setFormatter(formatter)
-logger.addHandler(fh)
+
+# Configuration (see config.sample), read on demand: importing this module has no side effect
+CONFIG_FILE = "config"
+LOG_LEVELS = {
+    "info": logging.INFO,
+    "debug": logging.DEBUG,
+    "error": logging.ERROR,
+}
+_logging_lock = threading.Lock()
+_logging_configured = False
+
+def load_config(path=CONFIG_FILE):
+    """ read the configuration file
+
+    Returns
+    -------
+    configparser.ConfigParser
+    """
+    conf = configparser.ConfigParser()
+    with open(path, "r") as f:
+        conf.read_file(f)
+    return conf
+
+def configure_logging(conf=None, path=CONFIG_FILE):
+    """ log to the file and level of the [api_logging] section of the configuration
+
+    Called when the first Client is created. Does nothing when it was already
+    done, or when there is no configuration file or [api_logging] section.
+    """
+    global _logging_configured # pylint: disable=global-statement
+    with _logging_lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+        if conf is None:
+            try:
+                conf = load_config(path)
+            except OSError:
+                return
+        if not conf.has_section('api_logging'):
+            return
+        logger.setLevel(LOG_LEVELS.get(conf.get('api_logging', 'level', fallback='info'), logging.INFO))
+        # the file is only opened by the first log record
+        fh = logging.FileHandler(conf.get('api_logging', 'file'), delay=True)
+        formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s')
+        fh.setFormatter(formatter)
+        logger.addHandler(fh)
+
+# errors raised by the transports when the server can't be reached or drops the connection
+NETWORK_ERRORS = (OSError, http.client.HTTPException)
 
 class Client:
-    """ testrail API client wrapper """
-    def __init__(self, base_url, project_id, user=None, password=None):
+    """ testrail API client wrapper
+
+    Parameters
+    ----------
+    base_url : str
+        url of the testrail instance
+    project_id : int
+        id of the project
+    user : str (optional)
+        testrail user
+    password : str (optional)
+        testrail password or api key
+    transport : api_transport.Transport (optional)
+        HTTP transport used to send the requests. Defaults to a keep-alive
+        api_transport.PooledTransport; api_transport.UrllibTransport opens a
+        new connection for each request.
+    rate_limiter : api_ratelimit.RateLimiter (optional)
+        limits the rate of the requests; it can be shared between clients
+    retry_policy : api_retry.RetryPolicy (optional)
+        when to retry failed requests. The default policy retries up to 5
+        times on 429/502/503/504 answers and network errors, with exponential
+        backoff, and never replays non-idempotent POSTs (add_*) which may have
+        reached the server.
+    cache : api_cache.ResponseCache (optional)
+        caches the answers of the read-only metadata methods (get_suites,
+        get_sections, get_case...). POST requests invalidate the cached
+        answers they make stale.
+    metrics : api_metrics.Metrics (optional)
+        records the latency, size, retries and waits of every request
+    single_flight : api_flight.SingleFlight (optional)
+        concurrent identical GET requests share one request and its answer
+
+    A client can be shared by threads: the request headers are built once and
+    immutable, the transport pools its connections, and the registries, cache,
+    rate limiter and metrics are guarded by locks. submit and map run client
+    methods in a thread pool of executor_workers threads, under the rate
+    limiter of the client.
+    """
+    # delay (seconds) before the first retry of a failed chunk in bulk_add_results_for_cases
+    chunk_retry_delay = 1
+    # time (seconds) after which the registries (statuses, users...) are loaded again
+    registry_ttl = 3600
+    # time (seconds) during which a registry which failed to load is not requested again
+    registry_failure_ttl = 30
+    # number of threads of the executor of submit and map
+    executor_workers = 8
+    _executor = None
+    # ((user, password), headers of the requests)
+    _auth = None
+
+    def __init__(self, base_url, project_id, user=None, password=None, transport=None, rate_limiter=None, retry_policy=None, cache=None, metrics=None, single_flight=None):
         if user:
             self.user = user
         else:
@@ -57,61 +140,153 @@ class Client:
         if not base_url.endswith('/'):
             base_url += '/'
         self.__url = base_url + 'index.php?/api/v2/'
+        self.transport = transport if transport is not None else PooledTransport()
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.cache = cache
+        self.metrics = metrics
+        self.single_flight = single_flight
+
+        self.registries = self._registries()
+        self._executor_lock = threading.Lock()
+        # .batcher: api_batch.ResultBatcher of the batching() block opened by the thread
+        self._batching = threading.local()
+        # {suite_id: SectionTree}, see section_tree
+        self._section_trees = {}
+        self._section_trees_lock = threading.Lock()
+
+        configure_logging()
+        if not (self.user and self.password):
+            logger.warning("[testrail api init] username and password are not defined")
 
+    def _registries(self):
+        """ indexed lookup tables of the definitions, loaded on first use (see api_registry) """
+        ttls = {'ttl': self.registry_ttl, 'failure_ttl': self.registry_failure_ttl}
+        return {
+            'statuses': Registry(self._load_statuses, label_key='label', name_keys=('name',), **ttls),
+            'users': Registry(self._load_users, label_key='name', name_keys=('email',), **ttls),
+            'priorities': Registry(self.get_priorities, label_key='name', name_keys=('short_name',), **ttls),
+            'case_types': Registry(self.get_case_types, label_key='name', **ttls),
+            'case_fields': Registry(self.get_case_fields, label_key='label', name_keys=('system_name', 'name'), **ttls),
+            'result_fields': Registry(self.get_result_fields, label_key='label', name_keys=('system_name', 'name'), **ttls),
+        }
 
+    def _load_users(self):
+        # the users of the project: non-administrators can't list all the users
+        return self.get_users(self.project_id)
+
+    def _load_statuses(self):
         if not (self.user and self.password):
-            logger.warning("[testrail api init] username and password are not defined")
-            self.statuses = {}
-        else:
-            # Retrieve status codes
-            self.statuses = self.get_statuses()
+            return []
+        # Retrieve status codes
+        return self.get_statuses()
+
+    @property
+    def statuses(self):
+        """ test status definitions (see get_statuses), retrieved on first use """
+        return self.registries['statuses'].items
+
+    @statuses.setter
+    def statuses(self, statuses):
+        self.registries['statuses'].set(statuses)
+
+    def load_statuses(self):
+        """ (re)load self.statuses from get_statuses """
+        return self.registries['statuses'].refresh()
+
+    def close(self):
+        """ close the connections held by the transport, after the calls submitted to the executor """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.transport.close()
+
+    @property
+    def executor(self):
+        """ concurrent.futures.ThreadPoolExecutor of submit and map, created on first use """
+        with self._executor_lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+                self._executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix="testrail-api")
+            return self._executor
+
+    def _method(self, method):
+        """ bound method of the client from its name, or method itself """
+        return getattr(self, method) if isinstance(method, str) else method
+
+    def submit(self, method, *args, **kwargs):
+        """ call method(*args, **kwargs) in the executor of the client
+
+        Sync only: with api_async.AsyncClient, gather the coroutines instead.
 
-    def __send_request(self, http_method, uri, data):
-        """ Send a request to URI with the given http method and data
+        Parameters
+        ----------
+        method : str or callable
+            name of a method of the client ('get_tests'), or any callable
+
+        Returns
+        -------
+        concurrent.futures.Future
+            future of the answer of the method
         """
+        return self.executor.submit(self._method(method), *args, **kwargs)
+
+    def map(self, method, *iterables, timeout=None):
+        """ method(*args) for the args of iterables, called in the executor of the client
+
+        Sync only: with api_async.AsyncClient, gather the coroutines instead.
+
+        Like concurrent.futures.Executor.map: the answers are yielded in order,
+        and the exception of a call is raised when its answer is reached.
+
+            for tests in client.map('get_tests', run_ids):
+                ...
+        """
+        return self.executor.map(self._method(method), *iterables, timeout=timeout)
+
+    def _headers(self):
+        """ headers of the requests, built once per credentials: immutable, shared by the threads """
+        credentials = (self.user, self.password)
+        auth = self._auth
+        if auth is None or auth[0] != credentials:
+            token = str(base64.b64encode(bytes('%s:%s' % credentials, 'utf-8')), 'ascii').strip()
+            auth = self._auth = (credentials, types.MappingProxyType({
+                'Authorization': 'Basic %s' % token,
+                'Content-Type': 'application/json',
+            }))
+        return auth[1]
+
+    def _prepare_request(self, http_method, uri, data):
+        """ returns the url, body and headers of a request to URI """
         url = self.__url + uri
-        
-        request = urllib.request.Request(url)
+
+        body = None
         if http_method == 'POST':
             logger.debug("[api.__send_request] %s %s %s", http_method, url, data)
-            request.data = bytes(json.dumps(data), 'utf-8')
+            body = bytes(json.dumps(data), 'utf-8')
         else:
             logger.debug("[api.__send_request] %s %s", http_method, url)
-        auth = str(
-            base64.b64encode(
-                bytes('%s:%s' % (self.user, self.password), 'utf-8')
-            ),
-            'ascii'
-        ).strip()
-        request.add_header('Authorization', 'Basic %s' % auth)
-        request.add_header('Content-Type', 'application/json')
-
-        done = False
-        maxtries = 5
-        while not done and maxtries > 0:
-            try:
-                request = urllib.request.urlopen(request)
-                status_code = request.getcode()
-                response = request.read()
-                done = True
-            except urllib.error.HTTPError as exception:
-                status_code = exception.code
-                response = exception.read()
-                if status_code == 429:
-                    try:
-                        sleep_time = request.headers['Retry-After']
-                    except KeyError:
-                        logger.debug("[api.__send_request] KeyError Exception while reading Retry-After header. Available headers: %s", request.headers.items())
-                        sleep_time = 60
-                    logger.debug("[api.__send_request] sleeping {0} second{1} because of a 429 error (too many requests) and retrying").format(sleep_time, "s" if sleep_time > 1 else "")
-                    time.sleep(sleep_time)
-                else:
-                    logger.debug("[api.__send_request] got a %s error, not retrying", status_code)
-                    maxtries = -1
-            maxtries -= 1
-
-        if maxtries < 0:
+        return url, body, self._headers()
+
+    def _rate_feedback(self, answer):
+        """ tell the rate limiter how the server answered """
+        if self.rate_limiter is None:
+            return
+        if answer.status == 429:
+            retry_after_header = retry_after(answer.headers)
+            self.rate_limiter.throttled(retry_after_header)
+        elif answer.status < 400:
+            self.rate_limiter.succeeded()
+
+    def _decode_answer(self, http_method, url, answer, raise_errors=False):
+        """ returns the decoded json of the answer, None if the request failed (HTTPError with raise_errors) """
+        status_code = answer.status
+        response = answer.body
+        if status_code >= 400 and (status_code != 429 or raise_errors):
             logger.error("[api.__send_request] failed %s to %s, status code: %s", http_method, url, status_code)
+            if raise_errors:
+                raise HTTPError(status_code, error_message(response))
             return None
 
         try:
@@ -119,7 +294,7 @@ class Client:
         except ValueError:
             if status_code != 200 or response:
                 logger.error("[api __send_request] Invalid json returned, HTTP code %s, data: %s", status_code, response)
-                raise APIError("TestRail API returned invalid json, HTTP code %s, data: %s" % status_code, response)
+                raise APIError("TestRail API returned invalid json, HTTP code %s, data: %s" % (status_code, response))
             result = {}
 
         if 'error' in result:
@@ -128,6 +303,103 @@ class Client:
 
         return result
 
+    def _record_request(self, http_method, uri, started, answer, body, tries, throttled, slept, waited, error=None):
+        """ report a completed request to self.metrics """
+        self.metrics.record(request_event(http_method, uri, answer, time.perf_counter() - started, body, tries, throttled, slept, waited, error))
+
+    def _send_with_retries(self, http_method, uri, url, send, body=None):
+        """ call send() until its answer is not retried (see self.retry_policy), returns the last answer """
+        retry = self.retry_policy.start(http_method, uri)
+        started = time.perf_counter()
+        throttled = 0
+        slept = waited = 0.0
+        while True:
+            if self.rate_limiter is not None:
+                waited += self.rate_limiter.acquire()
+            try:
+                answer = send()
+            except NETWORK_ERRORS as exception:
+                sleep_time = retry.next_delay(error=exception)
+                if sleep_time is None:
+                    logger.error("[api.__send_request] %s %s failed after %s tr%s: %r", http_method, url, retry.tries, "ies" if retry.tries > 1 else "y", exception)
+                    if self.metrics is not None:
+                        self._record_request(http_method, uri, started, None, body, retry.tries, throttled, slept, waited, exception)
+                    raise
+                logger.debug("[api.__send_request] %r, retrying in %.1f seconds", exception, sleep_time)
+                time.sleep(sleep_time)
+                slept += sleep_time
+                continue
+            self._rate_feedback(answer)
+            throttled += answer.status == 429
+            sleep_time = retry.next_delay(answer=answer)
+            if sleep_time is None:
+                if self.metrics is not None:
+                    self._record_request(http_method, uri, started, answer, body, retry.tries, throttled, slept, waited)
+                return answer
+            logger.debug("[api.__send_request] got a %s error, retrying in %.1f seconds", answer.status, sleep_time)
+            time.sleep(sleep_time)
+            slept += sleep_time
+
+    def __send_request(self, http_method, uri, data, raise_errors=False):
+        """ Send a request to URI with the given http method and data
+        """
+        url, body, headers = self._prepare_request(http_method, uri, data)
+        answer = self._send_with_retries(http_method, uri, url, lambda: self.transport.request(http_method, url, body, headers), body)
+        return self._decode_answer(http_method, url, answer, raise_errors)
+
+    def _open(self, url, headers):
+        """ GET url with the body of the answer left unread, unless it is an error """
+        response = self.transport.open('GET', url, None, headers)
+        if response.status < 400:
+            return response
+        with response:
+            return Response(response.status, response.headers, response.read())
+
+    def stream_get(self, uri, key=None, meta=None):
+        """ send a GET request and yield the items of the json array of the answer as they are read
+
+        Unlike send_get, the answer is never held in memory as a whole: use it
+        for very large answers (get_cases of big suites, get_results...).
+
+        Parameters
+        ----------
+        uri :
+            API method to call including parameters
+        key : str (optional)
+            member of the answer holding the array, when the answer is an
+            object (e.g. 'cases' for the paginated answers of get_cases)
+        meta : dict (optional)
+            receives the other members of the answer (e.g. '_links'), once
+            the items are consumed
+
+        Yields
+        ------
+        dict
+            one item of the array at a time
+        """
+        url, _, headers = self._prepare_request('GET', uri, None)
+        answer = self._send_with_retries('GET', uri, url, lambda: self._open(url, headers))
+        if isinstance(answer, Response):
+            result = self._decode_answer('GET', url, answer)
+            if result is None:
+                raise APIError("[api.Client.stream_get] failed to get %s" % uri)
+            if isinstance(result, list):
+                yield from result
+                return
+            if meta is not None:
+                meta.update((name, value) for name, value in result.items() if name != key)
+            yield from result.get(key, [])
+            return
+        with answer:
+            stream = JSONArrayStream(answer, key)
+            yield from stream
+            # read the end of the answer (chunked encoding terminator...) so the connection can be reused
+            answer.read()
+            if 'error' in stream.meta:
+                raise APIError("TestRail API returned error: \"%s\"" % stream.meta['error'])
+            if meta is not None:
+                meta.update(stream.meta)
+
     def send_get(self, uri):
         """ send a GET request and returns the json as a python dict
 
@@ -136,9 +408,19 @@ class Client:
         uri :
             API method to call including parameters
         """
-        return self.__send_request('GET', uri, None)
+        if self.cache is not None:
+            result = self.cache.get(uri)
+            if result is not None:
+                return result
+        if self.single_flight is not None:
+            result = self.single_flight.do(uri, lambda: self.__send_request('GET', uri, None))
+        else:
+            result = self.__send_request('GET', uri, None)
+        if self.cache is not None and result is not None:
+            self.cache.put(uri, result)
+        return result
 
-    def send_post(self, uri, data):
+    def send_post(self, uri, data, raise_errors=False):
         """ send a POST request and returns the json as a python dict
         Parameters
         ----------
@@ -146,6 +428,9 @@ class Client:
             API method to call including parameters
         data :
             json (python dict) with POST parameters
+        raise_errors : bool
+            raise an HTTPError (with the HTTP status) when the request fails,
+            instead of returning None
         Returns
         -------
         out
@@ -154,7 +439,118 @@ class Client:
         #TODO: some api calls (such as delete_secton) use POST but send no data, triggering this
         #if not data:
         #    logger.info("[APIClient.send_post (%s)] no data provided.", uri) 
-        return self.__send_request('POST', uri, data)
+        try:
+            return self.__send_request('POST', uri, data, raise_errors)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_write(uri)
+            if self.single_flight is not None:
+                # the GETs sent from now on must see the write
+                self.single_flight.forget()
+
+    @staticmethod
+    def _filters(filters):
+        """ returns the '&key=value' uri suffix for the filters of the get_* methods
+
+        lists are sent as comma-separated values, is_completed must be a bool
+        """
+        uri = ""
+        for key, value in filters.items():
+            if key == "is_completed":
+                if value is True:
+                    uri += "&is_completed=1"
+                elif value is False:
+                    uri += "&is_completed=0"
+                else:
+                    raise Exception("is_completed must be bool (True or False)")
+                continue
+            if isinstance(value, list):
+                value = ",".join(str(item) for item in value)
+            uri += "&{0}={1}".format(key, value)
+        return uri
+
+    def _paginate(self, uri, key, prefetch=False, stream=False):
+        """ generator over the items of a paginated get_* method
+
+        Since TestRail 6.7, bulk get_* methods return one page at a time,
+        wrapped in {offset, limit, size, _links: {next, prev}, <key>: [...]}.
+        The pages are fetched lazily by following _links.next, and at most two
+        pages are held in memory. Older servers return a plain list, which is
+        iterated as is.
+
+        Parameters
+        ----------
+        uri : str
+            API method to call including parameters
+        key : str
+            key of the items in the page ('cases', 'runs', ...)
+        prefetch : bool
+            fetch the next page in a background thread while the current one
+            is being consumed
+        stream : bool
+            decode the items of each page as they are read (see stream_get)
+            instead of loading whole pages: for servers which return very big
+            pages, or a single unpaginated list. Ignores prefetch.
+
+        Yields
+        ------
+        dict
+            one item at a time
+        """
+        if stream:
+            while uri:
+                meta = {}
+                yield from self.stream_get(uri, key, meta)
+                uri = self._next_page(meta)
+            return
+        executor = None
+        if prefetch:
+            from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            page = self.send_get(uri)
+            while True:
+                if page is None:
+                    raise APIError("[api.Client._paginate] failed to get %s" % uri)
+                if isinstance(page, list):
+                    yield from page
+                    return
+                next_uri = self._next_page(page)
+                future = executor.submit(self.send_get, next_uri) if executor and next_uri else None
+                yield from page.get(key, [])
+                if not next_uri:
+                    return
+                uri = next_uri
+                page = future.result() if future else self.send_get(uri)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _next_page(page):
+        """ returns the uri of the next page of a paginated answer, None on the last page """
+        next_uri = (page.get('_links') or {}).get('next')
+        if not next_uri:
+            return None
+        # the links are relative to the server root: /api/v2/get_cases/1&offset=250...
+        return next_uri.split('/api/v2/', 1)[-1]
+
+    @staticmethod
+    def _model_class(model, default):
+        """ record class selected by the model parameter of the get_* / iter_* methods """
+        if not model:
+            return None
+        return default if model is True else model
+
+    def _model(self, result, model, default, key=None):
+        """ convert the answer of a get_* method into records (see api_models) when model is set """
+        model = self._model_class(model, default)
+        return result if model is None else to_model(result, model, key)
+
+    def _records(self, items, model, default):
+        """ convert the items yielded by _paginate into records when model is set """
+        model = self._model_class(model, default)
+        return items if model is None else (model.from_dict(item) for item in items)
 
     # Projects methods
     def get_project(self):
@@ -187,7 +583,7 @@ class Client:
                 print("{0}    {1}".format(status['id'], status['label']))
 
     # Results methods
-    def get_results(self, test_id):
+    def get_results(self, test_id, model=False):
         """ get_result API method: get list
 
         http://docs.gurock.com/testrail-api2/reference-results#get_results
@@ -195,13 +591,71 @@ class Client:
         ----------
         test_id
             id of the test
+        model : bool or api_models.Record subclass
+            return Result records instead of dicts (True for api_models.Result)
         Returns
         --------
         dict
             information about test_id
         """
         uri = "get_results/{0}".format(test_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Result, "results")
+
+    def iter_results(self, test_id, prefetch=False, stream=False, model=False):
+        """ iterate over the results of test_id, following the pagination
+
+        See _paginate for prefetch and stream, get_results for model.
+
+        Yields
+        ------
+        dict
+            one result at a time
+        """
+        uri = "get_results/{0}".format(test_id)
+        return self._records(self._paginate(uri, "results", prefetch, stream), model, Result)
+
+    def get_results_many(self, test_ids, max_workers=8, model=False):
+        """ results of several tests, fetched concurrently
+
+        See _fetch_many for test_ids, max_workers and the report, get_results
+        for model.
+        """
+        return self._fetch_many(test_ids, lambda test_id: self.iter_results(test_id, model=model), max_workers)
+
+    def get_results_for_run(self, run_id, model=False, **kwargs):
+        """ get_results_for_run API method: results of all the tests of run_id
+
+        http://docs.gurock.com/testrail-api2/reference-results#get_results_for_run
+        Parameters
+        ----------
+        run_id : int
+            id of the run
+        created_after, created_before : timestamp
+        created_by, status_id : int or list of ints
+        limit, offset : int
+        model : bool or api_models.Record subclass
+            return Result records instead of dicts (True for api_models.Result)
+        Returns
+        --------
+        dict
+            result of the get_results_for_run method
+        """
+        uri = "get_results_for_run/{0}{1}".format(run_id, self._filters(kwargs))
+        return self._model(self.send_get(uri), model, Result, "results")
+
+    def iter_results_for_run(self, run_id, prefetch=False, stream=False, model=False, **kwargs):
+        """ iterate over the results of all the tests of run_id, following the pagination
+
+        Takes the same filters and model as get_results_for_run. See _paginate
+        for prefetch and stream.
+
+        Yields
+        ------
+        dict
+            one result at a time
+        """
+        uri = "get_results_for_run/{0}{1}".format(run_id, self._filters(kwargs))
+        return self._records(self._paginate(uri, "results", prefetch, stream), model, Result)
 
     def add_result_for_case(self, case_id, run_id, status_id, **kwargs):
         """ add_result_for_case method: adds results to test corresponding to case_id of run_id
@@ -223,7 +677,8 @@ class Client:
         Returns
         -------
         dict
-            response of the add_result_for_case method
+            response of the add_result_for_case method. Inside a batching()
+            block: concurrent.futures.Future of that response.
         """
         method = "add_result_for_case"
         uri = "{0}/{1}/{2}".format(method, run_id, case_id)
@@ -236,8 +691,31 @@ class Client:
                 if isinstance(kwargs[key], list):
                     kwargs[key] = ",".join(kwargs[key])
             data[key] = kwargs[key]
+        batcher = getattr(self._batching, 'batcher', None)
+        if batcher is not None:
+            return batcher.add(run_id, dict(data, case_id=case_id))
         return self.send_post(uri, data)
 
+    def batching(self, max_size=250, max_delay=2.0):
+        """ write-behind mode of add_result_for_case, as a context manager
+
+        Sync only: with api_async.AsyncClient, gather add_result_for_case or
+        use bulk_add_results_for_cases.
+
+        Inside the with block, add_result_for_case buffers the results per run
+        and returns Futures; the results are posted with add_results_for_cases
+        when max_size results of a run are buffered, after max_delay seconds,
+        and when the block exits. Only the calls of the thread which opened
+        the block are batched. See api_batch.ResultBatcher.
+
+        Returns
+        -------
+        api_batch.ResultBatcher
+            errors holds the results which could not be added, per case
+        """
+        from api_batch import ResultBatcher # pylint: disable=import-outside-toplevel
+        return ResultBatcher(self, max_size, max_delay)
+
     # Suites metods
     def get_suites(self):
         """ get_suites API method: retrieve list of suites for project_id
@@ -249,7 +727,7 @@ class Client:
         dict
             response of the get_suite method
         """
-        uri = "get_suite/{0}".format(self.project_id)
+        uri = "get_suites/{0}".format(self.project_id)
         return self.send_get(uri)
 
     def get_suite(self, suite_id):
@@ -309,10 +787,10 @@ class Client:
         }
         if description:
             data['description'] = description
-        self.send_post(uri, data)
+        return self.send_post(uri, data)
 
     # Runs methods
-    def get_run(self, run_id):
+    def get_run(self, run_id, model=False):
         """ get_run method: get run run_id
 
         http://docs.gurock.com/testrail-api2/reference-runs#get_run
@@ -320,6 +798,8 @@ class Client:
         ---------
         run_id : int
             id of the run
+        model : bool or api_models.Record subclass
+            return Run records instead of dicts (True for api_models.Run)
         Returns
         -------
         dict
@@ -327,9 +807,9 @@ class Client:
         """
         method = "get_run"
         uri = "{0}/{1}".format(method, run_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Run)
 
-    def get_runs(self, **kwargs):
+    def get_runs(self, model=False, **kwargs):
         """ get_runs method: gets list of runs
 
         http://docs.gurock.com/testrail-api2/reference-runs#get_runs
@@ -351,6 +831,8 @@ class Client:
             skip the first 'offset' results
         milestone_id : int
             filter by milestone
+        model : bool or api_models.Record subclass
+            return Run records instead of dicts (True for api_models.Run)
 
         Results
         ------
@@ -358,21 +840,22 @@ class Client:
             result of the get_runs method
         """
         method = "get_runs"
-        uri = "{0}/{1}".format(method, self.project_id)
+        uri = "{0}/{1}{2}".format(method, self.project_id, self._filters(kwargs))
+        return self._model(self.send_get(uri), model, Run, "runs")
 
-        for key in kwargs:
-            if key == "is_completed":
-                if kwargs[key] is True:
-                    uri += "&is_completed=1"
-                elif kwargs[key] is False:
-                    uri += "&is_completed=9"
-                else:
-                    raise Exception("is_completed must be bool (True or False)")
-                continue
-            if isinstance(kwargs[key], list):
-                kwargs[key] = ",".join(kwargs[key])
-            uri += "&{0}={1}".format(key, kwargs[key])
-        return self.send_get(uri)
+    def iter_runs(self, prefetch=False, stream=False, model=False, **kwargs):
+        """ iterate over all the runs of self.project_id, following the pagination
+
+        Takes the same filters and model as get_runs. See _paginate for prefetch and stream.
+
+        Yields
+        ------
+        dict
+            one run at a time
+        """
+        method = "get_runs"
+        uri = "{0}/{1}{2}".format(method, self.project_id, self._filters(kwargs))
+        return self._records(self._paginate(uri, "runs", prefetch, stream), model, Run)
 
     def add_run(self, suite_id, name, **kwargs):
         """ add_suite API method: create a new test suite
@@ -468,16 +951,17 @@ class Client:
         return self.send_post(uri, data)
 
     # plans methods
-    def get_plan(self, plan_id):
+    def get_plan(self, plan_id, model=False):
         """ get_plan method: get plan plan_id
                 plan_id: int
+                model: bool or api_models.Record subclass, return a Plan record instead of a dict
             http://docs.gurock.com/testrail-api2/reference-plans#get_plan
         """
         method = "get_plan"
         uri = "{0}/{1}".format(method, plan_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Plan)
 
-    def get_plans(self, **kwargs):
+    def get_plans(self, model=False, **kwargs):
         """ get_plans method: gets list of plans
 
         http://docs.gurock.com/testrail-api2/reference-plans#get_plans
@@ -491,6 +975,8 @@ class Client:
         limit : int
         offset : int
         milestone_id : int
+        model : bool or api_models.Record subclass
+            return Plan records instead of dicts (True for api_models.Plan)
 
         Returns
         -------
@@ -498,20 +984,22 @@ class Client:
             output of get_plans method
         """
         method = "get_plans"
-        uri = "{0}/{1}".format(method, self.project_id)
-        for key in kwargs:
-            if key is "is_completed":
-                if kwargs[key] is True:
-                    uri += "&is_completed=1"
-                elif kwargs[key] is False:
-                    uri += "&is_completed=0"
-                else:
-                    raise Exception("is_completed must be bool (True or False)")
-                continue
-            if isinstance(kwargs[key], list):
-                kwargs[key] = ",".join(kwargs[key])
-            uri += "&{0}={1}".format(key, kwargs[key])
-        return self.send_get(uri)
+        uri = "{0}/{1}{2}".format(method, self.project_id, self._filters(kwargs))
+        return self._model(self.send_get(uri), model, Plan, "plans")
+
+    def iter_plans(self, prefetch=False, stream=False, model=False, **kwargs):
+        """ iterate over all the plans of self.project_id, following the pagination
+
+        Takes the same filters and model as get_plans. See _paginate for prefetch and stream.
+
+        Yields
+        ------
+        dict
+            one plan at a time
+        """
+        method = "get_plans"
+        uri = "{0}/{1}{2}".format(method, self.project_id, self._filters(kwargs))
+        return self._records(self._paginate(uri, "plans", prefetch, stream), model, Plan)
 
     def add_plan(self, name, description=None, milestone_id=None, entries=None):
         """ add_plan API method
@@ -609,22 +1097,49 @@ class Client:
         raise NotImplementedError("Not implemented")
 
     # tests methods
-    def get_test(self, test_id):
+    def get_test(self, test_id, model=False):
         """ get_test method: get test test_id
                 test_id: int
+                model: bool or api_models.Record subclass, return a Test record instead of a dict
             http://docs.gurock.com/testrail-api2/reference-tests#get_test
         """
         method = "get_test"
         uri = "{0}/{1}".format(method, test_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Test)
 
-    def get_tests(self, run_id, status_id=None):
+    def get_tests(self, run_id, status_id=None, model=False):
         """ get_tests API method
-                run_id: int, or list of ints the ID of the test run
+                run_id: int, the ID of the test run (see get_tests_many for several runs)
                 status_id: int, or list of ints. see self.statuses for definitions
+                model: bool or api_models.Record subclass, return Test records instead of dicts
 
         http://docs.gurock.com/testrail-api2/reference-tests#get_tests
         """
+        return self._model(self.send_get(self._tests_uri(run_id, status_id)), model, Test, "tests")
+
+    def iter_tests(self, run_id, status_id=None, prefetch=False, stream=False, model=False):
+        """ iterate over the tests of run_id, following the pagination
+
+        Takes the same parameters as get_tests. See _paginate for prefetch and stream.
+
+        Yields
+        ------
+        dict
+            one test at a time
+        """
+        return self._records(self._paginate(self._tests_uri(run_id, status_id), "tests", prefetch, stream), model, Test)
+
+    def get_tests_many(self, run_ids, status_id=None, max_workers=8, model=False):
+        """ tests of several runs, fetched concurrently
+
+        See _fetch_many for run_ids, max_workers and the report, get_tests for
+        status_id and model.
+        """
+        return self._fetch_many(run_ids, lambda run_id: self.iter_tests(run_id, status_id, model=model), max_workers)
+
+    @staticmethod
+    def _tests_uri(run_id, status_id):
+        """ uri of the get_tests method """
         method = "get_tests"
         uri = "{0}/{1}".format(method, run_id)
 
@@ -632,23 +1147,24 @@ class Client:
             assert any([isinstance(status_id, list), isinstance(status_id, int)]), "status_id must be an int or a list of ints"
             if isinstance(status_id, list):
                 assert all([isinstance(tmp_id, int) for tmp_id in status_id]), "status_id must be an int or a list of ints"
-                uri += "&status_id={}".format(",".join(status_id))
+                uri += "&status_id={}".format(",".join(str(tmp_id) for tmp_id in status_id))
             else:
                 uri += "&status_id={}".format(status_id)
-        return self.send_get(uri)
+        return uri
 
     # sections methods
-    def get_section(self, section_id):
+    def get_section(self, section_id, model=False):
         """ get_section method: get section sectio
         \n_id
                 section_id: int
+                model: bool or api_models.Record subclass, return a Section record instead of a dict
             http://docs.gurock.com/sectionrail-api2/reference-sections#get_section
         """
         method = "get_section"
         uri = "{0}/{1}".format(method, section_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Section)
 
-    def get_sections(self, suite_id):
+    def get_sections(self, suite_id, model=False):
         """ get_sections API method
 
         http://docs.gurock.com/testrail-api2/reference-sections#get_sections
@@ -657,15 +1173,32 @@ class Client:
         ----------
         suite_id : int
             id of the suite from which to retrieve sections
+        model : bool or api_models.Record subclass
+            return Section records instead of dicts (True for api_models.Section)
 
         Returns
         --------
         dict
             result of the get_sections method
         """
+        return self._model(self.send_get(self._sections_uri(suite_id)), model, Section, "sections")
+
+    def iter_sections(self, suite_id, prefetch=False, stream=False, model=False):
+        """ iterate over the sections of suite_id, following the pagination
+
+        See _paginate for prefetch and stream, get_sections for model.
+
+        Yields
+        ------
+        dict
+            one section at a time
+        """
+        return self._records(self._paginate(self._sections_uri(suite_id), "sections", prefetch, stream), model, Section)
+
+    def _sections_uri(self, suite_id):
+        """ uri of the (first page of the) sections of suite_id """
         method = "get_sections"
-        uri = "{0}/{1}&suite_id={2}".format(method, self.project_id, suite_id)
-        return self.send_get(uri)
+        return "{0}/{1}&suite_id={2}".format(method, self.project_id, suite_id)
 
     def delete_section(self, section_id):
         """ delete_section API method
@@ -685,7 +1218,7 @@ class Client:
         method = "delete_section"
         uri = "{0}/{1}".format(method, section_id)
 
-        return self.send_post(uri, {})
+        return self._sections_changed(self.send_post(uri, {}), lambda tree, _: tree.remove(section_id))
 
     def add_section(self, suite_id, name, description=None, parent_id=None):
         """ add_section API method
@@ -706,19 +1239,74 @@ class Client:
             data["description"] = description
         if parent_id:
             data["parent_id"] = parent_id
-        return self.send_post(uri, data)
+        return self._sections_changed(self.send_post(uri, data), lambda tree, section: tree.add(section) if tree.suite_id == suite_id else None)
+
+    def _sections_changed(self, result, update):
+        """ update(tree, result) for the cached section trees if the request succeeded, returns result """
+        if result is not None:
+            with self._section_trees_lock:
+                trees = list(self._section_trees.values())
+            for tree in trees:
+                update(tree, result)
+        return result
+
+    def section_tree(self, suite_id, refresh=False):
+        """ api_sections.SectionTree of the sections of suite_id
+
+        The tree is built from iter_sections on the first call and cached:
+        add_section and delete_section update it in place. refresh=True builds
+        it again (e.g. after the sections were changed by someone else), from
+        the server: the cached pages of get_sections are dropped first.
+        """
+        # held while the tree is built: the threads which need it wait for it instead of building their own
+        with self._section_trees_lock:
+            tree = self._section_trees.get(suite_id)
+            if tree is None or refresh:
+                if refresh and self.cache is not None:
+                    self.cache.invalidate(uri=self._sections_uri(suite_id), pages=True)
+                tree = self._section_trees[suite_id] = SectionTree(self.iter_sections(suite_id), suite_id)
+            return tree
+
+    def ensure_section(self, suite_id, path, description=None):
+        """ id of the section at path in suite_id, adding the missing sections of the path
+
+        Parameters
+        ----------
+        suite_id : int
+            id of the suite
+        path : tuple / list of names, or str
+            names from the root section down, a string is split on " > "
+
+        Returns
+        -------
+        int
+            id of the last section of path
+        """
+        tree = self.section_tree(suite_id)
+        names = tree.split_path(path)
+        parent_id = None
+        for depth in range(1, len(names) + 1):
+            section_id = tree.id_of(names[:depth])
+            if section_id is None:
+                section = self.add_section(suite_id, names[depth - 1], description, parent_id)
+                if section is None:
+                    raise APIError("[api.Client.ensure_section] failed to add section %r" % (names[:depth],))
+                section_id = section['id']
+            parent_id = section_id
+        return parent_id
 
     # cases methods
-    def get_case(self, case_id):
+    def get_case(self, case_id, model=False):
         """ get_case API method
                 case_id: int
+                model: bool or api_models.Record subclass, return a Case record instead of a dict
         http://docs.gurock.com/testrail-api2/reference-cases#get_case
         """
         method = "get_case"
         uri = "{0}/{1}".format(method, case_id)
-        return self.send_get(uri)
+        return self._model(self.send_get(uri), model, Case)
 
-    def get_cases(self, suite_id, section_id=None):
+    def get_cases(self, suite_id, section_id=None, model=False, **kwargs):
         """ get_sections API method
 
         Parameters
@@ -749,6 +1337,8 @@ class Client:
             Only return test cases updated before this date (as UNIX timestamp).
         updated_by : int or list of ints
             A comma-separated list of users who updated test cases to filter by.
+        model : bool or api_models.Record subclass
+            return Case records instead of dicts (True for api_models.Case)
         Results
         ------
         list :
@@ -756,13 +1346,36 @@ class Client:
 
         http://docs.gurock.com/testrail-api2/reference-cases#get_cases
         """
-        logger.error("[api.Client.get_cases] case filtering is not yet implemented. Please fix me")
+        return self._model(self.send_get(self._cases_uri(suite_id, section_id, kwargs)), model, Case, "cases")
+
+    def iter_cases(self, suite_id, section_id=None, prefetch=False, stream=False, model=False, **kwargs):
+        """ iterate over the cases of suite_id, following the pagination
+
+        Takes the same parameters, filters and model as get_cases. See _paginate
+        for prefetch and stream.
+
+        Yields
+        ------
+        dict
+            one case at a time
+        """
+        return self._records(self._paginate(self._cases_uri(suite_id, section_id, kwargs), "cases", prefetch, stream), model, Case)
+
+    def get_cases_many(self, suite_ids, max_workers=8, model=False, **kwargs):
+        """ cases of several suites, fetched concurrently
+
+        See _fetch_many for suite_ids, max_workers and the report, get_cases
+        for the filters and model.
+        """
+        return self._fetch_many(suite_ids, lambda suite_id: self.iter_cases(suite_id, model=model, **kwargs), max_workers)
+
+    def _cases_uri(self, suite_id, section_id, filters):
+        """ uri of the get_cases method """
         method = "get_cases"
         uri = "{0}/{1}&suite_id={2}".format(method, self.project_id, suite_id)
         if section_id:
             uri += "&section_id={0}".format(section_id)
-
-        return self.send_get(uri)
+        return uri + self._filters(filters)
 
     def add_case(self, section_id, title, **kwargs):
         """ add_case API method
@@ -800,10 +1413,7 @@ class Client:
             assert isinstance(kwargs["keywords"], list), "keywords must be a list of strings"
 
         for key in kwargs:
-            if isinstance(kwargs[key], list):
-                kwargs[key] = ", ".join(kwargs[key])
-            else:
-                data[key] = kwargs[key]
+            data[key] = case_field_value(kwargs[key])
         return self.send_post(uri, data)
 
     def update_case(self, case_id, **kwargs):
@@ -836,10 +1446,7 @@ class Client:
         data = {}
 
         for key in kwargs:
-            if isinstance(kwargs[key], list):
-                kwargs[key] = ", ".join(kwargs[key])
-            else:
-                data[key] = kwargs[key]
+            data[key] = case_field_value(kwargs[key])
         return self.send_post(uri, data)
 
     def delete_case(self, case_id):
@@ -859,11 +1466,30 @@ class Client:
         """
         method = "delete_case"
         uri = "{0}/{1}".format(method, case_id)
-        return self.send_get(uri)
+        return self.send_post(uri, {})
+
+    def move_cases_to_section(self, section_id, suite_id, case_ids):
+        """ move_cases_to_section API method (TestRail 6.5.2 or later)
+
+        http://docs.gurock.com/testrail-api2/reference-cases#move_cases_to_section
+
+        Parameters
+        ----------
+        section_id : int
+            id of the section the cases are moved to
+        suite_id : int
+            id of the suite of the section
+        case_ids : list of ints
+            ids of the cases to move
+        """
+        method = "move_cases_to_section"
+        uri = "{0}/{1}".format(method, section_id)
+        return self.send_post(uri, {'suite_id': suite_id, 'case_ids': list(case_ids)})
 
     # results methods
-    def add_results_for_cases(self, run_id, results):
+    def add_results_for_cases(self, run_id, results, raise_errors=False):
         """ add_result_for_cases API method
+                raise_errors: bool, raise an HTTPError instead of returning None when the request fails (see send_post)
                 run_id: int, The ID of the run for which the test cases results should be added to
                 results: array of dict with case_id, status_id (comment, assignee, defect and other fields are optional)
                 	"results": [
@@ -902,7 +1528,135 @@ class Client:
             'results': results
         }
 
-        return self.send_post(uri, data)
+        return self.send_post(uri, data, raise_errors)
+
+    def bulk_add_results_for_cases(self, run_id, results, chunk_size=250, chunk_bytes=2**20, max_workers=4, retries=2):
+        """ add_results_for_cases in chunks uploaded in parallel
+
+        results are split in chunks of at most chunk_size results and
+        chunk_bytes bytes of json, which are posted with add_results_for_cases
+        by max_workers threads. A chunk which failed for a reason the
+        retry_policy retries (429, connection refused...) is retried on its
+        own, with an exponential backoff, without affecting the other chunks.
+        The other failures are not retried: a chunk rejected by TestRail
+        (400) would be rejected again, and a chunk whose answer was lost may
+        have been added.
+
+        Parameters
+        ----------
+        run_id : int
+            The ID of the run for which the test cases results should be added to
+        results : list of dicts
+            see add_results_for_cases
+        chunk_size : int
+            maximum number of results per request
+        chunk_bytes : int
+            maximum size of the serialized results per request
+        max_workers : int
+            maximum number of chunks uploaded at the same time
+        retries : int
+            number of retries of a failed chunk (retryable failures only)
+
+        Returns
+        -------
+        dict
+            report of the upload:
+                total, uploaded, failed : number of results
+                chunks : one dict per chunk (index, count, bytes, tries, ok, error, response)
+                failed_results : results of the failed chunks, which can be
+                                 given back to bulk_add_results_for_cases to resume
+        """
+        from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+        chunks = chunk_results(results, chunk_size, chunk_bytes)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(self._upload_results_chunk, run_id, chunk, retries) for chunk in chunks]
+            reports = [future.result() for future in futures]
+        return bulk_report(chunks, reports)
+
+    def _upload_results_chunk(self, run_id, chunk, retries):
+        """ add_results_for_cases for one chunk, returns its report """
+        report = {'tries': 0, 'ok': False, 'error': None, 'response': None}
+        uri = "add_results_for_cases/{0}".format(run_id)
+        while True:
+            report['tries'] += 1
+            try:
+                response = self.add_results_for_cases(run_id, chunk['results'], raise_errors=True)
+                report.update(ok=True, error=None, response=response)
+                return report
+            except NETWORK_ERRORS + (APIError,) as exception:
+                report['error'] = str(exception) or repr(exception)
+                if report['tries'] > retries or not self._chunk_retryable(uri, exception):
+                    logger.error("[api.Client.bulk_add_results_for_cases] chunk %s of run %s failed after %s tries: %s", chunk['index'], run_id, report['tries'], exception)
+                    return report
+                time.sleep(self.chunk_retry_delay * 2 ** (report['tries'] - 1))
+
+    def _chunk_retryable(self, uri, exception):
+        """ True when the retry_policy retries the error of an upload: never a rejected (400) or a maybe processed chunk """
+        if isinstance(exception, HTTPError):
+            return self.retry_policy.is_retryable('POST', uri, status=exception.status)
+        if isinstance(exception, APIError):
+            return False
+        return self.retry_policy.is_retryable('POST', uri, error=exception)
+
+    def _fetch_many(self, ids, fetch, max_workers):
+        """ fetch(id) for each of ids, by max_workers threads
+
+        Every page of each id is read. A failing id is reported in the errors
+        without stopping the others.
+
+        Parameters
+        ----------
+        ids : iterable of ints
+            ids to fetch, the duplicates are fetched once
+        fetch : callable
+            returns an iterator over the items of an id (an iter_* method)
+        max_workers : int
+            maximum number of ids fetched at the same time
+
+        Returns
+        -------
+        dict
+            items : {id: list of items}, in the order of ids
+            errors : {id: error message}, in the order of ids
+        """
+        from concurrent.futures import ThreadPoolExecutor # pylint: disable=import-outside-toplevel
+        ids = list(dict.fromkeys(ids))
+
+        def collect(item_id):
+            try:
+                return list(fetch(item_id)), None
+            except NETWORK_ERRORS + (APIError,) as exception:
+                logger.error("[api.Client._fetch_many] %s failed: %s", item_id, exception)
+                return None, str(exception) or repr(exception)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ids)))) as pool:
+            outcomes = list(pool.map(collect, ids))
+        return many_report(ids, outcomes)
+
+    def add_results_for_plan(self, plan_id, results, max_workers=8, chunk_size=250, chunk_bytes=2**20, retries=2):
+        """ add results keyed by case and configuration to the runs of plan_id
+
+        The runs and tests of the plan are resolved once, then the results are
+        routed to their runs and uploaded in parallel. See
+        api_ingest.PlanIngester (reuse one to ingest several times into a plan).
+
+        Parameters
+        ----------
+        plan_id : int
+            id of the plan
+        results : iterable of dicts
+            case_id, config (None, configuration names or ids) and the fields
+            of add_results_for_cases
+        max_workers, chunk_size, chunk_bytes, retries :
+            see bulk_add_results_for_cases
+
+        Returns
+        -------
+        dict
+            report of api_ingest.PlanIngester.ingest
+        """
+        from api_ingest import PlanIngester # pylint: disable=import-outside-toplevel
+        return PlanIngester(self, plan_id, max_workers, chunk_size, chunk_bytes, retries).ingest(results)
 
     # Misc methods
     def get_statuses(self):
@@ -913,19 +1667,195 @@ class Client:
         uri = "{0}".format(method)
         return self.send_get(uri)
 
+    def get_priorities(self):
+        """ get_priorities method: get the case priorities
+            http://docs.gurock.com/testrail-api2/reference-priorities
+        """
+        return self.send_get("get_priorities")
+
+    def get_case_types(self):
+        """ get_case_types method: get the case types
+            http://docs.gurock.com/testrail-api2/reference-cases-types
+        """
+        return self.send_get("get_case_types")
+
+    def get_case_fields(self):
+        """ get_case_fields method: get the case fields (custom fields included)
+            http://docs.gurock.com/testrail-api2/reference-cases-fields
+        """
+        return self.send_get("get_case_fields")
+
+    def get_result_fields(self):
+        """ get_result_fields method: get the custom result fields
+            http://docs.gurock.com/testrail-api2/reference-results-fields
+        """
+        return self.send_get("get_result_fields")
+
+    # users methods
+    def get_user(self, user_id):
+        """ get_user method: get user user_id
+                user_id: int
+            http://docs.gurock.com/testrail-api2/reference-users#get_user
+        """
+        method = "get_user"
+        uri = "{0}/{1}".format(method, user_id)
+        return self.send_get(uri)
+
+    def get_users(self, project_id=None):
+        """ get_users method: get the users
+
+        http://docs.gurock.com/testrail-api2/reference-users#get_users
+        Parameters
+        ----------
+        project_id : int (optional)
+            only the users with access to the project (required for
+            non-administrators since TestRail 6.6)
+        """
+        method = "get_users"
+        uri = method
+        if project_id:
+            uri = "{0}/{1}".format(method, project_id)
+        return self.send_get(uri)
+
     def status_id_to_str(self, status_id):
         """ Returns a string description from status_id (int)"""
-        for status in self.statuses:
-            if int(status['id']) == int(status_id):
-                return status['label'] # or name?
-        raise APIError("The given status code is not defined")
+        try:
+            return self.registries['statuses'].label(status_id)
+        except (KeyError, ValueError):
+            raise APIError("The given status code is not defined")
+
+    def status_ids_to_str(self, status_ids):
+        """ Returns the string descriptions of a list of status ids (None for the unknown ones) """
+        return self.registries['statuses'].labels(status_ids)
+
+    def status_str_to_id(self, status):
+        """ Returns the id of a status label or name (case insensitive) """
+        try:
+            return self.registries['statuses'].id_of(status)
+        except KeyError:
+            raise APIError("The given status is not defined: %s" % status)
 
 class APIError(Exception):
     """ Basic API Exception """
     pass
 
+class HTTPError(APIError):
+    """ request answered with an HTTP error status (raise_errors=True, see Client.send_post)
+
+    status is the HTTP status; 400 means that TestRail rejected the content of
+    the request, retrying it would fail again.
+    """
+    def __init__(self, status, error=None):
+        super().__init__("TestRail API returned HTTP %s: %s" % (status, error))
+        self.status = status
+        self.error = error
+
+def error_message(body):
+    """ the error message of a TestRail error answer (its "error" member), or its beginning """
+    try:
+        return json.loads(body.decode())['error']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return (body or b'')[:200].decode('utf-8', 'replace')
+
+def case_field_value(value):
+    """ value of a case field as sent by add_case / update_case: lists of strings (refs, keywords) are comma-separated """
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return ", ".join(value)
+    return value
+
+def chunk_results(results, chunk_size=250, chunk_bytes=2**20):
+    """ split results in chunks of at most chunk_size results and chunk_bytes bytes of json
+
+    A single result bigger than chunk_bytes gets a chunk of its own.
+
+    Returns
+    -------
+    list of dicts
+        chunks: index, results, bytes (size of the serialized results)
+    """
+    assert chunk_size > 0, "chunk_size must be a positive int"
+    chunks = []
+    current = []
+    size = 0
+    for result in results:
+        # +2 for the ", " separator between the results of the json list
+        result_size = len(json.dumps(result).encode('utf-8')) + 2
+        if current and (len(current) >= chunk_size or size + result_size > chunk_bytes):
+            chunks.append({'index': len(chunks), 'results': current, 'bytes': size})
+            current = []
+            size = 0
+        current.append(result)
+        size += result_size
+    if current:
+        chunks.append({'index': len(chunks), 'results': current, 'bytes': size})
+    return chunks
+
+def post_bisecting(post, items):
+    """ post(items), splitting the parts rejected with an HTTP 400 in halves
+
+    TestRail rejects a whole add_results_for_cases request when one of its
+    results is invalid (e.g. a case which is not in the run): a rejected part
+    is split and posted again until the invalid results are isolated, so the
+    valid ones are still added. The other failures (server errors, throttling
+    beyond the retries, network errors) end the part at once: the client has
+    already retried them, splitting would only multiply the requests.
+
+    Parameters
+    ----------
+    post : callable
+        post(part) sends a list of items, raises HTTPError (see raise_errors of send_post)
+    items : list
+
+    Yields
+    ------
+    tuple
+        (part, response, exception) for each part posted for good, in the
+        order of items: the answer of post, or the exception it raised
+    """
+    pending = [list(items)]
+    while pending:
+        part = pending.pop()
+        try:
+            response = post(part)
+        except HTTPError as exception:
+            if exception.status == 400 and len(part) > 1:
+                pending.extend([part[len(part) // 2:], part[:len(part) // 2]])
+            else:
+                yield part, None, exception
+            continue
+        except NETWORK_ERRORS + (APIError,) as exception:
+            yield part, None, exception
+            continue
+        yield part, response, None
+
+def bulk_report(chunks, reports):
+    """ aggregate the reports of the chunks uploaded by bulk_add_results_for_cases """
+    report = {'total': 0, 'uploaded': 0, 'failed': 0, 'chunks': [], 'failed_results': []}
+    for chunk, chunk_report in zip(chunks, reports):
+        count = len(chunk['results'])
+        report['total'] += count
+        if chunk_report['ok']:
+            report['uploaded'] += count
+        else:
+            report['failed'] += count
+            report['failed_results'].extend(chunk['results'])
+        report['chunks'].append(dict(chunk_report, index=chunk['index'], count=count, bytes=chunk['bytes']))
+    return report
+
+def many_report(ids, outcomes):
+    """ report of _fetch_many from the (items, error) of each id """
+    report = {'items': {}, 'errors': {}}
+    for item_id, (items, error) in zip(ids, outcomes):
+        if error is None:
+            report['items'][item_id] = items
+        else:
+            report['errors'][item_id] = error
+    return report
+
 def main():
     """ Basic testing of the API (login + some info)"""
+    conf = load_config()
+    configure_logging(conf)
     URL = conf.get("testrail", "base_url")
 
     client = Client(URL, project_id=conf.get("testrail", "project_id"), user=conf.get("testrail", "user"), password=conf.get("testrail", "password"))
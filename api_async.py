@@ -0,0 +1,379 @@
+"""
+    asyncio testrail api client
+
+    AsyncClient exposes the same methods as api.Client, as coroutines:
+
+        async with AsyncClient(URL, project_id, user, password, max_concurrency=20) as client:
+            await client.load_statuses()
+            runs = await asyncio.gather(*[client.get_tests(run_id) for run_id in run_ids])
+
+    The request building of api.Client is reused as is: only the sending of the
+    requests is asynchronous. submit, map and batching are sync only (they
+    are api.Client helpers built on threads) and raise NotImplementedError:
+    gather the coroutines instead.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import asyncio
+import functools
+import itertools
+import time
+
+import api
+from api_ingest import PlanIngester
+from api_transport import Response, default_async_transport, import_aiohttp
+
+aiohttp = import_aiohttp()
+# aiohttp wraps the network errors in its own exceptions
+ASYNC_NETWORK_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError) if aiohttp is not None else (asyncio.TimeoutError,)
+
+class AsyncClient(api.Client):
+    """ asyncio testrail API client
+
+    Parameters
+    ----------
+    base_url, project_id, user, password :
+        see api.Client
+    transport : api_transport.AsyncTransport (optional)
+        defaults to an AiohttpTransport when aiohttp is installed, to a
+        PooledTransport run in threads otherwise
+    rate_limiter, retry_policy, cache, metrics, single_flight :
+        see api.Client; waiting for the limiter does not block the event loop
+    max_concurrency : int
+        maximum number of requests in flight at the same time
+    """
+    # number of items decoded by each executor call of stream_get
+    stream_batch_size = 100
+
+    def __init__(self, base_url, project_id, user=None, password=None, transport=None, rate_limiter=None, retry_policy=None, cache=None, metrics=None, single_flight=None, max_concurrency=10):
+        assert max_concurrency > 0, "max_concurrency must be a positive int"
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        if transport is None:
+            transport = default_async_transport(maxsize=max_concurrency)
+        super().__init__(base_url, project_id, user=user, password=password, transport=transport, rate_limiter=rate_limiter, retry_policy=retry_policy, cache=cache, metrics=metrics, single_flight=single_flight)
+
+    def _registries(self):
+        # the registries can't load themselves without blocking: see load_registries
+        registries = super()._registries()
+        for name, registry in registries.items():
+            registry.loader = functools.partial(self._not_loaded, name)
+            registry.ttl = None
+        return registries
+
+    @staticmethod
+    def _not_loaded(name):
+        raise api.APIError("the %s registry is not loaded: await client.load_registries(%r)" % (name, name))
+
+    async def load_registries(self, *names):
+        """ load (or reload) the registries (all of them by default), see api.Client.registries """
+        names = names or tuple(self.registries)
+        loaders = {
+            'statuses': self.get_statuses,
+            'users': functools.partial(self.get_users, self.project_id),
+            'priorities': self.get_priorities,
+            'case_types': self.get_case_types,
+            'case_fields': self.get_case_fields,
+            'result_fields': self.get_result_fields,
+        }
+        definitions = await asyncio.gather(*[loaders[name]() for name in names])
+        for name, items in zip(names, definitions):
+            self.registries[name].set(items)
+
+    @property
+    def statuses(self):
+        """ test status definitions, empty until load_statuses is awaited """
+        registry = self.registries['statuses']
+        return registry.items if registry.loaded else ()
+
+    @statuses.setter
+    def statuses(self, statuses):
+        self.registries['statuses'].set(statuses)
+
+    async def load_statuses(self):
+        """ retrieve the status codes into self.statuses """
+        await self.load_registries('statuses')
+        return self.statuses
+
+    async def close(self):
+        """ close the connections held by the transport """
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def semaphore(self):
+        """ semaphore limiting the number of requests in flight """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _send_request(self, http_method, uri, data, raise_errors=False):
+        """ Send a request to URI with the given http method and data
+        """
+        url, body, headers = self._prepare_request(http_method, uri, data)
+
+        retry = self.retry_policy.start(http_method, uri)
+        started = time.perf_counter()
+        throttled = 0
+        slept = waited = 0.0
+        while True:
+            if self.rate_limiter is not None:
+                waited += await self.rate_limiter.acquire_async()
+            try:
+                async with self.semaphore:
+                    answer = await self.transport.request(http_method, url, body, headers)
+            except api.NETWORK_ERRORS + ASYNC_NETWORK_ERRORS as exception:
+                sleep_time = retry.next_delay(error=exception)
+                if sleep_time is None:
+                    api.logger.error("[api_async._send_request] %s %s failed after %s tr%s: %r", http_method, url, retry.tries, "ies" if retry.tries > 1 else "y", exception)
+                    if self.metrics is not None:
+                        self._record_request(http_method, uri, started, None, body, retry.tries, throttled, slept, waited, exception)
+                    raise
+                api.logger.debug("[api_async._send_request] %r, retrying in %.1f seconds", exception, sleep_time)
+                await asyncio.sleep(sleep_time)
+                slept += sleep_time
+                continue
+            self._rate_feedback(answer)
+            throttled += answer.status == 429
+            sleep_time = retry.next_delay(answer=answer)
+            if sleep_time is None:
+                break
+            api.logger.debug("[api_async._send_request] got a %s error, retrying in %.1f seconds", answer.status, sleep_time)
+            await asyncio.sleep(sleep_time)
+            slept += sleep_time
+
+        if self.metrics is not None:
+            self._record_request(http_method, uri, started, answer, body, retry.tries, throttled, slept, waited)
+
+        return self._decode_answer(http_method, url, answer, raise_errors)
+
+    def _open(self, url, headers):
+        """ blocking GET with the body of the answer left unread, with the blocking transport of a ThreadedTransport """
+        transport = getattr(self.transport, 'transport', None)
+        if transport is None:
+            raise NotImplementedError("streaming needs an api_transport.ThreadedTransport: %s reads whole answers" % type(self.transport).__name__)
+        response = transport.open('GET', url, None, headers)
+        if response.status < 400:
+            return response
+        with response:
+            return Response(response.status, response.headers, response.read())
+
+    async def stream_get(self, uri, key=None, meta=None):
+        """ async generator over the items of the json array of the answer, see api.Client.stream_get
+
+        The answer is read and decoded stream_batch_size items at a time in
+        the default executor of the event loop, with the blocking transport of
+        an api_transport.ThreadedTransport: with another transport (aiohttp),
+        NotImplementedError is raised.
+        """
+        if getattr(self.transport, 'transport', None) is None:
+            raise NotImplementedError("stream_get needs an api_transport.ThreadedTransport: %s reads whole answers" % type(self.transport).__name__)
+        loop = asyncio.get_running_loop()
+        items = api.Client.stream_get(self, uri, key, meta)
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, list, itertools.islice(items, self.stream_batch_size))
+                if not batch:
+                    return
+                for item in batch:
+                    yield item
+        finally:
+            try:
+                items.close()
+            except ValueError:
+                # cancelled while a batch is read in the executor: the answer is released when the generator is collected
+                pass
+
+    async def send_get(self, uri):
+        """ send a GET request and returns the json as a python dict, see api.Client.send_get """
+        if self.cache is not None:
+            result = self.cache.get(uri)
+            if result is not None:
+                return result
+        if self.single_flight is not None:
+            result = await self.single_flight.do_async(uri, lambda: self._send_request('GET', uri, None))
+        else:
+            result = await self._send_request('GET', uri, None)
+        if self.cache is not None and result is not None:
+            self.cache.put(uri, result)
+        return result
+
+    async def send_post(self, uri, data, raise_errors=False):
+        """ send a POST request and returns the json as a python dict, see api.Client.send_post """
+        try:
+            return await self._send_request('POST', uri, data, raise_errors)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_write(uri)
+            if self.single_flight is not None:
+                self.single_flight.forget()
+
+    def _model(self, result, model, default, key=None):
+        """ convert the awaited answer of a get_* method into records, see api.Client._model """
+        model = self._model_class(model, default)
+        if model is None:
+            return result
+
+        async def convert():
+            return api.to_model(await result, model, key)
+        return convert()
+
+    def _records(self, items, model, default):
+        """ convert the items of _paginate into records, see api.Client._records """
+        model = self._model_class(model, default)
+        if model is None:
+            return items
+
+        async def convert():
+            async for item in items:
+                yield model.from_dict(item)
+        return convert()
+
+    async def _paginate(self, uri, key, prefetch=False, stream=False):
+        """ async generator over the items of a paginated get_* method, see api.Client._paginate
+
+        stream decodes the pages with stream_get (ThreadedTransport only).
+        """
+        if stream:
+            while uri:
+                meta = {}
+                async for item in self.stream_get(uri, key, meta):
+                    yield item
+                uri = self._next_page(meta)
+            return
+        page = await self.send_get(uri)
+        pending = None
+        try:
+            while True:
+                if page is None:
+                    raise api.APIError("[api_async.AsyncClient._paginate] failed to get %s" % uri)
+                if isinstance(page, list):
+                    for item in page:
+                        yield item
+                    return
+                next_uri = self._next_page(page)
+                pending = asyncio.ensure_future(self.send_get(next_uri)) if prefetch and next_uri else None
+                for item in page.get(key, []):
+                    yield item
+                if not next_uri:
+                    return
+                uri = next_uri
+                page = await pending if pending else await self.send_get(uri)
+                pending = None
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _fetch_many(self, ids, fetch, max_workers):
+        """ fetch(id) for each of ids, max_workers at a time, see api.Client._fetch_many """
+        ids = list(dict.fromkeys(ids))
+        workers = asyncio.Semaphore(max_workers)
+
+        async def collect(item_id):
+            async with workers:
+                try:
+                    return [item async for item in fetch(item_id)], None
+                except api.NETWORK_ERRORS + ASYNC_NETWORK_ERRORS + (api.APIError,) as exception:
+                    api.logger.error("[api_async.AsyncClient._fetch_many] %s failed: %s", item_id, exception)
+                    return None, str(exception) or repr(exception)
+
+        outcomes = await asyncio.gather(*[collect(item_id) for item_id in ids])
+        return api.many_report(ids, outcomes)
+
+    def submit(self, method, *args, **kwargs):
+        """ not available asynchronously: the methods are coroutines, gather them """
+        raise NotImplementedError("submit() is only available with api.Client: gather the coroutines instead")
+
+    def map(self, method, *iterables, timeout=None):
+        """ not available asynchronously: the methods are coroutines, gather them """
+        raise NotImplementedError("map() is only available with api.Client: gather the coroutines instead")
+
+    def batching(self, max_size=250, max_delay=2.0):
+        """ not available asynchronously: gather add_result_for_case, or use bulk_add_results_for_cases """
+        raise NotImplementedError("batching() is only available with api.Client: gather add_result_for_case or use bulk_add_results_for_cases")
+
+    def _sections_changed(self, result, update):
+        """ update the cached section trees with the awaited answer, see api.Client._sections_changed """
+        async def apply():
+            return api.Client._sections_changed(self, await result, update)
+        return apply()
+
+    async def section_tree(self, suite_id, refresh=False):
+        """ api_sections.SectionTree of the sections of suite_id, see api.Client.section_tree """
+        tree = self._section_trees.get(suite_id)
+        if tree is None or refresh:
+            if refresh and self.cache is not None:
+                self.cache.invalidate(uri=self._sections_uri(suite_id), pages=True)
+            tree = api.SectionTree([section async for section in self.iter_sections(suite_id)], suite_id)
+            with self._section_trees_lock:
+                if refresh or suite_id not in self._section_trees:
+                    self._section_trees[suite_id] = tree
+                tree = self._section_trees[suite_id]
+        return tree
+
+    async def ensure_section(self, suite_id, path, description=None):
+        """ id of the section at path in suite_id, adding the missing sections, see api.Client.ensure_section """
+        tree = await self.section_tree(suite_id)
+        names = tree.split_path(path)
+        parent_id = None
+        for depth in range(1, len(names) + 1):
+            section_id = tree.id_of(names[:depth])
+            if section_id is None:
+                section = await self.add_section(suite_id, names[depth - 1], description, parent_id)
+                if section is None:
+                    raise api.APIError("[api_async.AsyncClient.ensure_section] failed to add section %r" % (names[:depth],))
+                section_id = section['id']
+            parent_id = section_id
+        return parent_id
+
+    async def add_results_for_plan(self, plan_id, results, max_workers=8, chunk_size=250, chunk_bytes=2**20, retries=2):
+        """ add results keyed by case and configuration to the runs of plan_id, see api.Client.add_results_for_plan
+
+        The runs are uploaded concurrently, each with bulk_add_results_for_cases.
+        """
+        ingester = PlanIngester(self, plan_id, max_workers, chunk_size, chunk_bytes, retries)
+        runs = ingester.plan_runs(await self.get_plan(plan_id))
+        ingester.index(runs, await self.get_tests_many(runs, max_workers=max_workers))
+        routed, unmatched = ingester.route(results)
+        bulks = await asyncio.gather(*[self.bulk_add_results_for_cases(run_id, run_results, chunk_size, chunk_bytes, max_workers, retries)
+                                       for run_id, run_results in routed.items()])
+        report = ingester.empty_report()
+        report['unmatched'] = unmatched
+        for run_id, bulk in zip(routed, bulks):
+            ingester.add_bulk_report(report, run_id, bulk)
+        if unmatched:
+            api.logger.warning("[api_async.AsyncClient.add_results_for_plan] %s result(s) are not in plan %s", len(unmatched), plan_id)
+        return report
+
+    async def bulk_add_results_for_cases(self, run_id, results, chunk_size=250, chunk_bytes=2**20, max_workers=4, retries=2):
+        """ add_results_for_cases in chunks uploaded concurrently, see api.Client.bulk_add_results_for_cases """
+        chunks = api.chunk_results(results, chunk_size, chunk_bytes)
+        workers = asyncio.Semaphore(max_workers)
+
+        async def upload(chunk):
+            async with workers:
+                return await self._upload_results_chunk(run_id, chunk, retries)
+
+        reports = await asyncio.gather(*[upload(chunk) for chunk in chunks])
+        return api.bulk_report(chunks, reports)
+
+    async def _upload_results_chunk(self, run_id, chunk, retries):
+        """ add_results_for_cases for one chunk, returns its report """
+        report = {'tries': 0, 'ok': False, 'error': None, 'response': None}
+        uri = "add_results_for_cases/{0}".format(run_id)
+        while True:
+            report['tries'] += 1
+            try:
+                response = await self.add_results_for_cases(run_id, chunk['results'], raise_errors=True)
+                report.update(ok=True, error=None, response=response)
+                return report
+            except api.NETWORK_ERRORS + ASYNC_NETWORK_ERRORS + (api.APIError,) as exception:
+                report['error'] = str(exception) or repr(exception)
+                if report['tries'] > retries or not self._chunk_retryable(uri, exception):
+                    api.logger.error("[api_async.AsyncClient.bulk_add_results_for_cases] chunk %s of run %s failed after %s tries: %s", chunk['index'], run_id, report['tries'], exception)
+                    return report
+                await asyncio.sleep(self.chunk_retry_delay * 2 ** (report['tries'] - 1))
@@ -0,0 +1,138 @@
+"""
+    write-behind batching of add_result_for_case
+
+    Inside client.batching(), add_result_for_case does not post anything: the
+    results are buffered per run and posted by a background thread with one
+    add_results_for_cases call per run when max_size results are buffered,
+    when the oldest one has waited max_delay seconds, and when the block exits:
+
+        with client.batching(max_size=250, max_delay=2.0) as batch:
+            for case_id, status_id in outcomes:
+                client.add_result_for_case(case_id, run_id, status_id)  # returns a Future
+        batch.errors      # [{'run_id': 3, 'case_id': 12, 'error': '...'}]
+
+    Each call returns a concurrent.futures.Future, resolved with the result
+    created for the case or with the error of the case. Only the calls of the
+    thread which opened the block are batched: the other threads sharing the
+    client keep posting their results directly.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import threading
+import time
+from concurrent.futures import Future
+
+import api
+
+class ResultBatcher:
+    """ buffers results per run and posts them with add_results_for_cases
+
+    The batches rejected for invalid results are split to add the valid ones
+    (see api.post_bisecting): the errors are reported per case.
+
+    Parameters
+    ----------
+    client : api.Client
+        client whose add_result_for_case calls are batched
+    max_size : int
+        number of buffered results of a run which triggers a post
+    max_delay : float
+        maximum time (seconds) a result waits in the buffer
+    """
+    def __init__(self, client, max_size=250, max_delay=2.0):
+        self.client = client
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.errors = []
+        self.stats = {'results': 0, 'requests': 0, 'failed': 0}
+        self._buffers = {}
+        self._condition = threading.Condition()
+        self._closing = False
+        self._thread = None
+        # batcher of the enclosing batching() block of the thread, restored on exit
+        self._outer = None
+
+    def add(self, run_id, result):
+        """ buffer a result (dict with case_id, status_id...) of run_id, returns its Future """
+        future = Future()
+        with self._condition:
+            buffer = self._buffers.setdefault(run_id, {'since': time.monotonic(), 'items': []})
+            buffer['items'].append((result, future))
+            self.stats['results'] += 1
+            if len(buffer['items']) >= self.max_size:
+                self._condition.notify()
+        return future
+
+    def _take(self, force=False):
+        """ remove and return the buffers due for posting: {run_id: [(result, future)...]} """
+        now = time.monotonic()
+        due = {run_id: buffer for run_id, buffer in self._buffers.items()
+               if force or len(buffer['items']) >= self.max_size or now - buffer['since'] >= self.max_delay}
+        for run_id in due:
+            del self._buffers[run_id]
+        return {run_id: buffer['items'] for run_id, buffer in due.items()}
+
+    def _post(self, run_id, items):
+        """ post items with add_results_for_cases, see api.post_bisecting """
+        def post(batch):
+            # the flusher thread and flush() post concurrently
+            with self._condition:
+                self.stats['requests'] += 1
+            return self.client.add_results_for_cases(run_id, [result for result, _ in batch], raise_errors=True)
+        for start in range(0, len(items), self.max_size):
+            for batch, response, exception in api.post_bisecting(post, items[start:start + self.max_size]):
+                if exception is not None:
+                    self._fail(run_id, batch, exception)
+                    continue
+                created = response if isinstance(response, list) else []
+                for index, (_, future) in enumerate(batch):
+                    future.set_result(created[index] if index < len(created) else None)
+
+    def _fail(self, run_id, batch, exception):
+        with self._condition:
+            self.errors.extend({'run_id': run_id, 'case_id': result.get('case_id'), 'error': str(exception) or repr(exception)} for result, _ in batch)
+            self.stats['failed'] += len(batch)
+        for _, future in batch:
+            future.set_exception(exception)
+        api.logger.error("[api_batch.ResultBatcher] %s result(s) of run %s not added: %s", len(batch), run_id, exception)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._take(force=self._closing)
+                while not due and not self._closing:
+                    oldest = min((buffer['since'] for buffer in self._buffers.values()), default=None)
+                    timeout = None if oldest is None else max(0.0, oldest + self.max_delay - time.monotonic())
+                    self._condition.wait(timeout)
+                    due = self._take(force=self._closing)
+                closing = self._closing and not self._buffers
+            for run_id, items in due.items():
+                self._post(run_id, items)
+            if closing:
+                return
+
+    def flush(self):
+        """ post everything buffered now, from the calling thread """
+        with self._condition:
+            due = self._take(force=True)
+        for run_id, items in due.items():
+            self._post(run_id, items)
+
+    def __enter__(self):
+        self._closing = False
+        batching = self.client._batching # pylint: disable=protected-access
+        self._outer = getattr(batching, 'batcher', None)
+        batching.batcher = self
+        self._thread = threading.Thread(target=self._run, name="ResultBatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.client._batching.batcher = self._outer # pylint: disable=protected-access
+        self._outer = None
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        # the flusher stops once the buffers are empty: post what add() buffered since
+        self.flush()
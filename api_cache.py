@@ -0,0 +1,168 @@
+"""
+    in-memory cache of the read-only TestRail API answers
+
+        cache = ResponseCache(max_entries=4096)
+        client = api.Client(URL, project_id, user, password, cache=cache)
+        client.get_suites()   # HTTP request
+        client.get_suites()   # cache hit
+        cache.stats           # {'hits': 1, 'misses': 1, ...}
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import collections
+import json
+import threading
+import time
+
+from api_retry import api_method
+
+# time to live (seconds) of the cached answers, per API method. Other methods are not cached.
+DEFAULT_TTLS = {
+    'get_statuses': 3600,
+    'get_priorities': 3600,
+    'get_case_types': 3600,
+    'get_case_fields': 3600,
+    'get_result_fields': 3600,
+    'get_templates': 3600,
+    'get_users': 600,
+    'get_user': 600,
+    'get_project': 300,
+    'get_projects': 300,
+    'get_suites': 300,
+    'get_suite': 300,
+    'get_sections': 120,
+    'get_section': 120,
+    'get_case': 60,
+}
+
+# writing to an entity also invalidates the cached entities it contains
+CONTAINED = {
+    'project': ('suite', 'section', 'case'),
+    'suite': ('section', 'case'),
+    'section': ('case',),
+}
+
+class ResponseCache:
+    """ TTL + LRU cache of the GET answers, keyed by uri
+
+    Answers are kept serialized: every hit returns a new object (callers can
+    modify it) and the size of the cache is known exactly.
+
+    Parameters
+    ----------
+    ttls : dict (optional)
+        time to live (seconds) per API method, only these methods are cached.
+        Defaults to DEFAULT_TTLS.
+    max_entries : int
+        maximum number of cached answers
+    max_bytes : int
+        maximum total size of the cached answers (json)
+    """
+    def __init__(self, ttls=None, max_entries=1024, max_bytes=64 * 2**20):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self):
+        """ hits / (hits + misses) """
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def cacheable(self, uri):
+        """ True if the answers to uri are cached """
+        return api_method(uri) in self.ttls
+
+    def get(self, uri):
+        """ returns the cached answer to uri, None if it is not cached or expired """
+        if not self.cacheable(uri):
+            return None
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            data, expires = entry
+            if expires < time.monotonic():
+                self._remove(uri)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(uri)
+            self.stats['hits'] += 1
+        return json.loads(data)
+
+    def put(self, uri, result):
+        """ cache the answer to uri """
+        if not self.cacheable(uri):
+            return
+        data = json.dumps(result)
+        if len(data) > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttls[api_method(uri)]
+        with self._lock:
+            if uri in self._entries:
+                self._remove(uri)
+            self._entries[uri] = (data, expires)
+            self.size += len(data)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def _remove(self, uri):
+        data, _ = self._entries.pop(uri)
+        self.size -= len(data)
+
+    def invalidate(self, uri=None, method=None, pages=False):
+        """ drop the answer to uri, all the answers of an API method, or everything
+
+        Parameters
+        ----------
+        uri : str (optional)
+            exact uri to drop ('get_case/12')
+        method : str (optional)
+            API method whose answers are all dropped ('get_cases')
+        pages : bool
+            also drop the next pages of uri (uri&offset=...)
+        """
+        with self._lock:
+            if uri is None and method is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries
+                        if key == uri or (pages and uri and key.startswith(uri + '&')) or (method and api_method(key) == method)]
+            for key in keys:
+                self._remove(key)
+            self.stats['invalidations'] += len(keys)
+
+    def invalidate_write(self, uri):
+        """ drop the answers made stale by the POST request to uri
+
+        add_<entity>/<parent_id> makes the lists of <entity> stale,
+        update_<entity>/<id> and delete_<entity>/<id> also make get_<entity>/<id>
+        stale, along with the entities contained in it (see CONTAINED).
+        """
+        verb, _, entity = api_method(uri).partition('_')
+        if verb == 'move':
+            # move_cases_to_section
+            self.invalidate(method="get_case")
+            self.invalidate(method="get_cases")
+            return
+        if not entity or verb not in ('add', 'update', 'delete', 'close'):
+            return
+        # update_plan_entry, add_results_for_cases...: the entity is the first word
+        entity = entity.split('_')[0]
+        self.invalidate(method="get_{0}s".format(entity))
+        if verb == 'add':
+            return
+        self.invalidate(uri="get_{0}/{1}".format(entity, uri.split('&', 1)[0].split('/')[-1]))
+        for contained in CONTAINED.get(entity, ()):
+            self.invalidate(method="get_{0}".format(contained))
+            self.invalidate(method="get_{0}s".format(contained))
@@ -0,0 +1,263 @@
+"""
+    parallel snapshot of a whole project, written as JSON Lines
+
+    The crawler follows the dependencies between the API methods:
+
+        suites -> sections, cases (per suite)
+        plans  -> plan (entries and their runs) -> tests, results (per run)
+        runs   -> tests, results (per run, runs outside of plans)
+
+    and runs the fetches on a bounded pool of threads, paced by the rate
+    limiter of the client. Each kind of entity goes to its own file of the
+    output directory (suites.jsonl, cases.jsonl, tests.jsonl...):
+
+        crawler = Crawler(client, "snapshot/", max_workers=8)
+        crawler.crawl()     # {'tasks': 1234, 'failed': [], 'items': {'cases': 300000, ...}, 'resumed': 0}
+
+    Each fetch writes its items to temporary files as the pages come, so that
+    memory does not grow with the size of the runs and suites; they are
+    appended to the output files when the fetch is finished. Every finished
+    fetch is then recorded in snapshot/checkpoint.jsonl with the size of the
+    output files: crawl() on the same directory resumes an interrupted
+    crawl, dropping what was written after the last checkpoint and skipping the
+    fetches already done.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import api
+from api_ratelimit import RateLimiter
+
+ENTITIES = ('suites', 'sections', 'cases', 'plans', 'runs', 'tests', 'results')
+CHECKPOINT = "checkpoint.jsonl"
+ROOTS = ('suites', 'plans', 'runs')
+
+class Crawler:
+    """ snapshot of the suites, sections, cases, plans, runs, tests and results of a project
+
+    Parameters
+    ----------
+    client : api.Client
+        client of the project
+    directory : str
+        output directory (created if needed)
+    max_workers : int
+        number of fetches running at the same time
+    rate_limiter : api_ratelimit.RateLimiter (optional)
+        used for the crawl when the client has no rate limiter (default
+        RateLimiter()): the whole pool shares it. The client itself is left
+        as it is: the crawl uses a copy of it with this limiter.
+    prefetch : bool
+        fetch the next page of a paginated method while the current one is read
+    """
+    def __init__(self, client, directory, max_workers=8, rate_limiter=None, prefetch=False):
+        self.client = client
+        self.directory = directory
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.prefetch = prefetch
+        self._files = {}
+        self._checkpoint = None
+        self._lock = threading.Lock()
+        # client of the fetches: client, or a copy of it with the rate limiter of the crawl
+        self._client = client
+
+    # fetches: each writes its items to out and returns its child tasks
+    def _suites(self, out):
+        suites = self._client.get_suites()
+        if suites is None:
+            raise api.APIError("[api_crawl.Crawler] failed to get the suites")
+        for suite in suites:
+            out.write('suites', suite)
+        return [task for suite in suites for task in (('sections', suite['id']), ('cases', suite['id']))]
+
+    def _sections(self, out, suite_id):
+        for section in self._client.iter_sections(suite_id, prefetch=self.prefetch):
+            out.write('sections', section)
+        return []
+
+    def _cases(self, out, suite_id):
+        for case in self._client.iter_cases(suite_id, prefetch=self.prefetch):
+            out.write('cases', case)
+        return []
+
+    def _plans(self, out): # pylint: disable=unused-argument
+        return [('plan', plan['id']) for plan in self._client.iter_plans(prefetch=self.prefetch)]
+
+    def _plan(self, out, plan_id):
+        plan = self._client.get_plan(plan_id)
+        if plan is None:
+            raise api.APIError("[api_crawl.Crawler] failed to get plan %s" % plan_id)
+        out.write('plans', plan)
+        children = []
+        for entry in plan.get('entries') or []:
+            for run in entry.get('runs') or []:
+                out.write('runs', run)
+                children.extend((('tests', run['id']), ('results', run['id'])))
+        return children
+
+    def _runs(self, out):
+        children = []
+        for run in self._client.iter_runs(prefetch=self.prefetch):
+            out.write('runs', run)
+            children.extend((('tests', run['id']), ('results', run['id'])))
+        return children
+
+    def _tests(self, out, run_id):
+        for test in self._client.iter_tests(run_id, prefetch=self.prefetch):
+            out.write('tests', test)
+        return []
+
+    def _results(self, out, run_id):
+        for result in self._client.iter_results_for_run(run_id, prefetch=self.prefetch):
+            out.write('results', result)
+        return []
+
+    def _run_task(self, task):
+        """ run a fetch, returns (its TaskOutput, its child tasks) """
+        out = TaskOutput(self.directory)
+        try:
+            return out, getattr(self, '_' + task[0])(out, *task[1:])
+        except BaseException:
+            out.close()
+            raise
+
+    @staticmethod
+    def _key(task):
+        return ":".join(str(part) for part in task)
+
+    def _resume(self):
+        """ read the checkpoint, truncate the output files to the last checkpoint
+
+        Returns
+        -------
+        tuple
+            (set of the keys of the done tasks, list of the tasks still to do)
+        """
+        path = os.path.join(self.directory, CHECKPOINT)
+        done, spawned, offsets = set(), [], {}
+        valid = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as checkpoint:
+                for line in checkpoint:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break # line cut by the interruption
+                    valid += len(line)
+                    done.add(entry['task'])
+                    spawned.extend(tuple(child) for child in entry['children'])
+                    offsets = entry['offsets']
+            with open(path, 'r+b') as checkpoint:
+                checkpoint.truncate(valid)
+        for entity in ENTITIES:
+            output = os.path.join(self.directory, entity + ".jsonl")
+            if os.path.exists(output):
+                with open(output, 'r+b') as handle:
+                    handle.truncate(offsets.get(entity, 0))
+        todo = [task for task in [(root,) for root in ROOTS] + spawned if self._key(task) not in done]
+        return done, list(dict.fromkeys(todo))
+
+    def _record(self, task, out, children):
+        """ append the items of a finished task to the output files, then write its checkpoint """
+        with self._lock:
+            out.append_to(self._files)
+            offsets = {}
+            for entity, output in self._files.items():
+                output.flush()
+                offsets[entity] = output.tell()
+            entry = {'task': self._key(task), 'children': [list(child) for child in children], 'offsets': offsets}
+            self._checkpoint.write(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b"\n")
+            self._checkpoint.flush()
+
+    def crawl(self):
+        """ crawl the project, resuming the previous crawl of the directory if any
+
+        A failed fetch is logged and skipped (its children are not crawled):
+        crawl() again to retry it.
+
+        Returns
+        -------
+        dict
+            tasks (number of fetches done), failed (keys of the failed
+            fetches), items (number of items written per entity), resumed
+            (number of fetches done by the previous crawls)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        done, todo = self._resume()
+        scheduled = done | {self._key(task) for task in todo}
+        report = {'tasks': 0, 'failed': [], 'items': dict.fromkeys(ENTITIES, 0), 'resumed': len(done)}
+        self._files = {entity: open(os.path.join(self.directory, entity + ".jsonl"), 'ab') for entity in ENTITIES} # pylint: disable=consider-using-with
+        self._checkpoint = open(os.path.join(self.directory, CHECKPOINT), 'ab') # pylint: disable=consider-using-with
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._client = self.client
+        if self.client.rate_limiter is None:
+            self._client = copy.copy(self.client)
+            self._client.rate_limiter = self.rate_limiter or RateLimiter()
+        pending = {}
+        try:
+            pending = {pool.submit(self._run_task, task): task for task in todo}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = pending.pop(future)
+                    try:
+                        out, children = future.result()
+                    except api.NETWORK_ERRORS + (api.APIError,) as exception:
+                        api.logger.error("[api_crawl.Crawler.crawl] %s failed: %s", self._key(task), exception)
+                        report['failed'].append(self._key(task))
+                        continue
+                    try:
+                        self._record(task, out, children)
+                    finally:
+                        out.close()
+                    report['tasks'] += 1
+                    for entity, count in out.counts.items():
+                        report['items'][entity] += count
+                    for child in children:
+                        if self._key(child) not in scheduled:
+                            scheduled.add(self._key(child))
+                            pending[pool.submit(self._run_task, child)] = child
+        finally:
+            # an interrupted crawl does not start the queued fetches
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    future.result()[0].close()
+            for output in list(self._files.values()) + [self._checkpoint]:
+                output.close()
+        api.logger.info("[api_crawl.Crawler.crawl] %s fetches, %s failed, %s resumed", report['tasks'], len(report['failed']), report['resumed'])
+        return report
+
+class TaskOutput:
+    """ items written by one fetch, in anonymous temporary files (one per entity) of the output directory """
+    def __init__(self, directory):
+        self.directory = directory
+        self.counts = {}
+        self._files = {}
+
+    def write(self, entity, item):
+        output = self._files.get(entity)
+        if output is None:
+            output = self._files[entity] = tempfile.TemporaryFile(dir=self.directory, prefix=".crawl-") # pylint: disable=consider-using-with
+            self.counts[entity] = 0
+        output.write(json.dumps(item, separators=(',', ':')).encode('utf-8') + b"\n")
+        self.counts[entity] += 1
+
+    def append_to(self, files):
+        """ copy the items to the output files ({entity: file}) """
+        for entity, output in self._files.items():
+            output.seek(0)
+            shutil.copyfileobj(output, files[entity])
+
+    def close(self):
+        """ delete the temporary files """
+        for output in self._files.values():
+            output.close()
+        self._files = {}
@@ -0,0 +1,383 @@
+"""
+    columnar export of runs, tests and results for analytics
+
+    The items are appended to typed column buffers (stdlib arrays) as they are
+    paginated, instead of being kept as dicts. The tables convert to Arrow,
+    pandas or NumPy when these are installed, and the aggregations are
+    vectorized with NumPy:
+
+        exporter = Exporter(client)
+        runs = exporter.runs(suite_id=3)
+        tests = exporter.tests(runs.column('id'))
+        results = exporter.results(runs.column('id'), tests=tests)
+        results.write_parquet("results.parquet")
+        pass_rate_per_run(tests)      # {'run_id': array, 'executed': array, 'passed': array, 'pass_rate': array}
+        flakiness_per_case(results)
+        elapsed_percentiles(results, by='case_id')
+
+    Status ids are dictionary encoded (with the status labels as dictionary in
+    Arrow / pandas), timestamps are typed (seconds), elapsed times are floats
+    (seconds, NaN when not set).
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import array
+import collections
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+
+# column kinds: int and timestamp are int64 with a validity mask, float is
+# float64 with NaN for the missing values, category is int32 codes into a
+# dictionary of the distinct values (-1 when missing), str is a list
+RUNS = (
+    ('id', 'int'), ('suite_id', 'int'), ('plan_id', 'int'), ('milestone_id', 'int'), ('name', 'str'), ('config', 'category'),
+    ('is_completed', 'int'), ('passed_count', 'int'), ('failed_count', 'int'), ('blocked_count', 'int'),
+    ('retest_count', 'int'), ('untested_count', 'int'), ('created_by', 'int'), ('created_on', 'timestamp'), ('completed_on', 'timestamp'),
+)
+TESTS = (
+    ('id', 'int'), ('run_id', 'int'), ('case_id', 'int'), ('status_id', 'category'), ('assignedto_id', 'int'),
+    ('priority_id', 'int'), ('type_id', 'int'), ('title', 'str'),
+)
+RESULTS = (
+    ('id', 'int'), ('run_id', 'int'), ('test_id', 'int'), ('case_id', 'int'), ('status_id', 'category'),
+    ('created_by', 'int'), ('created_on', 'timestamp'), ('elapsed', 'float'), ('version', 'category'), ('defects', 'str'),
+)
+
+TIMESPAN_UNITS = {'w': 7 * 86400, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+TIMESPAN = re.compile(r'(\d+(?:\.\d+)?)\s*([wdhms])')
+
+def parse_timespan(value):
+    """ seconds of a TestRail timespan ("1m 45s", "2h", "30"), NaN when not set """
+    if value is None or value == '':
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = TIMESPAN.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return math.nan
+    return float(sum(float(number) * TIMESPAN_UNITS[unit] for number, unit in parts))
+
+def _require(module, package=None):
+    """ import an optional dependency, with an explicit error when it is not installed """
+    try:
+        return __import__(module, fromlist=['_'])
+    except ImportError:
+        raise ImportError("%s requires %s (pip install %s)" % (__name__, module, package or module)) from None
+
+class Table:
+    """ typed column buffers of a list of items
+
+    Parameters
+    ----------
+    schema : tuple of (name, kind)
+        columns, see RUNS, TESTS and RESULTS
+    labels : dict (optional)
+        column name -> function translating the values of a category column
+        into their labels in to_arrow / to_pandas (e.g. status_id -> 'Passed')
+    """
+    def __init__(self, schema, labels=None):
+        self.schema = tuple(schema)
+        self.labels = labels or {}
+        self._length = 0
+        self._columns = {}
+        for name, kind in self.schema:
+            if kind in ('int', 'timestamp'):
+                self._columns[name] = (array.array('q'), array.array('B'))
+            elif kind == 'float':
+                self._columns[name] = (array.array('d'),)
+            elif kind == 'category':
+                self._columns[name] = (array.array('i'), [], {})
+            elif kind == 'str':
+                self._columns[name] = ([],)
+            else:
+                raise ValueError("unknown column kind %r" % kind)
+
+    def __len__(self):
+        return self._length
+
+    def append(self, item, **values):
+        """ append an item (dict or record); values override its fields """
+        for name, kind in self.schema:
+            value = values[name] if name in values else item.get(name)
+            column = self._columns[name]
+            if kind in ('int', 'timestamp'):
+                column[0].append(int(value) if value is not None else 0)
+                column[1].append(value is not None)
+            elif kind == 'float':
+                column[0].append(parse_timespan(value))
+            elif kind == 'category':
+                codes, dictionary, index = column
+                if value is None:
+                    codes.append(-1)
+                    continue
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(dictionary)
+                    dictionary.append(value)
+                codes.append(code)
+            else:
+                column[0].append(value)
+        self._length += 1
+
+    def extend(self, items, **values):
+        """ append the items of an iterable, see append """
+        for item in items:
+            self.append(item, **values)
+
+    def column(self, name):
+        """ values of a column as a list, None for the missing values """
+        kind = dict(self.schema)[name]
+        column = self._columns[name]
+        if kind in ('int', 'timestamp'):
+            return [value if valid else None for value, valid in zip(*column)]
+        if kind == 'float':
+            return [None if math.isnan(value) else value for value in column[0]]
+        if kind == 'category':
+            codes, dictionary = column[0], column[1]
+            return [dictionary[code] if code >= 0 else None for code in codes]
+        return list(column[0])
+
+    def _dictionary_labels(self, name):
+        dictionary = self._columns[name][1]
+        label = self.labels.get(name)
+        if label is None:
+            return list(dictionary)
+        return [label(value) for value in dictionary]
+
+    def to_numpy(self):
+        """ dict of NumPy arrays (masked arrays for the int and timestamp columns with missing values) """
+        np = _require('numpy')
+        arrays = {}
+        for name, kind in self.schema:
+            column = self._columns[name]
+            if kind in ('int', 'timestamp'):
+                values = np.frombuffer(column[0], dtype=np.int64)
+                if kind == 'timestamp':
+                    values = values.astype('datetime64[s]')
+                mask = np.frombuffer(column[1], dtype=np.uint8) == 0
+                arrays[name] = np.ma.masked_array(values, mask) if mask.any() else values
+            elif kind == 'float':
+                arrays[name] = np.frombuffer(column[0], dtype=np.float64)
+            elif kind == 'category':
+                codes = np.frombuffer(column[0], dtype=np.int32)
+                dictionary = np.array(column[1] + [None], dtype=object)
+                values = dictionary[codes]  # -1 picks the trailing None
+                if all(isinstance(value, int) for value in column[1]):
+                    mask = codes < 0
+                    values = np.where(mask, 0, values).astype(np.int64)
+                    values = np.ma.masked_array(values, mask) if mask.any() else values
+                arrays[name] = values
+            else:
+                arrays[name] = np.array(column[0], dtype=object)
+        return arrays
+
+    def to_arrow(self):
+        """ pyarrow Table, the category columns as dictionary arrays """
+        pa = _require('pyarrow')
+        np = _require('numpy')
+        arrays = []
+        for name, kind in self.schema:
+            column = self._columns[name]
+            if kind in ('int', 'timestamp'):
+                mask = np.frombuffer(column[1], dtype=np.uint8) == 0
+                arrays.append(pa.array(np.frombuffer(column[0], dtype=np.int64), mask=mask,
+                                       type=pa.timestamp('s') if kind == 'timestamp' else pa.int64()))
+            elif kind == 'float':
+                arrays.append(pa.array(np.frombuffer(column[0], dtype=np.float64), from_pandas=True))
+            elif kind == 'category':
+                codes = np.frombuffer(column[0], dtype=np.int32)
+                indices = pa.array(codes, mask=codes < 0, type=pa.int32())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(self._dictionary_labels(name))))
+            else:
+                arrays.append(pa.array(column[0], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=[name for name, _ in self.schema])
+
+    def to_pandas(self):
+        """ pandas DataFrame: nullable Int64, datetime64, float64 and categorical columns """
+        pd = _require('pandas')
+        np = _require('numpy')
+        data = {}
+        for name, kind in self.schema:
+            column = self._columns[name]
+            if kind in ('int', 'timestamp'):
+                values = np.frombuffer(column[0], dtype=np.int64)
+                mask = np.frombuffer(column[1], dtype=np.uint8) == 0
+                if kind == 'timestamp':
+                    data[name] = pd.Series(values.astype('datetime64[s]')).mask(mask)
+                else:
+                    data[name] = pd.arrays.IntegerArray(values.copy(), mask)
+            elif kind == 'float':
+                data[name] = np.frombuffer(column[0], dtype=np.float64)
+            elif kind == 'category':
+                codes = np.frombuffer(column[0], dtype=np.int32)
+                data[name] = pd.Categorical.from_codes(codes, categories=self._dictionary_labels(name))
+            else:
+                data[name] = column[0]
+        return pd.DataFrame(data)
+
+    def write_parquet(self, path, compression='zstd'):
+        """ write the table to a Parquet file (requires pyarrow) """
+        parquet = _require('pyarrow.parquet', 'pyarrow')
+        parquet.write_table(self.to_arrow(), path, compression=compression)
+
+class Exporter:
+    """ pages runs, tests and results of a project into Tables
+
+    Parameters
+    ----------
+    client : api.Client
+        client of the project
+    max_workers : int
+        number of runs fetched at the same time by tests and results
+    prefetch : bool
+        fetch the next page of each run while the current one is appended
+    """
+    def __init__(self, client, max_workers=4, prefetch=True):
+        self.client = client
+        self.max_workers = max_workers
+        self.prefetch = prefetch
+
+    def _status_label(self, status_id):
+        try:
+            return self.client.status_id_to_str(status_id)
+        except (api.APIError, KeyError, ValueError):
+            return str(status_id)
+
+    def runs(self, **filters):
+        """ Table of the runs of the project (RUNS columns), takes the filters of get_runs """
+        table = Table(RUNS)
+        table.extend(self.client.iter_runs(prefetch=self.prefetch, **filters))
+        return table
+
+    def _per_run(self, run_ids, fetch):
+        """ yield (run_id, items of the run) for each run, in order
+
+        At most max_workers runs are fetched, or fetched and waiting to be
+        yielded, at a time: the items of the other runs are not held in memory.
+        """
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                for run_id in run_ids:
+                    if run_id is None:
+                        continue
+                    if len(pending) >= self.max_workers:
+                        done_id, future = pending.popleft()
+                        yield done_id, future.result()
+                    pending.append((run_id, pool.submit(lambda run_id: list(fetch(run_id)), run_id)))
+                while pending:
+                    done_id, future = pending.popleft()
+                    yield done_id, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def tests(self, run_ids):
+        """ Table of the tests of the runs (TESTS columns) """
+        table = Table(TESTS, labels={'status_id': self._status_label})
+        for run_id, tests in self._per_run(run_ids, lambda run_id: self.client.iter_tests(run_id, prefetch=self.prefetch)):
+            table.extend(tests, run_id=run_id)
+        return table
+
+    def results(self, run_ids, tests=None):
+        """ Table of the results of the runs (RESULTS columns)
+
+        The results only reference their test: pass the Table of the tests of
+        the runs to fill the case_id column.
+        """
+        case_ids = dict(zip(tests.column('id'), tests.column('case_id'))) if tests is not None else {}
+        table = Table(RESULTS, labels={'status_id': self._status_label})
+        for run_id, results in self._per_run(run_ids, lambda run_id: self.client.iter_results_for_run(run_id, prefetch=self.prefetch)):
+            for result in results:
+                table.append(result, run_id=run_id, case_id=case_ids.get(result.get('test_id')))
+        return table
+
+def _groups(np, keys):
+    """ distinct keys, and index of the group of each row """
+    return np.unique(np.ma.filled(keys, -1) if np.ma.isMaskedArray(keys) else keys, return_inverse=True)
+
+def pass_rate_per_run(tests, passed=(1,), untested=(3,)):
+    """ executed tests, passed tests and pass rate of each run of a tests Table
+
+    Returns
+    -------
+    dict of NumPy arrays
+        run_id, executed, passed, pass_rate (NaN for the runs without executed tests)
+    """
+    np = _require('numpy')
+    columns = tests.to_numpy()
+    status = np.ma.filled(columns['status_id'], 0) if np.ma.isMaskedArray(columns['status_id']) else columns['status_id']
+    run_ids, groups = _groups(np, columns['run_id'])
+    executed = np.bincount(groups, weights=~np.isin(status, untested) & (status != 0), minlength=len(run_ids))
+    passes = np.bincount(groups, weights=np.isin(status, passed), minlength=len(run_ids))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = np.where(executed > 0, passes / executed, np.nan)
+    return {'run_id': run_ids, 'executed': executed.astype(np.int64), 'passed': passes.astype(np.int64), 'pass_rate': rate}
+
+def flakiness_per_case(results):
+    """ rate of status changes between the consecutive results of each case of a results Table
+
+    0 when a case always has the same status, 1 when it changes on every result.
+
+    Returns
+    -------
+    dict of NumPy arrays
+        case_id, results, flips, flakiness (NaN for the cases with a single result)
+    """
+    np = _require('numpy')
+    columns = results.to_numpy()
+    case_ids, groups = _groups(np, columns['case_id'])
+    created = np.ma.filled(columns['created_on'].astype(np.int64), 0) if np.ma.isMaskedArray(columns['created_on']) else columns['created_on'].astype(np.int64)
+    status = np.ma.filled(columns['status_id'], 0) if np.ma.isMaskedArray(columns['status_id']) else columns['status_id']
+    order = np.lexsort((np.asarray(columns['id']), created, groups))
+    groups, status = groups[order], status[order]
+    same_case = groups[1:] == groups[:-1]
+    flips = np.bincount(groups[1:][same_case & (status[1:] != status[:-1])], minlength=len(case_ids))
+    counts = np.bincount(groups, minlength=len(case_ids))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        flakiness = np.where(counts > 1, flips / (counts - 1), np.nan)
+    return {'case_id': case_ids, 'results': counts, 'flips': flips, 'flakiness': flakiness}
+
+def elapsed_percentiles(results, percentiles=(50, 90, 99), by=None):
+    """ percentiles of the elapsed times (seconds) of a results Table, ignoring the results without elapsed time
+
+    Parameters
+    ----------
+    by : str (optional)
+        column to group by ('case_id', 'run_id'...), overall percentiles otherwise
+
+    Returns
+    -------
+    dict
+        {percentile: value} without by, {'<by>': keys, percentile: array of values...} with by
+    """
+    np = _require('numpy')
+    columns = results.to_numpy()
+    elapsed = columns['elapsed']
+    timed = ~np.isnan(elapsed)
+    if by is None:
+        values = np.percentile(elapsed[timed], percentiles) if timed.any() else [np.nan] * len(percentiles)
+        return dict(zip(percentiles, values))
+    keys, groups = _groups(np, columns[by])
+    groups, elapsed = groups[timed], elapsed[timed]
+    order = np.lexsort((elapsed, groups))
+    groups, elapsed = groups[order], elapsed[order]
+    # sorted by group then elapsed: each percentile is an interpolation inside the slice of its group
+    starts = np.searchsorted(groups, np.arange(len(keys)), side='left')
+    counts = np.bincount(groups, minlength=len(keys))
+    output = {by: keys}
+    for percentile in percentiles:
+        position = starts + (counts - 1) * (percentile / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, starts + counts - 1)
+        with np.errstate(invalid='ignore'):
+            values = elapsed[np.clip(low, 0, max(len(elapsed) - 1, 0))] if len(elapsed) else np.full(len(keys), np.nan)
+            upper = elapsed[np.clip(high, 0, max(len(elapsed) - 1, 0))] if len(elapsed) else values
+            values = values + (upper - values) * (position - low)
+        output[percentile] = np.where(counts > 0, values, np.nan)
+    return output
@@ -0,0 +1,226 @@
+"""
+    change feed of the plans, runs and results of a project
+
+    Each poll only asks TestRail for what changed since the previous one, from
+    high-water marks kept in a local sqlite file: the plans and runs created
+    since the last poll (created_after), the new results of the active runs
+    (created_after, then result ids), and the runs and plans which were
+    completed. The cost of a poll follows the number of changes and of active
+    runs, not the size of the project:
+
+        feed = ChangeFeed(client, "feed.sqlite")
+        for change in feed.watch(interval=60):
+            if change.kind == 'result':
+                dashboard.update(change.item['run_id'], change.item['test_id'], change.item['status_id'])
+
+    A test changes status through its results: the status of a test is the
+    status_id of its last result.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import collections
+import sqlite3
+import threading
+import time
+
+import api
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS marks (
+    project_id INTEGER NOT NULL,
+    entity TEXT NOT NULL,
+    max_id INTEGER NOT NULL,
+    created_on INTEGER NOT NULL,
+    PRIMARY KEY (project_id, entity)
+);
+CREATE TABLE IF NOT EXISTS active (
+    project_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    plan_id INTEGER,
+    max_id INTEGER NOT NULL DEFAULT 0,
+    created_on INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, kind, id)
+);
+"""
+
+# kind: 'plan', 'run' or 'result'; action: 'created' or 'completed'; item: the entity, as returned by the API
+Change = collections.namedtuple('Change', ['kind', 'action', 'item'])
+
+class ChangeFeed:
+    """ polls the plans, runs and results of the project of client for changes
+
+    Parameters
+    ----------
+    client : api.Client
+        client of the project
+    path : str
+        sqlite database file of the high-water marks (":memory:" for a feed
+        which starts over with each process)
+    since : timestamp (optional)
+        the first poll returns the entities created after since, instead of all
+        of them
+    margin : int
+        seconds subtracted from the marks in the created_after filters, so
+        that the items created in the same second as the last one seen are
+        not missed (they are filtered out by id)
+    max_workers : int
+        number of active runs and plans fetched at the same time
+    """
+    def __init__(self, client, path, since=None, margin=60, max_workers=8):
+        self.client = client
+        self.path = path
+        self.since = since
+        self.margin = margin
+        self.max_workers = max_workers
+        # {'plans' / 'runs' / (kind, id): error message} of the last poll, retried on the next one
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+            # databases of the feeds which did not record the reported completions
+            if 'completed' not in {row[1] for row in self._db.execute("PRAGMA table_info(active)")}:
+                self._db.execute("ALTER TABLE active ADD COLUMN completed INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        """ close the database """
+        with self._lock:
+            self._db.close()
+
+    def _created_after(self, created_on):
+        """ created_after filter of a mark, {} for everything """
+        if created_on:
+            return {'created_after': max(0, created_on - self.margin)}
+        return {'created_after': self.since} if self.since else {}
+
+    def _new(self, entity, items, max_id, created_on):
+        """ the items above the mark (max_id), and the new mark """
+        new = [item for item in items if item['id'] > max_id]
+        for item in new:
+            max_id = max(max_id, item['id'])
+            created_on = max(created_on, item.get('created_on') or 0)
+        return new, (entity, max_id, created_on)
+
+    def poll(self):
+        """ the changes since the previous poll, the marks are saved when it returns
+
+        The entities which could not be fetched are in self.errors, and are
+        fetched again by the next poll.
+
+        Returns
+        -------
+        list of Change
+            created plans, created runs (standalone or added to an active
+            plan), completed runs (standalone or of a plan, reported once)
+            and plans, then the new results (with their run_id)
+        """
+        client = self.client
+        project_id = int(client.project_id)
+        with self._lock:
+            marks = {entity: (max_id, created_on) for entity, max_id, created_on in self._db.execute(
+                "SELECT entity, max_id, created_on FROM marks WHERE project_id = ?", (project_id,))}
+            # completed: 1 when the completion of the run was reported, it is polled until its last results are
+            # fetched; 2 once they are, for a run of a plan still active (not reported as created again)
+            active = {(kind, item_id): [plan_id, max_id, created_on, completed] for kind, item_id, plan_id, max_id, created_on, completed in self._db.execute(
+                "SELECT kind, id, plan_id, max_id, created_on, completed FROM active WHERE project_id = ?", (project_id,))}
+        changes = []
+        errors = {}
+        new_marks = []
+
+        # new plans and standalone runs
+        for entity, fetch in (('plans', client.iter_plans), ('runs', client.iter_runs)):
+            max_id, created_on = marks.get(entity, (0, 0))
+            try:
+                items, mark = self._new(entity, list(fetch(**self._created_after(created_on))), max_id, created_on)
+            except api.NETWORK_ERRORS + (api.APIError,) as exception:
+                errors[entity] = str(exception) or repr(exception)
+                continue
+            new_marks.append(mark)
+            for item in items:
+                changes.append(Change(entity[:-1], 'created', item))
+                if not item.get('is_completed'):
+                    active[(entity[:-1], item['id'])] = [item.get('plan_id'), 0, 0, 0]
+
+        def completed(run):
+            state = active.get(('run', run['id']))
+            if state is not None and not state[3]:
+                changes.append(Change('run', 'completed', run))
+                state[3] = 1
+
+        # runs added to the active plans, completed runs of the plans, completed plans
+        plans = [item_id for kind, item_id in active if kind == 'plan']
+        report = client._fetch_many(plans, lambda plan_id: [self._get(client.get_plan, plan_id)], self.max_workers) # pylint: disable=protected-access
+        errors.update((('plan', plan_id), error) for plan_id, error in report['errors'].items())
+        for plan_id, (plan,) in report['items'].items():
+            for entry in plan.get('entries') or []:
+                for run in entry.get('runs') or []:
+                    if ('run', run['id']) not in active and not plan.get('is_completed'):
+                        changes.append(Change('run', 'created', run))
+                        active[('run', run['id'])] = [plan_id, 0, 0, 0]
+                    if run.get('is_completed') or plan.get('is_completed'):
+                        completed(run)
+            if plan.get('is_completed'):
+                changes.append(Change('plan', 'completed', plan))
+                del active[('plan', plan_id)]
+
+        # completed standalone runs: the active runs which are no longer listed as active
+        standalone = [item_id for (kind, item_id), (plan_id, _, _, done) in active.items() if kind == 'run' and plan_id is None and not done]
+        if standalone:
+            try:
+                listed = {run['id'] for run in client.iter_runs(is_completed=False)}
+            except api.NETWORK_ERRORS + (api.APIError,) as exception:
+                errors['runs'] = str(exception) or repr(exception)
+                listed = set(standalone)
+            report = client._fetch_many([run_id for run_id in standalone if run_id not in listed], lambda run_id: [self._get(client.get_run, run_id)], self.max_workers) # pylint: disable=protected-access
+            errors.update((('run', run_id), error) for run_id, error in report['errors'].items())
+            for run_id, (run,) in report['items'].items():
+                if run.get('is_completed'):
+                    completed(run)
+
+        # new results of the runs, those of the completed runs included (they may
+        # have been added before the completion)
+        runs = [item_id for (kind, item_id), state in active.items() if kind == 'run' and state[3] != 2]
+
+        def results(run_id):
+            return client.iter_results_for_run(run_id, **self._created_after(active[('run', run_id)][2]))
+
+        report = client._fetch_many(runs, results, self.max_workers) # pylint: disable=protected-access
+        errors.update((('results', run_id), error) for run_id, error in report['errors'].items())
+        for run_id, items in report['items'].items():
+            state = active[('run', run_id)]
+            items, (_, state[1], state[2]) = self._new(run_id, items, state[1], state[2])
+            changes.extend(Change('result', 'created', dict(item, run_id=run_id)) for item in items)
+        for key in [key for key, state in active.items() if key[0] == 'run' and state[3]]:
+            # a completed run gets no new results: stop polling it, unless its results failed
+            if key[1] in report['errors']:
+                continue
+            if ('plan', active[key][0]) in active:
+                active[key][3] = 2
+            else:
+                del active[key]
+
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?)", [(project_id,) + mark for mark in new_marks])
+            self._db.execute("DELETE FROM active WHERE project_id = ?", (project_id,))
+            self._db.executemany("INSERT INTO active (project_id, kind, id, plan_id, max_id, created_on, completed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(project_id, kind, item_id) + tuple(state) for (kind, item_id), state in active.items()])
+        self.errors = errors
+        if errors:
+            api.logger.error("[api_feed.ChangeFeed.poll] %s failure(s), retried on the next poll: %s", len(errors), errors)
+        api.logger.info("[api_feed.ChangeFeed.poll] project %s: %s change(s), %s active run(s)", project_id, len(changes), len(runs))
+        return changes
+
+    @staticmethod
+    def _get(method, item_id):
+        item = method(item_id)
+        if item is None:
+            raise api.APIError("[api_feed.ChangeFeed] %s(%s) failed" % (method.__name__, item_id))
+        return item
+
+    def watch(self, interval=60.0):
+        """ poll every interval seconds, forever, and yield the changes one at a time """
+        while True:
+            started = time.monotonic()
+            yield from self.poll()
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,84 @@
+"""
+    single-flight deduplication of the concurrent identical GET requests
+
+    When threads (or asyncio tasks) send the same GET while it is in flight,
+    only the first one reaches the server: the others wait for its answer.
+
+        flight = SingleFlight()
+        client = api.Client(URL, project_id, user, password, single_flight=flight)
+        client.map('get_run', [run_id] * 20)    # one HTTP request
+        flight.stats                            # {'calls': 20, 'shared': 19}
+
+    The callers of a shared request get the same decoded object: copy it before
+    modifying it.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """ runs one call per key at a time, the concurrent callers of a key share its outcome
+
+    A SingleFlight belongs to one client: the keys are the uris of its requests.
+    """
+    def __init__(self):
+        self.stats = {'calls': 0, 'shared': 0}
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def forget(self):
+        """ the calls started from now on do not join the ones in flight (e.g. after a write) """
+        with self._lock:
+            self._calls = {}
+            self._tasks = {}
+
+    def do(self, key, function):
+        """ returns function(), or the outcome of the call of key already in flight in another thread """
+        with self._lock:
+            self.stats['calls'] += 1
+            calls = self._calls
+            future = calls.get(key)
+            if future is not None:
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                future = calls[key] = Future()
+                leader = True
+        if not leader:
+            return future.result()
+        try:
+            result = function()
+        except BaseException as exception:
+            future.set_exception(exception)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if calls.get(key) is future:
+                    del calls[key]
+
+    async def do_async(self, key, function):
+        """ awaits function(), or the call of key already in flight in another task
+
+        The shared call is not cancelled with the tasks waiting for it: one
+        of them being cancelled does not fail the others.
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            tasks = self._tasks
+            task = tasks.get(key)
+            if task is not None:
+                self.stats['shared'] += 1
+            else:
+                task = tasks[key] = asyncio.ensure_future(function())
+
+                def done(finished):
+                    with self._lock:
+                        if tasks.get(key) is finished:
+                            del tasks[key]
+                task.add_done_callback(done)
+        return await asyncio.shield(task)
@@ -0,0 +1,222 @@
+"""
+    ingestion of results into the runs of a test plan
+
+    The results only name their case and configuration: the runs of the plan
+    and their tests are resolved once into an index (case, configuration) ->
+    run, then the results are routed to their runs and uploaded with
+    add_results_for_cases, the runs in parallel, as the results come:
+
+        ingester = PlanIngester(client, plan_id)
+        report = ingester.ingest({'case_id': case_id, 'config': "Chrome, Windows", 'status_id': 1, ...}
+                                 for case_id, ... in junit_results)
+        report['unmatched']        # results with no run in the plan
+        report = ingester.ingest(report['failed_results'])   # retry the failed chunks
+
+    or in one call: client.add_results_for_plan(plan_id, results).
+
+    config is None for the runs without configuration, the configuration names
+    (a "Chrome, Windows" string or a list of names, in any order and case) or
+    the configuration ids (list of ints).
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import api
+
+class PlanIngester:
+    """ routes results by case and configuration to the runs of a plan, and uploads them
+
+    The index of the plan is built on the first ingest and kept for the next
+    ones: call refresh() after the plan changed.
+
+    Parameters
+    ----------
+    client : api.Client
+        client of the project of the plan
+    plan_id : int
+        id of the plan
+    max_workers : int
+        number of chunks uploaded at the same time, and of runs whose tests
+        are fetched at the same time
+    chunk_size, chunk_bytes, retries :
+        see api.Client.bulk_add_results_for_cases
+    """
+    def __init__(self, client, plan_id, max_workers=8, chunk_size=250, chunk_bytes=2**20, retries=2):
+        self.client = client
+        self.plan_id = plan_id
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.retries = retries
+        self.runs = None
+        # {frozenset of config ids: {case_id: run_id}}
+        self._index = None
+        # {frozenset of lowercased config names: frozenset of config ids}
+        self._names = None
+
+    def refresh(self):
+        """ (re)build the index of the runs and tests of the plan """
+        plan = self.client.get_plan(self.plan_id)
+        runs = self.plan_runs(plan)
+        self.index(runs, self.client.get_tests_many(runs, max_workers=self.max_workers))
+
+    def plan_runs(self, plan):
+        """ {run_id: run} of the answer of get_plan """
+        if plan is None:
+            raise api.APIError("[api_ingest.PlanIngester] failed to get plan %s" % self.plan_id)
+        return {run['id']: run for entry in plan.get('entries') or [] for run in entry.get('runs') or []}
+
+    def index(self, runs, report):
+        """ build the index from the runs of the plan and the report of get_tests_many on them """
+        if report['errors']:
+            raise api.APIError("[api_ingest.PlanIngester] failed to get the tests of plan %s: %s" % (self.plan_id, report['errors']))
+        index = {}
+        names = {}
+        for run_id, tests in report['items'].items():
+            run = runs[run_id]
+            config_ids = frozenset(run.get('config_ids') or ())
+            if run.get('config'):
+                names[self._config_names(run['config'])] = config_ids
+            cases = index.setdefault(config_ids, {})
+            for test in tests:
+                if cases.setdefault(test['case_id'], run_id) != run_id:
+                    api.logger.warning("[api_ingest.PlanIngester] case %s is in runs %s and %s of plan %s with the same configuration, using run %s",
+                                       test['case_id'], cases[test['case_id']], run_id, self.plan_id, cases[test['case_id']])
+        self.runs = runs
+        self._index = index
+        self._names = names
+
+    @staticmethod
+    def _config_names(config):
+        """ "Chrome, Windows" or ['Chrome', 'Windows'] -> frozenset({'chrome', 'windows'}) """
+        if isinstance(config, str):
+            config = config.split(',')
+        return frozenset(name.strip().lower() for name in config if name.strip())
+
+    def _config_key(self, config):
+        """ frozenset of the config ids of config, None if it is not a configuration of the plan """
+        if not config:
+            return frozenset()
+        if isinstance(config, str) or not all(isinstance(item, int) for item in config):
+            return self._names.get(self._config_names(config))
+        return frozenset(config)
+
+    def run_for(self, case_id, config=None):
+        """ id of the run of the plan holding case_id with config, None if there is none """
+        if self._index is None:
+            self.refresh()
+        key = self._config_key(config)
+        return self._index.get(key, {}).get(case_id) if key is not None else None
+
+    def ingest(self, results):
+        """ route results to the runs of the plan and upload them
+
+        The results are read once, as they come: the results of a run are
+        uploaded as soon as a chunk is full, while the next ones are routed.
+
+        Parameters
+        ----------
+        results : iterable of dicts
+            case_id, config (optional, see the module) and the fields of
+            add_results_for_cases (status_id, comment, elapsed...)
+
+        Returns
+        -------
+        dict
+            report of the ingestion:
+                total, uploaded, failed : number of routed results
+                unmatched : results which are not in any run of the plan
+                runs : {run_id: {'uploaded': n, 'failed': n}}
+                chunks : report of each chunk (run_id, index, count, bytes, tries, ok, error)
+                failed_results : results of the failed chunks, which can be
+                                 given back to ingest to resume
+        """
+        if self._index is None:
+            self.refresh()
+        report = self.empty_report()
+        buffers = {}
+        chunks = {}
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+
+            def submit(run_id, results):
+                for chunk in api.chunk_results(results, self.chunk_size, self.chunk_bytes):
+                    chunk['index'] = chunks[run_id] = chunks.get(run_id, -1) + 1
+                    if len(pending) >= 2 * self.max_workers:
+                        # bounded number of chunks in memory: wait for an upload
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                            self._account(report, *future.result())
+                    future = pool.submit(self._upload, run_id, chunk)
+                    pending.add(future)
+
+            for result in results:
+                run_id = self.run_for(result.get('case_id'), result.get('config'))
+                if run_id is None:
+                    report['unmatched'].append(result)
+                    continue
+                buffer = buffers.setdefault(run_id, [])
+                buffer.append({key: value for key, value in result.items() if key != 'config'})
+                if len(buffer) >= self.chunk_size:
+                    del buffers[run_id]
+                    submit(run_id, buffer)
+            for run_id, buffer in buffers.items():
+                submit(run_id, buffer)
+            for future in pending:
+                self._account(report, *future.result())
+        if report['unmatched']:
+            api.logger.warning("[api_ingest.PlanIngester] %s result(s) are not in plan %s", len(report['unmatched']), self.plan_id)
+        return report
+
+    @staticmethod
+    def empty_report():
+        """ report of an ingestion of no results, see ingest """
+        return {'total': 0, 'uploaded': 0, 'failed': 0, 'unmatched': [], 'runs': {}, 'chunks': [], 'failed_results': []}
+
+    def route(self, results):
+        """ the results grouped by run ({run_id: [results]}, without their config), and the unmatched results """
+        if self._index is None:
+            self.refresh()
+        runs = {}
+        unmatched = []
+        for result in results:
+            run_id = self.run_for(result.get('case_id'), result.get('config'))
+            if run_id is None:
+                unmatched.append(result)
+            else:
+                runs.setdefault(run_id, []).append({key: value for key, value in result.items() if key != 'config'})
+        return runs, unmatched
+
+    def add_bulk_report(self, report, run_id, bulk):
+        """ add the report of bulk_add_results_for_cases on the results of run_id to an ingest report """
+        report['total'] += bulk['total']
+        report['uploaded'] += bulk['uploaded']
+        report['failed'] += bulk['failed']
+        run = report['runs'].setdefault(run_id, {'uploaded': 0, 'failed': 0})
+        run['uploaded'] += bulk['uploaded']
+        run['failed'] += bulk['failed']
+        report['chunks'].extend({'run_id': run_id, 'index': chunk['index'], 'count': chunk['count'], 'bytes': chunk['bytes'], 'tries': chunk['tries'],
+                                 'ok': chunk['ok'], 'error': chunk['error']} for chunk in bulk['chunks'])
+        config = sorted(self.runs[run_id].get('config_ids') or ())
+        report['failed_results'].extend(dict(result, config=config) for result in bulk['failed_results'])
+
+    def _upload(self, run_id, chunk):
+        return run_id, chunk, self.client._upload_results_chunk(run_id, chunk, self.retries) # pylint: disable=protected-access
+
+    def _account(self, report, run_id, chunk, chunk_report):
+        """ add the outcome of the upload of a chunk to the report """
+        count = len(chunk['results'])
+        run = report['runs'].setdefault(run_id, {'uploaded': 0, 'failed': 0})
+        report['total'] += count
+        if chunk_report['ok']:
+            report['uploaded'] += count
+            run['uploaded'] += count
+        else:
+            report['failed'] += count
+            run['failed'] += count
+            # with the config ids of their run, so that they are routed back to it
+            config = sorted(self.runs[run_id].get('config_ids') or ())
+            report['failed_results'].extend(dict(result, config=config) for result in chunk['results'])
+        report['chunks'].append({'run_id': run_id, 'index': chunk['index'], 'count': count, 'bytes': chunk['bytes'], 'tries': chunk_report['tries'],
+                                 'ok': chunk_report['ok'], 'error': chunk_report['error']})
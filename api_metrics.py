@@ -0,0 +1,204 @@
+"""
+    instrumentation of the API requests
+
+    A Metrics given to a client records every request: latency histogram,
+    bytes sent and received, retries, 429 answers and time spent sleeping
+    (retry backoff and rate limiter), per API method. The numbers are exported
+    as Prometheus / OpenMetrics text, and hooks receive each request as it
+    completes:
+
+        metrics = Metrics()
+        metrics.add_hook(lambda event: print(event.method, event.elapsed))
+        client = api.Client(URL, project_id, user, password, metrics=metrics)
+        ...
+        metrics.snapshot()['get_cases']     # {'requests': 12, 'p50': 0.08, ...}
+        print(metrics.prometheus())
+
+    Recording a request costs a lock and a bisect: it can be left on in production.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import bisect
+import collections
+import threading
+
+import api_retry
+
+# one completed request (after its retries)
+RequestEvent = collections.namedtuple('RequestEvent', [
+    'method',       # API method ('get_cases')
+    'http_method',  # 'GET' / 'POST'
+    'status',       # HTTP status of the last answer, None when no answer was received
+    'elapsed',      # seconds, from the first try to the last answer, sleeps included
+    'bytes_out',    # bytes of request body sent, all tries included
+    'bytes_in',     # size of the last answer body
+    'tries',        # 1 + number of retries
+    'throttled',    # number of 429 answers
+    'slept',        # seconds slept between the retries
+    'waited',       # seconds waited for the rate limiter
+    'error',        # name of the exception which ended the request, None otherwise
+])
+
+# upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _MethodStats:
+    __slots__ = ('buckets', 'count', 'sum', 'errors', 'statuses', 'bytes_out', 'bytes_in', 'retries', 'throttled', 'slept', 'waited')
+
+    def __init__(self, size):
+        self.buckets = [0] * (size + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.statuses = collections.Counter()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+        self.throttled = 0
+        self.slept = 0.0
+        self.waited = 0.0
+
+class Metrics:
+    """ per API method request metrics, with hooks
+
+    Parameters
+    ----------
+    buckets : tuple of float
+        upper bounds (seconds) of the latency histogram buckets
+    hooks : iterable of callables (optional)
+        called with a RequestEvent after each request, see add_hook
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, hooks=()):
+        self.bucket_bounds = tuple(sorted(buckets))
+        self._hooks = list(hooks)
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def add_hook(self, hook):
+        """ call hook(event) after each request; a failing hook is logged and ignored """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """ stop calling hook """
+        self._hooks.remove(hook)
+
+    def reset(self):
+        """ forget the recorded requests """
+        with self._lock:
+            self._methods = {}
+
+    def record(self, event):
+        """ add a RequestEvent to the metrics, then call the hooks """
+        index = bisect.bisect_left(self.bucket_bounds, event.elapsed)
+        key = (event.method, event.http_method)
+        with self._lock:
+            stats = self._methods.get(key)
+            if stats is None:
+                stats = self._methods[key] = _MethodStats(len(self.bucket_bounds))
+            stats.buckets[index] += 1
+            stats.count += 1
+            stats.sum += event.elapsed
+            stats.statuses[event.status if event.status is not None else event.error] += 1
+            if event.error is not None or (event.status is not None and event.status >= 400):
+                stats.errors += 1
+            stats.bytes_out += event.bytes_out
+            stats.bytes_in += event.bytes_in
+            stats.retries += event.tries - 1
+            stats.throttled += event.throttled
+            stats.slept += event.slept
+            stats.waited += event.waited
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception: # pylint: disable=broad-except
+                import api # pylint: disable=import-outside-toplevel
+                api.logger.exception("[api_metrics.Metrics] hook %r failed", hook)
+
+    def _quantile(self, stats, quantile):
+        """ estimate of a latency quantile: linear interpolation inside its bucket """
+        rank = quantile * stats.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.bucket_bounds + (float('inf'),), stats.buckets):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def snapshot(self):
+        """ the metrics per API method (GET and POST of a method are summed)
+
+        Returns
+        -------
+        dict
+            {method: {requests, errors, statuses, latency_sum, p50, p90, p99,
+            bytes_out, bytes_in, retries, throttled, slept, waited}}
+        """
+        merged = {}
+        with self._lock:
+            for (method, _), stats in self._methods.items():
+                total = merged.get(method)
+                if total is None:
+                    total = merged[method] = _MethodStats(len(self.bucket_bounds))
+                total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+                total.statuses.update(stats.statuses)
+                for name in ('count', 'sum', 'errors', 'bytes_out', 'bytes_in', 'retries', 'throttled', 'slept', 'waited'):
+                    setattr(total, name, getattr(total, name) + getattr(stats, name))
+        return {method: {
+            'requests': stats.count, 'errors': stats.errors, 'statuses': dict(stats.statuses), 'latency_sum': stats.sum,
+            'p50': self._quantile(stats, 0.5), 'p90': self._quantile(stats, 0.9), 'p99': self._quantile(stats, 0.99),
+            'bytes_out': stats.bytes_out, 'bytes_in': stats.bytes_in, 'retries': stats.retries,
+            'throttled': stats.throttled, 'slept': stats.slept, 'waited': stats.waited,
+        } for method, stats in sorted(merged.items())}
+
+    def prometheus(self, prefix="testrail_api", openmetrics=False):
+        """ the metrics in the Prometheus text exposition format (OpenMetrics with openmetrics=True) """
+        with self._lock:
+            methods = sorted(self._methods.items())
+            lines = [
+                "# HELP {0}_request_duration_seconds Latency of the API requests, retries included.".format(prefix),
+                "# TYPE {0}_request_duration_seconds histogram".format(prefix),
+            ]
+            for (method, http_method), stats in methods:
+                labels = 'method="{0}",http_method="{1}"'.format(method, http_method)
+                cumulated = 0
+                for bound, count in zip(self.bucket_bounds + (float('inf'),), stats.buckets):
+                    cumulated += count
+                    lines.append('{0}_request_duration_seconds_bucket{{{1},le="{2}"}} {3}'.format(prefix, labels, "+Inf" if bound == float('inf') else repr(bound), cumulated))
+                lines.append('{0}_request_duration_seconds_sum{{{1}}} {2!r}'.format(prefix, labels, stats.sum))
+                lines.append('{0}_request_duration_seconds_count{{{1}}} {2}'.format(prefix, labels, stats.count))
+            counters = (
+                ('requests', "API requests, by final status", lambda stats: [('status="%s"' % status, count) for status, count in sorted(stats.statuses.items(), key=str)]),
+                ('request_errors', "API requests which failed", lambda stats: [('', stats.errors)]),
+                ('bytes', "bytes sent and received", lambda stats: [('direction="out"', stats.bytes_out), ('direction="in"', stats.bytes_in)]),
+                ('retries', "retries of the API requests", lambda stats: [('', stats.retries)]),
+                ('throttled', "429 answers", lambda stats: [('', stats.throttled)]),
+                ('sleep_seconds', "time spent sleeping before sending requests", lambda stats: [('reason="retry"', stats.slept), ('reason="rate_limit"', stats.waited)]),
+            )
+            for name, help_text, values in counters:
+                metric = "{0}_{1}".format(prefix, name)
+                lines.append("# HELP {0} {1}.".format(metric if openmetrics else metric + "_total", help_text[0].upper() + help_text[1:]))
+                # the _total suffix is part of the family name in the Prometheus format, not in OpenMetrics
+                lines.append("# TYPE {0} counter".format(metric if openmetrics else metric + "_total"))
+                for (method, http_method), stats in methods:
+                    for extra, value in values(stats):
+                        labels = 'method="{0}",http_method="{1}"'.format(method, http_method) + ("," + extra if extra else "")
+                        lines.append("{0}_total{{{1}}} {2}".format(metric, labels, value))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+def request_event(http_method, uri, answer, elapsed, body, tries, throttled, slept, waited, error=None):
+    """ build the RequestEvent of a request to uri, from its last answer (None if there was none) and its body """
+    bytes_in = 0
+    if answer is not None:
+        if getattr(answer, 'body', None) is not None:
+            bytes_in = len(answer.body)
+        else:
+            # streamed answer: not read yet
+            bytes_in = int((answer.headers or {}).get('Content-Length') or 0)
+    return RequestEvent(api_retry.api_method(uri), http_method, answer.status if answer is not None else None, elapsed,
+                        len(body or b'') * tries, bytes_in, tries, throttled, slept, waited,
+                        type(error).__name__ if error is not None else None)
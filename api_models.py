@@ -0,0 +1,168 @@
+"""
+    compact records for the entities returned by the API
+
+    The API methods return dicts; with model=True they return records instead:
+
+        cases = client.get_cases(suite_id, model=True)
+        cases[0].title, cases[0]['priority_id'], cases[0].custom_steps
+
+    A record keeps its common fields in __slots__, interns the strings which
+    repeat across records (refs, versions, field names, short labels...), and
+    keeps the other fields (custom fields...) as a json string which is only
+    decoded the first time one of them is read.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import json
+import sys
+
+_MISSING = object()
+# longer strings (descriptions, steps...) are rarely repeated
+INTERN_MAX_LENGTH = 64
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH else value
+
+class Record:
+    """ base class of the records
+
+    FIELDS are stored in slots, INTERNED fields are interned strings, the other
+    fields are kept serialized until one of them is read.
+    """
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    INTERNED = ()
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            value = fields.pop(name, None)
+            setattr(self, name, _intern(value) if name in self.INTERNED else value)
+        # serialized once, decoded on first access (see _extras)
+        self._extra = json.dumps(fields, separators=(',', ':')) if fields else None
+
+    @classmethod
+    def from_dict(cls, item):
+        """ build a record from a dict returned by the API """
+        return cls(**item)
+
+    def _extras(self):
+        extra = self._extra
+        if extra is None:
+            return {}
+        if isinstance(extra, str):
+            extra = self._extra = {sys.intern(key): _intern(value) for key, value in json.loads(extra).items()}
+        return extra
+
+    def __getattr__(self, name):
+        # only called for the names which are not slots: the extra fields
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = self._extras().get(name, _MISSING)
+        if value is _MISSING:
+            raise AttributeError("%s has no field %r" % (type(self).__name__, name))
+        return value
+
+    def __getitem__(self, name):
+        if name in self.FIELDS:
+            return getattr(self, name)
+        return self._extras()[name]
+
+    def __contains__(self, name):
+        return name in self.FIELDS or name in self._extras()
+
+    def get(self, name, default=None):
+        """ dict-like access to a field """
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """ names of the fields """
+        return list(self.FIELDS) + list(self._extras())
+
+    def to_dict(self):
+        """ returns the fields as a dict, as returned by the API """
+        item = {name: getattr(self, name) for name in self.FIELDS}
+        item.update(self._extras())
+        return item
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash((type(self), getattr(self, 'id', None)))
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, getattr(self, 'id', None))
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state) # pylint: disable=unnecessary-dunder-call
+
+class Case(Record):
+    """ test case (get_case, get_cases) """
+    FIELDS = ('id', 'title', 'section_id', 'suite_id', 'template_id', 'type_id', 'priority_id', 'milestone_id',
+              'refs', 'estimate', 'created_by', 'created_on', 'updated_by', 'updated_on')
+    INTERNED = ('refs', 'estimate')
+    __slots__ = FIELDS
+
+class Test(Record):
+    """ test of a run (get_test, get_tests) """
+    FIELDS = ('id', 'case_id', 'run_id', 'status_id', 'assignedto_id', 'title', 'type_id', 'priority_id',
+              'milestone_id', 'refs', 'estimate')
+    INTERNED = ('refs', 'estimate')
+    __slots__ = FIELDS
+
+class Run(Record):
+    """ test run (get_run, get_runs) """
+    FIELDS = ('id', 'suite_id', 'name', 'plan_id', 'milestone_id', 'assignedto_id', 'is_completed', 'config',
+              'passed_count', 'failed_count', 'blocked_count', 'retest_count', 'untested_count',
+              'created_by', 'created_on', 'completed_on', 'url')
+    INTERNED = ('config',)
+    __slots__ = FIELDS
+
+class Plan(Record):
+    """ test plan (get_plan, get_plans) """
+    FIELDS = ('id', 'name', 'milestone_id', 'assignedto_id', 'is_completed',
+              'passed_count', 'failed_count', 'blocked_count', 'retest_count', 'untested_count',
+              'created_by', 'created_on', 'completed_on', 'url')
+    __slots__ = FIELDS
+
+class Result(Record):
+    """ test result (get_results) """
+    FIELDS = ('id', 'test_id', 'status_id', 'assignedto_id', 'comment', 'version', 'elapsed', 'defects',
+              'created_by', 'created_on')
+    INTERNED = ('version', 'elapsed', 'defects')
+    __slots__ = FIELDS
+
+class Section(Record):
+    """ section of a suite (get_section, get_sections) """
+    FIELDS = ('id', 'suite_id', 'parent_id', 'name', 'description', 'depth', 'display_order')
+    __slots__ = FIELDS
+
+def to_model(result, model, key=None):
+    """ convert the answer of an API method into records
+
+    Parameters
+    ----------
+    result : dict or list
+        answer of the API method: one item, a list of items, or a page
+        ({..., key: [items]})
+    model : Record subclass
+        class of the records
+    key : str (optional)
+        member of the page holding the items
+
+    Returns
+    -------
+    Record, list of Records, or the page with its items converted
+    """
+    if result is None:
+        return None
+    if isinstance(result, list):
+        return [model.from_dict(item) for item in result]
+    if key is not None and isinstance(result.get(key), list):
+        return dict(result, **{key: [model.from_dict(item) for item in result[key]]})
+    return model.from_dict(result)
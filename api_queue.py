@@ -0,0 +1,281 @@
+"""
+    durable queue of the results to submit, delivered in the background
+
+    enqueue() only writes the result to a local sqlite file and returns: the
+    test process never waits for TestRail. A flusher thread delivers the queued
+    results, coalesced per run into add_results_for_cases calls, and keeps the
+    results which could not be delivered (TestRail down, network errors...) to
+    retry them later, including after a restart of the process:
+
+        with ResultQueue(client, "results.sqlite") as queue:
+            queue.enqueue(run_id, case_id, 1, comment="passed", elapsed="3s")
+            ...
+        # leaving the block flushes the queue (within stop_timeout)
+
+    Delivery is at least once: a batch whose answer is lost (timeout, crash
+    after the request) is posted again. Each result has a dedup key (generated,
+    or given by the caller): enqueuing a key which is already queued or
+    delivered is ignored, so a harness can safely enqueue the same result twice.
+
+    The invalid results of a batch rejected by TestRail are isolated (see
+    api.post_bisecting) and set aside (see failed()), the others are delivered.
+    The results of a batch refused for another client error (403, 404...) are
+    set aside at once: trying them again would fail again.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import api
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    run_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_try REAL NOT NULL DEFAULT 0,
+    delivered_at REAL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS results_due ON results (delivered_at, dead, next_try, run_id);
+"""
+
+class ResultQueue:
+    """ sqlite backed queue of results, flushed per run by a background thread
+
+    Parameters
+    ----------
+    client : api.Client
+        client used to deliver the results
+    path : str
+        sqlite database file
+    batch_size : int
+        maximum number of results per add_results_for_cases request
+    interval : float
+        seconds between two flushes (a flush also starts as soon as batch_size
+        results are queued)
+    backoff : float
+        delay before the first retry of a failed batch, doubled on each
+        failure up to max_backoff
+    max_backoff : float
+        maximum delay between two tries
+    max_attempts : int
+        results which failed this many times are set aside (dead), see
+        failed(); None retries them forever
+    retention : float
+        seconds the delivered results are kept to detect duplicated dedup keys
+    stop_timeout : float
+        maximum time spent flushing the queue when leaving the with block
+    """
+    def __init__(self, client, path, batch_size=250, interval=5.0, backoff=1.0, max_backoff=300.0, max_attempts=10, retention=7 * 86400, stop_timeout=60.0):
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.stop_timeout = stop_timeout
+        self.stats = {'enqueued': 0, 'duplicates': 0, 'delivered': 0, 'batches': 0, 'failures': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._queued = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # the WAL is durable across process crashes with NORMAL, only an OS crash can lose the last writes
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def enqueue(self, run_id, case_id, status_id, dedup_key=None, **kwargs):
+        """ queue a result for case_id of run_id (see api.Client.add_result_for_case for kwargs)
+
+        Returns
+        -------
+        str
+            dedup key of the result
+        """
+        result = dict(kwargs, case_id=case_id, status_id=status_id)
+        if isinstance(result.get('defects'), list):
+            result['defects'] = ",".join(result['defects'])
+        return self.enqueue_many(run_id, [result], [dedup_key])[0]
+
+    def enqueue_many(self, run_id, results, dedup_keys=None):
+        """ queue results of run_id (dicts with case_id, status_id..., see api.Client.add_results_for_cases)
+
+        Returns
+        -------
+        list of str
+            dedup keys of the results
+        """
+        dedup_keys = list(dedup_keys) if dedup_keys is not None else [None] * len(results)
+        dedup_keys = [key if key is not None else uuid.uuid4().hex for key in dedup_keys]
+        now = time.time()
+        rows = [(key, run_id, json.dumps(result), now) for key, result in zip(dedup_keys, results)]
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO results (dedup_key, run_id, data, enqueued_at) VALUES (?, ?, ?, ?)", rows)
+            added = self._db.total_changes - before
+            self.stats['enqueued'] += added
+            self.stats['duplicates'] += len(rows) - added
+            self._queued += added
+            if self._queued >= self.batch_size:
+                self._wake.set()
+        return dedup_keys
+
+    def backlog(self):
+        """ number of results waiting for delivery (dead ones excluded) """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results WHERE delivered_at IS NULL AND dead = 0").fetchone()[0]
+
+    def failed(self):
+        """ results rejected by TestRail or set aside after max_attempts failures: list of dicts (dedup_key, run_id, result, attempts, error) """
+        with self._lock:
+            rows = self._db.execute("SELECT dedup_key, run_id, data, attempts, error FROM results WHERE dead = 1 ORDER BY seq").fetchall()
+        return [{'dedup_key': key, 'run_id': run_id, 'result': json.loads(data), 'attempts': attempts, 'error': error} for key, run_id, data, attempts, error in rows]
+
+    def _due(self):
+        """ the due results, grouped per run: {run_id: [(seq, attempts, result)...]} """
+        with self._lock:
+            self._queued = 0
+            rows = self._db.execute("SELECT seq, run_id, attempts, data FROM results WHERE delivered_at IS NULL AND dead = 0 AND next_try <= ? ORDER BY seq", (time.time(),)).fetchall()
+        runs = {}
+        for seq, run_id, attempts, data in rows:
+            runs.setdefault(run_id, []).append((seq, attempts, json.loads(data)))
+        return runs
+
+    def _deliver(self, run_id, batch):
+        """ post one batch (see api.post_bisecting), record the outcomes
+
+        Returns
+        -------
+        tuple
+            number of results delivered, False if a part failed for a reason
+            which may go away (network, server errors, throttling), True
+            otherwise
+        """
+        def post(part):
+            return self.client.add_results_for_cases(run_id, [result for _, _, result in part], raise_errors=True)
+        delivered = 0
+        for part, _, exception in api.post_bisecting(post, batch):
+            error = None if exception is None else str(exception) or repr(exception)
+            rejected = isinstance(exception, api.HTTPError) and 400 <= exception.status < 500 and exception.status != 429
+            self._record(run_id, part, error, rejected)
+            if error is None:
+                delivered += len(part)
+            elif not rejected:
+                return delivered, False
+        return delivered, True
+
+    def _record(self, run_id, batch, error, rejected):
+        """ record the outcome of a batch: delivered, rejected (dead) or retried after the backoff """
+        now = time.time()
+        with self._lock, self._db:
+            if error is None:
+                self._db.executemany("UPDATE results SET delivered_at = ?, attempts = attempts + 1, error = NULL WHERE seq = ?", [(now, seq) for seq, _, _ in batch])
+                self.stats['delivered'] += len(batch)
+                self.stats['batches'] += 1
+                return
+            updates = []
+            for seq, attempts, _ in batch:
+                attempts += 1
+                dead = int(rejected or (self.max_attempts is not None and attempts >= self.max_attempts))
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+                updates.append((attempts, now + delay, dead, error, seq))
+            self._db.executemany("UPDATE results SET attempts = ?, next_try = ?, dead = ?, error = ? WHERE seq = ?", updates)
+            self.stats['rejected' if rejected else 'failures'] += 1
+        if rejected:
+            api.logger.error("[api_queue.ResultQueue] %s results of run %s rejected, set aside: %s", len(batch), run_id, error)
+        else:
+            api.logger.warning("[api_queue.ResultQueue] %s results of run %s not delivered: %s", len(batch), run_id, error)
+
+    def flush(self):
+        """ deliver the due results now, in batches of batch_size per run
+
+        The results rejected by TestRail are set aside and the next batches
+        of their run are still delivered. A run whose batch fails otherwise
+        (TestRail unreachable...) is retried after the backoff; the other
+        runs are still delivered.
+
+        Returns
+        -------
+        int
+            number of results delivered
+        """
+        delivered = 0
+        with self._flush_lock:
+            for run_id, results in self._due().items():
+                for start in range(0, len(results), self.batch_size):
+                    count, ok = self._deliver(run_id, results[start:start + self.batch_size])
+                    delivered += count
+                    if not ok:
+                        break
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM results WHERE delivered_at < ?", (time.time() - self.retention,))
+        return delivered
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except sqlite3.Error as exception:
+                api.logger.error("[api_queue.ResultQueue] flush failed: %s", exception)
+
+    def start(self):
+        """ start the background flusher """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="ResultQueue flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, flush=True, timeout=None):
+        """ stop the background flusher, then deliver what is due (for at most timeout seconds) """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not flush:
+            return
+        deadline = time.monotonic() + (self.stop_timeout if timeout is None else timeout)
+        while self.backlog() and time.monotonic() < deadline:
+            if not self.flush():
+                # wait for the next try of the failed batches, but not past the deadline
+                with self._lock:
+                    next_try = self._db.execute("SELECT MIN(next_try) FROM results WHERE delivered_at IS NULL AND dead = 0").fetchone()[0]
+                if next_try is None:
+                    break
+                time.sleep(max(0.0, min(next_try - time.time(), deadline - time.monotonic())))
+        remaining = self.backlog()
+        if remaining:
+            api.logger.warning("[api_queue.ResultQueue] %s results still queued in %s, delivered on the next start", remaining, self.path)
+
+    def close(self):
+        """ stop the flusher without flushing, close the database """
+        self.stop(flush=False)
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,110 @@
+"""
+    client-side rate limiting of the TestRail API requests
+
+    One RateLimiter can be shared by several api.Client / api_async.AsyncClient
+    instances, threads and asyncio tasks of the same process:
+
+        limiter = RateLimiter(requests_per_minute=180)
+        client = api.Client(URL, project_id, user, password, rate_limiter=limiter)
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import asyncio
+import threading
+import time
+
+class RateLimiter:
+    """ token bucket with an adaptive rate (AIMD)
+
+    Every request takes a token. Tokens are refilled at the current rate, up to
+    burst tokens. When the server answers 429, the rate is cut by
+    decrease_factor and every request waits for the Retry-After delay; each
+    successful request then gives back `increase` of the configured rate until
+    it is reached again. The rate is cut once per congestion episode: the 429
+    answers to the requests which were already in flight (received while the
+    requests are held, or within the time the bucket takes to refill after
+    the last cut) do not cut it again.
+
+    Tokens are reserved under a lock and the waiting happens outside of it, so
+    the limiter is shared safely by threads (acquire) and asyncio tasks
+    (acquire_async) without blocking the event loop.
+
+    Parameters
+    ----------
+    requests_per_minute : float
+        configured (maximum) rate
+    burst : int
+        size of the bucket: number of requests which can be sent at once
+    min_requests_per_minute : float
+        the rate is never cut below this
+    decrease_factor : float
+        the rate is multiplied by this on a 429
+    increase : float
+        fraction of requests_per_minute given back on each successful request
+    """
+    def __init__(self, requests_per_minute=180, burst=10, min_requests_per_minute=6, decrease_factor=0.5, increase=0.02):
+        assert requests_per_minute > 0, "requests_per_minute must be positive"
+        assert burst >= 1, "burst must be at least 1"
+        assert 0 < decrease_factor < 1, "decrease_factor must be between 0 and 1"
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = min(min_requests_per_minute, requests_per_minute) / 60.0
+        self.burst = burst
+        self.decrease_factor = decrease_factor
+        self.increase = increase
+        self.rate = self.max_rate
+        self.stats = {'acquired': 0, 'throttled': 0, 'waited': 0.0}
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._cut_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def requests_per_minute(self):
+        """ current rate """
+        return self.rate * 60.0
+
+    def _reserve(self):
+        """ takes a token, returns how long (seconds) the caller has to wait before sending """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # tokens can go negative: the debt orders the waiting callers
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate, self._blocked_until - now)
+            self.stats['acquired'] += 1
+            self.stats['waited'] += delay
+            return delay
+
+    def acquire(self):
+        """ blocks until a request can be sent, returns the time waited """
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """ waits (without blocking the event loop) until a request can be sent, returns the time waited """
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def throttled(self, retry_after=None):
+        """ the server answered 429: cut the rate (once per congestion episode) and hold every request for retry_after seconds """
+        with self._lock:
+            now = time.monotonic()
+            self.stats['throttled'] += 1
+            if now >= self._blocked_until and (self._cut_at is None or now - self._cut_at >= self.burst / self.rate):
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._cut_at = now
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def succeeded(self):
+        """ a request went through: give back some of the rate """
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.increase)
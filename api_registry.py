@@ -0,0 +1,161 @@
+"""
+    indexed lookup tables of the TestRail definitions (statuses, users, priorities...)
+
+        client.registries['statuses'].label(5)                # 'Failed'
+        client.registries['statuses'].id_of('failed')          # 5
+        client.registries['users'].labels([1, 2, 1])           # ['Joe', 'Jane', 'Joe']
+
+    When the definitions can't be loaded (e.g. no permission), the lookups raise
+    api.APIError; the failure is remembered for failure_ttl seconds, so that
+    the lookups in the meantime don't request the definitions again.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import threading
+import time
+
+class Registry:
+    """ id <-> label / name indexes of a list of definitions, loaded lazily
+
+    Parameters
+    ----------
+    loader : callable
+        returns the list of definitions (dicts with an 'id'), e.g. client.get_statuses
+    label_key : str
+        key of the label of a definition (returned by label / labels)
+    name_keys : tuple of str
+        other keys which can be used to look a definition up, case insensitively
+    ttl : float
+        the definitions are loaded again on the first use after ttl seconds.
+        None to keep them until refresh() is called.
+    failure_ttl : float
+        seconds during which a failed load is not tried again: the lookups
+        raise api.APIError, or use the previous definitions if there are any
+    """
+    def __init__(self, loader, label_key='name', name_keys=(), ttl=3600, failure_ttl=30):
+        self.loader = loader
+        self.label_key = label_key
+        self.name_keys = tuple(name_keys)
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._items = None
+        self._loaded = 0.0
+        # (time.monotonic() of the last failed load, its error message)
+        self._failure = None
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._labels = {}
+        self._ids = {}
+        self._folded_ids = {}
+
+    @property
+    def loaded(self):
+        """ True when the definitions are loaded and not expired """
+        return self._items is not None and (self.ttl is None or time.monotonic() - self._loaded < self.ttl)
+
+    @property
+    def items(self):
+        """ tuple of the definitions, shared by the threads: not to be modified """
+        self._ensure()
+        return self._items if self._items is not None else ()
+
+    def _ensure(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            failure = self._failure
+            if failure is None or time.monotonic() - failure[0] >= self.failure_ttl:
+                failure = self._load()
+        # keep the previous definitions if the reload failed
+        if failure is not None and self._items is None:
+            import api # pylint: disable=import-outside-toplevel
+            raise api.APIError("[api_registry.Registry] the definitions could not be loaded: %s" % failure[1])
+
+    def _load(self):
+        """ call the loader (under the lock), returns the failure, None if it succeeded """
+        import api # pylint: disable=import-outside-toplevel
+        try:
+            items = self.loader()
+            error = None if items is not None else "the request failed"
+        except api.NETWORK_ERRORS + (api.APIError,) as exception:
+            error = str(exception) or repr(exception)
+        if error is None:
+            self._index(items)
+            return None
+        self._failure = (time.monotonic(), error)
+        return self._failure
+
+    def refresh(self):
+        """ load the definitions again, returns them """
+        with self._lock:
+            self._load()
+        return self.items
+
+    def set(self, items):
+        """ replace the definitions (e.g. loaded asynchronously) """
+        with self._lock:
+            self._index(items or [])
+
+    def _index(self, items):
+        by_id = {}
+        labels = {}
+        ids = {}
+        folded_ids = {}
+        for item in items:
+            item_id = int(item['id'])
+            by_id[item_id] = item
+            label = item.get(self.label_key)
+            labels[item_id] = label
+            if label is not None:
+                ids.setdefault(label, item_id)
+            for key in (self.label_key,) + self.name_keys:
+                value = item.get(key)
+                if isinstance(value, str):
+                    folded_ids.setdefault(value.casefold(), item_id)
+        # swap the indexes at once: readers never see a half built registry
+        self._by_id, self._labels, self._ids, self._folded_ids = by_id, labels, ids, folded_ids
+        self._items = tuple(items)
+        self._loaded = time.monotonic()
+        self._failure = None
+
+    def get(self, item_id):
+        """ returns the definition of item_id, raises KeyError if it is not defined """
+        self._ensure()
+        try:
+            return self._by_id[item_id]
+        except KeyError:
+            return self._by_id[int(item_id)]
+
+    def label(self, item_id):
+        """ returns the label of item_id, raises KeyError if it is not defined """
+        self._ensure()
+        try:
+            return self._labels[item_id]
+        except KeyError:
+            return self._labels[int(item_id)]
+
+    def id_of(self, text):
+        """ returns the id of a label, or of a name (case insensitive), raises KeyError if none matches """
+        self._ensure()
+        try:
+            return self._ids[text]
+        except KeyError:
+            return self._folded_ids[text.casefold()]
+
+    def __contains__(self, item_id):
+        self._ensure()
+        return item_id in self._by_id or (isinstance(item_id, str) and item_id.isdigit() and int(item_id) in self._by_id)
+
+    def labels(self, item_ids, default=None):
+        """ translate a list of ids into labels (default for the unknown ids) """
+        self._ensure()
+        labels = self._labels
+        return [labels.get(item_id, default) if isinstance(item_id, int) else labels.get(int(item_id), default) for item_id in item_ids]
+
+    def ids(self, texts, default=None):
+        """ translate a list of labels or names into ids (default for the unknown ones) """
+        self._ensure()
+        ids = self._ids
+        folded_ids = self._folded_ids
+        return [ids[text] if text in ids else folded_ids.get(text.casefold(), default) for text in texts]
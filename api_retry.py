@@ -0,0 +1,158 @@
+"""
+    retry policy of the TestRail API requests
+
+    A RetryPolicy decides whether a failed request (HTTP error status or
+    network error) is sent again, and after how long:
+
+        policy = RetryPolicy(max_tries=8, deadline=600, on_retry=print)
+        client = api.Client(URL, project_id, user, password, retry_policy=policy)
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import random
+import socket
+import threading
+import time
+
+# statuses retried by default: too many requests, bad gateway, service unavailable, gateway timeout
+RETRY_STATUSES = (429, 502, 503, 504)
+# POST methods which can be replayed without side effects
+IDEMPOTENT_PREFIXES = ('update_', 'close_', 'delete_', 'move_')
+
+def retry_after(headers):
+    """ returns the Retry-After header (seconds) as a float, None if missing or unusable """
+    try:
+        value = float(headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+def api_method(uri):
+    """ returns the API method name of a uri ('add_result_for_case/1/2' -> 'add_result_for_case') """
+    return uri.split('&', 1)[0].split('/', 1)[0]
+
+def is_connect_error(exception):
+    """ True when the request could not have reached the server (connection refused, dns failure) """
+    # urllib.error.URLError
+    if isinstance(getattr(exception, 'reason', None), BaseException):
+        exception = exception.reason
+    # aiohttp.ClientConnectorError
+    exception = getattr(exception, 'os_error', exception)
+    return isinstance(exception, (ConnectionRefusedError, socket.gaierror))
+
+class RetryPolicy:
+    """ when and how long to wait before sending a failed request again
+
+    Parameters
+    ----------
+    max_tries : int
+        maximum number of tries of a request (first one included)
+    statuses : iterable of ints
+        HTTP statuses which are retried
+    backoff : float
+        base delay (seconds): the n-th retry waits a random time between 0 and
+        backoff * 2 ** (n - 1) (exponential backoff with full jitter)
+    max_backoff : float
+        upper bound of the backoff delay
+    deadline : float
+        no retry is attempted if it would end more than deadline seconds after
+        the first try. None for no deadline.
+    network_errors : bool
+        retry on network errors (connection refused/reset, timeouts...)
+    idempotent_methods : iterable of str
+        POST API methods which can be replayed in addition to update_*,
+        close_*, delete_* and move_*. Other POSTs (add_*...) are only retried when the
+        server surely did not process them: 429 answers and connection errors.
+    on_retry : callable (optional)
+        called with a dict (http_method, uri, reason, tries, delay) before each
+        retry
+    """
+    def __init__(self, max_tries=5, statuses=RETRY_STATUSES, backoff=1.0, max_backoff=60.0, deadline=300.0,
+                 network_errors=True, idempotent_methods=(), on_retry=None):
+        assert max_tries >= 1, "max_tries must be at least 1"
+        self.max_tries = max_tries
+        self.statuses = frozenset(statuses)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.network_errors = network_errors
+        self.idempotent_methods = frozenset(idempotent_methods)
+        self.on_retry = on_retry
+        self.stats = {'retries': 0, 'gave_up': 0, 'reasons': {}}
+        self._lock = threading.Lock()
+
+    def is_idempotent(self, http_method, uri):
+        """ True when the request can be sent twice without side effects """
+        if http_method == 'GET':
+            return True
+        method = api_method(uri)
+        return method.startswith(IDEMPOTENT_PREFIXES) or method in self.idempotent_methods
+
+    def is_retryable(self, http_method, uri, status=None, error=None):
+        """ True when a request which failed with the HTTP status, or the network error, may be sent again """
+        idempotent = self.is_idempotent(http_method, uri)
+        if error is not None:
+            return self.network_errors and (idempotent or is_connect_error(error))
+        return status in self.statuses and (idempotent or status == 429)
+
+    def backoff_delay(self, tries):
+        """ random delay before the retry following the tries-th try """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (tries - 1)))
+
+    def start(self, http_method, uri):
+        """ returns the RetryState of a new request """
+        return RetryState(self, http_method, uri)
+
+    def _record(self, state, reason, delay):
+        with self._lock:
+            if delay is None:
+                self.stats['gave_up'] += 1
+                return
+            self.stats['retries'] += 1
+            self.stats['reasons'][reason] = self.stats['reasons'].get(reason, 0) + 1
+        if self.on_retry is not None:
+            self.on_retry({'http_method': state.http_method, 'uri': state.uri, 'reason': reason, 'tries': state.tries, 'delay': delay})
+
+class RetryState:
+    """ retry bookkeeping of one request, see RetryPolicy.start """
+    def __init__(self, policy, http_method, uri):
+        self.policy = policy
+        self.http_method = http_method
+        self.uri = uri
+        self.tries = 0
+        self.started = time.monotonic()
+        self.idempotent = policy.is_idempotent(http_method, uri)
+
+    def next_delay(self, answer=None, error=None):
+        """ returns how long to sleep before the next try, None if the request should not be retried
+
+        Parameters
+        ----------
+        answer : api_transport.Response
+            answer to the last try
+        error : Exception
+            network error raised by the last try
+        """
+        self.tries += 1
+        if error is not None:
+            if not self.policy.network_errors or not (self.idempotent or is_connect_error(error)):
+                return None
+            reason = type(error).__name__
+            delay = self.policy.backoff_delay(self.tries)
+        else:
+            if answer.status < 400:
+                return None
+            if answer.status not in self.policy.statuses or not (self.idempotent or answer.status == 429):
+                return None
+            reason = "status %s" % answer.status
+            delay = None
+            if answer.status == 429:
+                delay = retry_after(answer.headers)
+            if delay is None:
+                delay = self.policy.backoff_delay(self.tries)
+
+        if self.tries >= self.policy.max_tries:
+            delay = None
+        elif self.policy.deadline is not None and time.monotonic() + delay - self.started > self.policy.deadline:
+            delay = None
+        self.policy._record(self, reason, delay) # pylint: disable=protected-access
+        return delay
@@ -0,0 +1,187 @@
+"""
+    index of the section tree of a suite
+
+    get_sections returns a flat list linked by parent_id: SectionTree indexes it
+    once to look sections up by id or by path, and to walk subtrees, without
+    scanning the list again:
+
+        tree = client.section_tree(suite_id)           # cached, see api.Client.section_tree
+        tree.path(section_id)                          # ('Login', 'OAuth', 'Errors')
+        tree.id_of("Login > OAuth > Errors")           # or tree.id_of(['Login', 'OAuth', 'Errors'])
+        for section in tree.subtree(tree.id_of("Login")):
+            ...
+
+    The trees cached by a client are updated in place by add_section and
+    delete_section.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import threading
+
+class SectionTree:
+    """ id, path and parent -> children indexes of the sections of a suite
+
+    Sibling sections can have the same name: the path of such a name leads to
+    the first of them (in display order).
+
+    The tree can be read and updated (add, remove) by several threads: the
+    lookups take its lock, subtree and iteration walk a snapshot taken under it.
+
+    Parameters
+    ----------
+    sections : iterable of dicts
+        sections of a suite, as returned by get_sections / iter_sections
+    suite_id : int (optional)
+        id of the suite
+    separator : str
+        separator of the names in the string paths
+    """
+    def __init__(self, sections=(), suite_id=None, separator=" > "):
+        self.suite_id = suite_id
+        self.separator = separator
+        self._lock = threading.Lock()
+        self._by_id = {}
+        # {parent_id (None for the root sections): [section ids, in display order]}
+        self._children = {}
+        self._paths = {}
+        self._ids = {}
+        for section in sorted(sections, key=lambda section: (section.get('display_order') or 0, section['id'])):
+            self._by_id[section['id']] = section
+            self._children.setdefault(section.get('parent_id'), []).append(section['id'])
+        for section_id in self._by_id:
+            self._index_path(section_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, section_id):
+        return section_id in self._by_id
+
+    def __iter__(self):
+        """ the sections, depth first in display order """
+        with self._lock:
+            sections = [self._by_id[item_id] for root_id in self._children.get(None, ()) for item_id in self._subtree_ids(root_id)]
+        return iter(sections)
+
+    def _subtree_ids(self, section_id):
+        """ ids of section_id and its descendants, depth first in display order (under the lock) """
+        ids = []
+        stack = [section_id]
+        while stack:
+            current = stack.pop()
+            ids.append(current)
+            stack.extend(reversed(self._children.get(current, ())))
+        return ids
+
+    def _forget_paths(self, item_ids):
+        """ drop the paths of item_ids from the indexes (under the lock) """
+        for item_id in item_ids:
+            path = self._paths.pop(item_id, None)
+            if self._ids.get(path) == item_id:
+                del self._ids[path]
+
+    def _claim_paths(self, parent_id, name):
+        """ index the paths left free by a section named name of parent_id for its siblings with the same name (under the lock) """
+        for sibling_id in self._children.get(parent_id, ()):
+            if self._by_id[sibling_id]['name'] == name:
+                for item_id in self._subtree_ids(sibling_id):
+                    self._ids.setdefault(self._index_path(item_id), item_id)
+
+    def _index_path(self, section_id):
+        """ path of section_id, indexed with the paths of its ancestors """
+        path = self._paths.get(section_id)
+        if path is not None:
+            return path
+        # walk up to the closest ancestor whose path is known
+        chain = []
+        current = section_id
+        while current is not None and current not in self._paths:
+            chain.append(current)
+            parent_id = self._by_id[current].get('parent_id')
+            current = parent_id if parent_id in self._by_id else None
+        path = self._paths[current] if current is not None else ()
+        for item_id in reversed(chain):
+            path = path + (self._by_id[item_id]['name'],)
+            self._paths[item_id] = path
+            self._ids.setdefault(path, item_id)
+        return path
+
+    def split_path(self, path):
+        """ tuple of the names of path (tuple / list of names, or string joined by the separator) """
+        if isinstance(path, str):
+            return tuple(name.strip() for name in path.split(self.separator.strip()))
+        return tuple(path)
+
+    def get(self, section_id):
+        """ returns the section section_id, raises KeyError if it is not in the suite """
+        with self._lock:
+            return self._by_id[section_id]
+
+    def path(self, section_id):
+        """ tuple of the names from the root section down to section_id """
+        with self._lock:
+            return self._paths[section_id]
+
+    def path_str(self, section_id):
+        """ path of section_id joined by the separator """
+        return self.separator.join(self.path(section_id))
+
+    def id_of(self, path, default=None):
+        """ id of the section at path (tuple / list of names, or string joined by the separator), default if there is none """
+        path = self.split_path(path)
+        with self._lock:
+            return self._ids.get(path, default)
+
+    def children(self, section_id=None):
+        """ the child sections of section_id (the root sections for None) """
+        with self._lock:
+            return [self._by_id[child_id] for child_id in self._children.get(section_id, ())]
+
+    def subtree(self, section_id):
+        """ the section section_id and all its descendants, depth first in display order """
+        with self._lock:
+            sections = [self._by_id[item_id] for item_id in self._subtree_ids(section_id)]
+        return iter(sections)
+
+    def subtree_ids(self, section_id):
+        """ set of the ids of section_id and its descendants, e.g. to select the cases of a subtree """
+        with self._lock:
+            return set(self._subtree_ids(section_id))
+
+    def add(self, section):
+        """ index a section added to the suite (the answer of add_section), or update the section with its id """
+        with self._lock:
+            section_id = section['id']
+            old = self._by_id.get(section_id)
+            self._by_id[section_id] = section
+            if old is None:
+                self._children.setdefault(section.get('parent_id'), []).append(section_id)
+                self._index_path(section_id)
+                return
+            if old.get('parent_id') == section.get('parent_id') and old['name'] == section['name']:
+                return
+            # moved or renamed: index the paths of its subtree again
+            siblings = self._children.get(old.get('parent_id'), [])
+            if section_id in siblings:
+                siblings.remove(section_id)
+            self._children.setdefault(section.get('parent_id'), []).append(section_id)
+            moved = self._subtree_ids(section_id)
+            self._forget_paths(moved)
+            # the old path now leads to the subtree of a sibling with the same name, if any
+            self._claim_paths(old.get('parent_id'), old['name'])
+            for item_id in moved:
+                self._index_path(item_id)
+
+    def remove(self, section_id):
+        """ forget section_id and its descendants (delete_section deletes the subsections) """
+        with self._lock:
+            if section_id not in self._by_id:
+                return
+            section = self._by_id[section_id]
+            removed = self._subtree_ids(section_id)
+            self._children.get(section.get('parent_id'), []).remove(section_id)
+            self._forget_paths(removed)
+            for item_id in removed:
+                del self._by_id[item_id]
+                self._children.pop(item_id, None)
+            # the paths now lead to the subtree of a sibling with the same name, if any
+            self._claim_paths(section.get('parent_id'), section['name'])
@@ -0,0 +1,187 @@
+"""
+    persistent local copy of the cases and sections of test suites
+
+    The first sync of a suite downloads all its cases; the next ones only fetch
+    the cases updated since the previous sync (get_cases updated_after filter)
+    and merge them into the local copy:
+
+        store = CaseStore("testrail_cases.sqlite")
+        store.sync(client, suite_id)
+        for case in store.cases(suite_id, section_id=12):
+            ...
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import json
+import sqlite3
+import threading
+import time
+
+import api
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    suite_id INTEGER NOT NULL,
+    section_id INTEGER,
+    updated_on INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_suite ON cases (project_id, suite_id, section_id);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    suite_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_suite ON sections (project_id, suite_id);
+CREATE TABLE IF NOT EXISTS syncs (
+    project_id INTEGER NOT NULL,
+    suite_id INTEGER NOT NULL,
+    synced_at INTEGER NOT NULL,
+    PRIMARY KEY (project_id, suite_id)
+);
+"""
+
+class CaseStore:
+    """ sqlite copy of the cases and sections of suites, keyed by project / suite / section
+
+    Parameters
+    ----------
+    path : str
+        sqlite database file (":memory:" for a temporary store)
+    margin : int
+        seconds subtracted from the time of the last sync in the updated_after
+        filter, to absorb clock differences between the client and the server
+    """
+    def __init__(self, path, margin=300):
+        self.path = path
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """ close the database """
+        with self._lock:
+            self._db.close()
+
+    def synced_at(self, project_id, suite_id):
+        """ timestamp of the last sync of the suite, None if it was never synced """
+        with self._lock:
+            row = self._db.execute("SELECT synced_at FROM syncs WHERE project_id = ? AND suite_id = ?", (project_id, suite_id)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, client, suite_id, full=False, prefetch=True):
+        """ bring the local copy of suite_id up to date
+
+        Sections are always downloaded (there is no filter on their update
+        time). Cases are downloaded in full on the first sync or when full is
+        True, and only the cases updated since the last sync otherwise.
+        Deleted cases are only noticed by a full sync.
+
+        Parameters
+        ----------
+        client : api.Client
+            client of the project
+        suite_id : int
+            id of the suite
+        full : bool
+            download every case and drop the local cases which no longer exist
+        prefetch : bool
+            fetch the next page of cases while the current one is stored
+
+        Returns
+        -------
+        dict
+            full (bool), cases (number of cases fetched), sections, total
+            (number of cases in the local copy)
+        """
+        project_id = int(client.project_id)
+        started = int(time.time())
+        last = None if full else self.synced_at(project_id, suite_id)
+        filters = {}
+        if last is not None:
+            filters['updated_after'] = max(0, last - self.margin)
+
+        sections = [(section['id'], project_id, suite_id, section.get('parent_id'), json.dumps(section))
+                    for section in client.iter_sections(suite_id)]
+        fetched = 0
+        seen = []
+        batch = []
+        for case in client.iter_cases(suite_id, prefetch=prefetch, **filters):
+            batch.append((case['id'], project_id, suite_id, case.get('section_id'), case.get('updated_on'), json.dumps(case)))
+            seen.append(case['id'])
+            fetched += 1
+            if len(batch) >= 1000:
+                self._upsert_cases(batch)
+                batch = []
+
+        with self._lock, self._db:
+            if batch:
+                self._db.executemany("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?)", batch)
+            if last is None:
+                # full sync: drop the cases which were not returned
+                self._db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY)")
+                self._db.execute("DELETE FROM seen")
+                self._db.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((case_id,) for case_id in seen))
+                self._db.execute("DELETE FROM cases WHERE project_id = ? AND suite_id = ? AND id NOT IN (SELECT id FROM seen)", (project_id, suite_id))
+            self._db.execute("DELETE FROM sections WHERE project_id = ? AND suite_id = ?", (project_id, suite_id))
+            self._db.executemany("INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?)", sections)
+            self._db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)", (project_id, suite_id, started))
+            total = self._db.execute("SELECT COUNT(*) FROM cases WHERE project_id = ? AND suite_id = ?", (project_id, suite_id)).fetchone()[0]
+        api.logger.info("[api_store.CaseStore.sync] suite %s: %s sync, %s cases fetched, %s cases stored", suite_id, "full" if last is None else "incremental", fetched, total)
+        return {'full': last is None, 'cases': fetched, 'sections': len(sections), 'total': total}
+
+    def _upsert_cases(self, rows):
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def put_cases(self, project_id, suite_id, cases):
+        """ store cases written by the client (answers of add_case / update_case), without waiting for the next sync """
+        self._upsert_cases([(case['id'], project_id, suite_id, case.get('section_id'), case.get('updated_on'), json.dumps(case)) for case in cases])
+
+    def delete_cases(self, case_ids):
+        """ drop deleted cases from the local copy """
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM cases WHERE id = ?", ((case_id,) for case_id in case_ids))
+
+    def cases(self, suite_id, section_id=None, project_id=None):
+        """ iterate over the local cases of suite_id (optionally of section_id only)
+
+        Yields
+        ------
+        dict
+            cases, as returned by get_cases
+        """
+        query = "SELECT data FROM cases WHERE suite_id = ?"
+        params = [suite_id]
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        if section_id is not None:
+            query += " AND section_id = ?"
+            params.append(section_id)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id", params).fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def sections(self, suite_id, project_id=None):
+        """ list of the local sections of suite_id, as returned by get_sections """
+        query = "SELECT data FROM sections WHERE suite_id = ?"
+        params = [suite_id]
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id", params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_case(self, case_id):
+        """ returns the local copy of case_id, None if it is not stored """
+        with self._lock:
+            row = self._db.execute("SELECT data FROM cases WHERE id = ?", (case_id,)).fetchone()
+        return json.loads(row[0]) if row else None
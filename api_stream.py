@@ -0,0 +1,133 @@
+"""
+    incremental decoding of the json arrays of big API answers
+
+    The items of the array are decoded and yielded as the answer is read from
+    the socket: only one chunk of the answer and one item are in memory at a
+    time, whatever the size of the answer.
+
+        stream = JSONArrayStream(response, key='cases')
+        for case in stream:
+            ...
+        stream.meta     # other members of the answer ({'offset': 0, '_links': {...}})
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+
+class JSONArrayStream:
+    """ iterate over the items of a json array read from a file-like object
+
+    Parameters
+    ----------
+    fileobj : file-like object
+        binary stream, e.g. an http response
+    key : str (optional)
+        when the answer is an object, name of the member holding the array
+        (e.g. 'cases' for the paginated get_cases answers). The other members
+        are decoded into self.meta. Without key, the answer must be an array,
+        or it is decoded into self.meta.
+    chunk_size : int
+        size of the reads
+    """
+    def __init__(self, fileobj, key=None, chunk_size=2**16):
+        self.fileobj = fileobj
+        self.key = key
+        self.chunk_size = chunk_size
+        self.meta = {}
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """ read the next chunk, returns False at the end of the stream """
+        if self._eof:
+            return False
+        data = self.fileobj.read(self.chunk_size)
+        if not data:
+            self._eof = True
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(data, final=self._eof)
+        self._pos = 0
+        return not self._eof
+
+    def _peek(self):
+        """ returns the next non-whitespace character ('' at the end of the stream) """
+        while True:
+            buffer = self._buffer
+            length = len(buffer)
+            pos = self._pos
+            while pos < length and buffer[pos] in WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < length:
+                return buffer[pos]
+            if not self._fill() and self._pos >= len(self._buffer):
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError("invalid json: expected %r at %r" % (char, self._buffer[self._pos:self._pos + 40]))
+        self._pos += 1
+
+    def _value(self):
+        """ decode the next complete json value """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number cut by the end of the chunk ("1.5e" of "1.5e+20") decodes without error:
+            # a value is only complete when a delimiter follows it
+            if not self._eof and (end == len(self._buffer) or self._buffer[end] not in DELIMITERS):
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _array(self):
+        self._expect('[')
+        while True:
+            char = self._peek()
+            if char == ']':
+                self._pos += 1
+                return
+            if char == ',':
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError("invalid json: unterminated array")
+            yield self._value()
+
+    def __iter__(self):
+        char = self._peek()
+        if char == '[':
+            yield from self._array()
+            return
+        if char != '{' or self.key is None:
+            value = self._value()
+            self.meta = value if isinstance(value, dict) else {'value': value}
+            return
+        self._pos += 1
+        while True:
+            char = self._peek()
+            if char == '}':
+                self._pos += 1
+                return
+            if char == ',':
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError("invalid json: unterminated object")
+            name = self._value()
+            self._expect(':')
+            if name == self.key and self._peek() == '[':
+                yield from self._array()
+            else:
+                self.meta[name] = self._value()
@@ -0,0 +1,205 @@
+"""
+    idempotent synchronization of cases from a desired state
+
+    The desired cases (e.g. collected from the annotations of the test code)
+    are compared to a local snapshot of the suite (api_store.CaseStore, brought
+    up to date incrementally) by content hash: only the cases which differ are
+    written, with only their changed fields, in parallel under the rate
+    limiter of the client. A sync where nothing changed makes no write:
+
+        sync = CaseSync(client, suite_id, store=CaseStore("cases.sqlite"), key='custom_automation_id')
+        report = sync.sync([{'custom_automation_id': 'test_login.py::test_oauth', 'title': 'OAuth login',
+                             'section': "Login > OAuth", 'priority_id': 2}, ...], dry_run=True)
+        report['changes']     # [{'action': 'update', 'key': ..., 'case_id': 12, 'fields': {'priority_id': 2}}, ...]
+
+    The desired cases hold the key field, the title, the section (section_id,
+    or a 'section' path resolved with client.section_tree, created if needed)
+    and the other fields to manage, in the format of the get_cases answers.
+    The fields which are not given are left as they are.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import hashlib
+import json
+
+import api
+from api_store import CaseStore
+
+def _digest(fields):
+    """ content hash of fields (dict) """
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')).digest()
+
+class CaseSync:
+    """ diffs desired cases against a suite and writes the differences
+
+    Parameters
+    ----------
+    client : api.Client
+        client of the project of the suite
+    suite_id : int
+        id of the suite
+    store : api_store.CaseStore (optional)
+        snapshot of the suite; a persistent store makes the next syncs
+        incremental. Defaults to an in-memory store.
+    key : str
+        case field identifying the managed cases (e.g. a custom automation id
+        field); the cases without it are never touched
+    """
+    def __init__(self, client, suite_id, store=None, key='custom_automation_id'):
+        self.client = client
+        self.suite_id = suite_id
+        self.store = store if store is not None else CaseStore(":memory:")
+        self.key = key
+
+    def _sections(self, desired, dry_run, report):
+        """ section id of each desired case ('section' paths resolved), the path of the sections a dry run would create """
+        tree = None
+        section_ids = []
+        for case in desired:
+            if 'section' not in case:
+                section_ids.append(case.get('section_id'))
+                continue
+            if tree is None:
+                tree = self.client.section_tree(self.suite_id)
+            section_id = tree.id_of(case['section'])
+            if section_id is None:
+                path = tree.split_path(case['section'])
+                if path not in report['sections_added']:
+                    report['sections_added'].append(path)
+                section_id = path if dry_run else self.client.ensure_section(self.suite_id, path)
+            section_ids.append(section_id)
+        return section_ids
+
+    def diff(self, desired, delete=False, dry_run=True, report=None):
+        """ the writes which bring the suite to the desired state
+
+        Parameters
+        ----------
+        desired : iterable of dicts
+            desired cases, see the module
+        delete : bool
+            also delete the managed cases (with a key) which are not desired
+
+        Returns
+        -------
+        list of dicts
+            action ('add', 'update', 'move', 'delete'), key, case_id,
+            section_id (path of the section in a dry run, when it does not
+            exist yet), fields
+        """
+        report = report if report is not None else {'sections_added': [], 'unchanged': 0, 'errors': []}
+        desired = list(desired)
+        current = {}
+        for case in self.store.cases(self.suite_id, project_id=int(self.client.project_id)):
+            if case.get(self.key) is not None:
+                current.setdefault(case[self.key], case)
+        changes = []
+        seen = set()
+        for case, section_id in zip(desired, self._sections(desired, dry_run, report)):
+            key = case.get(self.key)
+            if key is None or key in seen:
+                report['errors'].append({'action': None, 'key': key, 'error': "missing key" if key is None else "duplicated key"})
+                continue
+            seen.add(key)
+            fields = {name: api.case_field_value(value) for name, value in case.items() if name not in ('section', 'section_id', 'id')}
+            existing = current.get(key)
+            if existing is None:
+                changes.append({'action': 'add', 'key': key, 'case_id': None, 'section_id': section_id, 'fields': fields})
+                continue
+            if _digest(fields) != _digest({name: existing.get(name) for name in fields}):
+                changes.append({'action': 'update', 'key': key, 'case_id': existing['id'], 'section_id': section_id,
+                                'fields': {name: value for name, value in fields.items() if existing.get(name) != value}})
+            elif section_id is None or section_id == existing.get('section_id'):
+                report['unchanged'] += 1
+            if section_id is not None and section_id != existing.get('section_id'):
+                changes.append({'action': 'move', 'key': key, 'case_id': existing['id'], 'section_id': section_id, 'fields': {}})
+        if delete:
+            changes.extend({'action': 'delete', 'key': key, 'case_id': case['id'], 'section_id': case.get('section_id'), 'fields': {}}
+                           for key, case in current.items() if key not in seen)
+        return changes
+
+    def sync(self, desired, dry_run=False, delete=False, refresh=True):
+        """ write the differences between the desired cases and the suite
+
+        Parameters
+        ----------
+        desired : iterable of dicts
+            desired cases, see the module
+        dry_run : bool
+            only report the changes, write nothing (sections included)
+        delete : bool
+            also delete the managed cases (with a key) which are not desired
+        refresh : bool
+            bring the snapshot up to date first (incremental, see
+            api_store.CaseStore.sync)
+
+        Returns
+        -------
+        dict
+            dry_run, added, updated, moved, deleted (counts of the successful
+            writes, or of the planned ones in a dry run), unchanged,
+            sections_added (paths), changes (see diff), errors
+            ({action, key, error} of the failed writes and invalid cases)
+        """
+        if refresh:
+            self.store.sync(self.client, self.suite_id)
+        report = {'dry_run': dry_run, 'added': 0, 'updated': 0, 'moved': 0, 'deleted': 0, 'unchanged': 0,
+                  'sections_added': [], 'changes': [], 'errors': []}
+        changes = self.diff(desired, delete, dry_run, report)
+        report['changes'] = changes
+        counts = {'add': 'added', 'update': 'updated', 'move': 'moved', 'delete': 'deleted'}
+        if dry_run:
+            for change in changes:
+                report[counts[change['action']]] += 1
+            return report
+
+        futures = []
+        for change in changes:
+            if change['action'] == 'add':
+                fields = dict(change['fields'])
+                futures.append((change, self.client.submit(self.client.add_case, change['section_id'], fields.pop('title', None), **fields)))
+            elif change['action'] == 'update':
+                futures.append((change, self.client.submit(self.client.update_case, change['case_id'], **change['fields'])))
+            elif change['action'] == 'delete':
+                futures.append((change, self.client.submit(self.client.delete_case, change['case_id'])))
+        # one request per target section for the moves
+        moves = {}
+        for change in changes:
+            if change['action'] == 'move':
+                moves.setdefault(change['section_id'], []).append(change)
+        move_futures = [(group, self.client.submit(self.client.move_cases_to_section, section_id, self.suite_id, [change['case_id'] for change in group]))
+                        for section_id, group in moves.items()]
+
+        project_id = int(self.client.project_id)
+        written = []
+        deleted = []
+        for change, future in futures:
+            try:
+                answer = future.result()
+                if answer is None:
+                    raise api.APIError("%s_case request failed" % change['action'])
+            except api.NETWORK_ERRORS + (api.APIError,) as exception:
+                report['errors'].append({'action': change['action'], 'key': change['key'], 'error': str(exception) or repr(exception)})
+                continue
+            report[counts[change['action']]] += 1
+            if change['action'] == 'delete':
+                deleted.append(change['case_id'])
+            else:
+                written.append(answer)
+        # the snapshot follows the writes: the next sync does not need to fetch them to find nothing to do
+        self.store.put_cases(project_id, self.suite_id, written)
+        self.store.delete_cases(deleted)
+        for group, future in move_futures:
+            try:
+                if future.result() is None:
+                    raise api.APIError("move_cases_to_section request failed")
+            except api.NETWORK_ERRORS + (api.APIError,) as exception:
+                report['errors'].extend({'action': 'move', 'key': change['key'], 'error': str(exception) or repr(exception)} for change in group)
+                continue
+            report['moved'] += len(group)
+            moved = [self.store.get_case(change['case_id']) for change in group]
+            self.store.put_cases(project_id, self.suite_id, [dict(case, section_id=group[0]['section_id']) for case in moved if case is not None])
+        if report['errors']:
+            api.logger.error("[api_sync.CaseSync.sync] suite %s: %s error(s): %s", self.suite_id, len(report['errors']), report['errors'][:10])
+        api.logger.info("[api_sync.CaseSync.sync] suite %s: %s added, %s updated, %s moved, %s deleted, %s unchanged",
+                        self.suite_id, report['added'], report['updated'], report['moved'], report['deleted'], report['unchanged'])
+        return report
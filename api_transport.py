@@ -0,0 +1,381 @@
+"""
+    HTTP transports used by api.Client
+
+    A transport sends one HTTP request and hands back a Response tuple
+    (status, headers, body), whatever the status code is. Retrying,
+    authentication and json decoding stay in api.Client, so transports can be
+    swapped without changing the semantics of send_get / send_post.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import collections
+import http.client
+import select
+import threading
+import time
+import urllib.parse
+
+Response = collections.namedtuple('Response', ['status', 'headers', 'body'])
+
+class StreamedResponse:
+    """ answer whose body is read on demand, see Transport.open
+
+    Attributes
+    ----------
+    status : int
+        http status
+    headers :
+        answer headers
+    """
+    def __init__(self, status, headers, fileobj, release=None):
+        self.status = status
+        self.headers = headers
+        self._fileobj = fileobj
+        self._release = release
+
+    def read(self, size=None):
+        """ read up to size bytes of the body (all of it by default) """
+        if size is None:
+            return self._fileobj.read()
+        return self._fileobj.read(size)
+
+    def close(self):
+        """ release the connection; the unread part of the body is dropped """
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Transport:
+    """ base class of the HTTP transports """
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """ send a request and return a Response(status, headers, body)
+
+        Parameters
+        ----------
+        method : str
+            http method ('GET' or 'POST')
+        url : str
+            full url of the request
+        body : bytes (optional)
+            request payload
+        headers : dict (optional)
+            request headers
+        timeout : float (optional)
+            socket timeout in seconds
+
+        Returns
+        -------
+        Response
+            namedtuple (status, headers, body). Network errors are raised
+            (OSError, http.client.HTTPException), HTTP errors are not.
+        """
+        raise NotImplementedError("Not implemented")
+
+    def open(self, method, url, body=None, headers=None, timeout=None):
+        """ send a request and return a StreamedResponse, whose body is read on demand
+
+        Same parameters as request. The StreamedResponse must be closed (or
+        used as a context manager) to release its connection.
+        """
+        raise NotImplementedError("Not implemented")
+
+    def close(self):
+        """ release any connection held by the transport """
+
+def import_aiohttp():
+    """ returns the aiohttp module, None when it is not installed
+
+    aiohttp (like asyncio and urllib.request) is slow to import: it is only
+    imported when an asynchronous transport is used.
+    """
+    try:
+        import aiohttp # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return aiohttp
+
+class UrllibTransport(Transport):
+    """ one connection per request through urllib.request.urlopen """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        import urllib.error # pylint: disable=import-outside-toplevel
+        import urllib.request # pylint: disable=import-outside-toplevel
+        request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+        kwargs = {}
+        if timeout or self.timeout:
+            kwargs['timeout'] = timeout or self.timeout
+        try:
+            with urllib.request.urlopen(request, **kwargs) as response:
+                return Response(response.getcode(), response.headers, response.read())
+        except urllib.error.HTTPError as exception:
+            return Response(exception.code, exception.headers, exception.read())
+
+    def open(self, method, url, body=None, headers=None, timeout=None):
+        import urllib.error # pylint: disable=import-outside-toplevel
+        import urllib.request # pylint: disable=import-outside-toplevel
+        request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+        kwargs = {}
+        if timeout or self.timeout:
+            kwargs['timeout'] = timeout or self.timeout
+        try:
+            response = urllib.request.urlopen(request, **kwargs)
+            return StreamedResponse(response.getcode(), response.headers, response, response.close)
+        except urllib.error.HTTPError as exception:
+            return StreamedResponse(exception.code, exception.headers, exception, exception.close)
+
+def connection_dropped(conn):
+    """ True when the server closed (or wrote on) the idle connection conn, which can't be reused
+
+    An idle keep-alive connection has nothing to read: if its socket is
+    readable, the server sent its FIN (or garbage) while it was idle.
+    """
+    sock = conn.sock
+    if sock is None:
+        # not connected: http.client connects on the next request
+        return False
+    try:
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+class PooledTransport(Transport):
+    """ keep-alive connection pool on top of http.client
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of concurrent connections per host. Callers block
+        until a connection is available.
+    idle_timeout : float
+        idle connections older than this (seconds) are closed instead of
+        being reused; below the keep-alive timeout of the common servers
+        (Apache: 5 seconds). An idle connection which the server closed
+        earlier is detected and replaced before it is used.
+    timeout : float
+        default socket timeout in seconds
+    ssl_context : ssl.SSLContext (optional)
+        context used for https connections
+    """
+    # errors raised when the server closed a kept-alive connection while it was idle
+    STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+    def __init__(self, maxsize=10, idle_timeout=4.0, timeout=60.0, ssl_context=None):
+        assert maxsize > 0, "maxsize must be a positive int"
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.stats = {'created': 0, 'reused': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+
+    def _slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.maxsize)
+            return self._slots[key]
+
+    def _checkout(self, key):
+        """ returns the most recently used idle connection for key, or None """
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout and not connection_dropped(conn):
+                    self.stats['reused'] += 1
+                    return conn
+                self.stats['evicted'] += 1
+                conn.close()
+        return None
+
+    def _checkin(self, key, conn):
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            # evict the connections which have been idle for too long (oldest first)
+            while idle and now - idle[0][1] > self.idle_timeout:
+                idle.pop(0)[0].close()
+                self.stats['evicted'] += 1
+            idle.append((conn, now))
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        with self._lock:
+            self.stats['created'] += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _key_path(self, url):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return key, path
+
+    def _getresponse(self, key, method, path, body, headers, timeout):
+        """ returns (connection, http.client.HTTPResponse), the headers of the answer are read
+
+        A reused connection which turns out to be closed by the server is
+        replaced by a fresh one and the request sent again when the request
+        could not be sent, or is a GET. A POST which was sent may have been
+        processed: its error is raised, for the RetryPolicy of the client to
+        decide.
+        """
+        conn = self._checkout(key)
+        reused = conn is not None
+        if not reused:
+            conn = self._connect(key, timeout)
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            sent = True
+            return conn, conn.getresponse()
+        except self.STALE_ERRORS:
+            conn.close()
+            if not reused or (sent and method != 'GET'):
+                raise
+        except Exception:
+            conn.close()
+            raise
+        # the server dropped the idle connection: resend on a fresh one
+        conn = self._connect(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _release(self, key, conn, response):
+        """ give the connection back to the pool if its answer was read completely """
+        if response.isclosed() and not response.will_close:
+            self._checkin(key, conn)
+        else:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        key, path = self._key_path(url)
+        slot = self._slot(key)
+        slot.acquire()
+        try:
+            conn, response = self._getresponse(key, method, path, body, headers, timeout or self.timeout)
+            try:
+                data = response.read()
+            except Exception:
+                conn.close()
+                raise
+            self._release(key, conn, response)
+            return Response(response.status, response.msg, data)
+        finally:
+            slot.release()
+
+    def open(self, method, url, body=None, headers=None, timeout=None):
+        key, path = self._key_path(url)
+        slot = self._slot(key)
+        slot.acquire()
+        try:
+            conn, response = self._getresponse(key, method, path, body, headers, timeout or self.timeout)
+        except Exception:
+            slot.release()
+            raise
+
+        def release():
+            try:
+                self._release(key, conn, response)
+            finally:
+                slot.release()
+        return StreamedResponse(response.status, response.msg, response, release)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle = {}
+
+class AsyncTransport:
+    """ base class of the asyncio HTTP transports, see Transport.request """
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        """ send a request and return a Response(status, headers, body) """
+        raise NotImplementedError("Not implemented")
+
+    async def close(self):
+        """ release any connection held by the transport """
+
+class ThreadedTransport(AsyncTransport):
+    """ runs a blocking Transport in the default executor of the event loop
+
+    Parameters
+    ----------
+    transport : Transport (optional)
+        blocking transport, defaults to a PooledTransport
+    """
+    def __init__(self, transport=None):
+        self.transport = transport if transport is not None else PooledTransport()
+
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        import asyncio # pylint: disable=import-outside-toplevel
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.transport.request, method, url, body, headers, timeout)
+
+    async def close(self):
+        self.transport.close()
+
+class AiohttpTransport(AsyncTransport):
+    """ keep-alive connection pool on top of aiohttp (optional dependency)
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of concurrent connections per host
+    idle_timeout : float
+        idle connections are closed after this many seconds
+    timeout : float
+        default total timeout of a request in seconds
+    """
+    def __init__(self, maxsize=10, idle_timeout=30.0, timeout=60.0):
+        self.aiohttp = import_aiohttp()
+        if self.aiohttp is None:
+            raise ImportError("AiohttpTransport requires aiohttp (pip install aiohttp)")
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # the session has to be created inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = self.aiohttp.TCPConnector(limit_per_host=self.maxsize, keepalive_timeout=self.idle_timeout)
+            self._session = self.aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        client_timeout = self.aiohttp.ClientTimeout(total=timeout or self.timeout)
+        async with self._get_session().request(method, url, data=body, headers=headers, timeout=client_timeout) as response:
+            return Response(response.status, response.headers, await response.read())
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+def default_async_transport(maxsize=10):
+    """ AiohttpTransport when aiohttp is installed, a threaded PooledTransport otherwise """
+    if import_aiohttp() is not None:
+        return AiohttpTransport(maxsize=maxsize)
+    return ThreadedTransport(PooledTransport(maxsize=maxsize))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+    benchmarks of the API client against a local stub TestRail server
+
+    Usage:
+        $ python3 bench.py transport --requests 2000
+        $ python3 bench.py startup --runs 20
+        $ python3 bench.py stream-memory --size-mb 500
+        $ python3 bench.py models --cases 300000
+        $ python3 bench.py suite --latency 0.002 --throttle 0.01 --output reports/today.json --compare reports/last.json
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+from api_crawl import Crawler
+from api_metrics import Metrics
+from api_models import Case
+from api_ratelimit import RateLimiter
+from api_transport import PooledTransport, UrllibTransport
+from stub_server import FakeTestRail, StubServer, synthetic_cases
+
+def _run(client, requests, threads):
+    """ send `requests` get_case calls, returns the elapsed time """
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(client.get_case, range(requests)))
+    else:
+        for case_id in range(requests):
+            client.get_case(case_id)
+    return time.perf_counter() - start
+
+def bench_transport(args):
+    """ requests/sec of get_case with a new connection per request vs the keep-alive pool """
+    server = StubServer()
+    url = server.start()
+    try:
+        transports = [
+            ("urllib (connection per request)", UrllibTransport()),
+            ("pooled (keep-alive)", PooledTransport(maxsize=max(args.threads, 1))),
+        ]
+        print("{0} get_case requests, {1} thread(s)".format(args.requests, args.threads))
+        for name, transport in transports:
+            client = api.Client(url, 1, user="user", password="password", transport=transport)
+            elapsed = _run(client, args.requests, args.threads)
+            transport.close()
+            print("{0:<35} {1:>10.1f} req/s".format(name, args.requests / elapsed))
+    finally:
+        server.stop()
+
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+client = api.Client(%r, 1, user="user", password="password")
+created = time.perf_counter()
+print(imported - start, created - imported)
+"""
+
+def bench_startup(args):
+    """ import time of api and creation time of a Client, in fresh interpreters """
+    server = StubServer()
+    url = server.start()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    imports, inits, processes = [], [], []
+    try:
+        # run from an empty directory: no config file
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                output = subprocess.run([sys.executable, '-c', STARTUP_CODE % url], cwd=directory, env=env,
+                                        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+                processes.append(time.perf_counter() - start)
+                imported, created = output.split()
+                imports.append(float(imported))
+                inits.append(float(created))
+    finally:
+        server.stop()
+    print("{0} runs, median times".format(args.runs))
+    print("{0:<35} {1:>10.2f} ms".format("import api", statistics.median(imports) * 1000))
+    print("{0:<35} {1:>10.2f} ms".format("api.Client()", statistics.median(inits) * 1000))
+    print("{0:<35} {1:>10.2f} ms".format("whole process", statistics.median(processes) * 1000))
+    print("{0:<35} {1:>10}".format("requests sent by api.Client()", sum(server.calls.values()) // args.runs))
+
+STREAM_CODE = """
+import resource, sys, time
+import api
+client = api.Client(%r, 1, user="user", password="password")
+start = time.perf_counter()
+if sys.argv[1] == "stream":
+    count = sum(1 for case in client.stream_get("get_cases/1&suite_id=1", "cases"))
+else:
+    count = len(client.send_get("get_cases/1&suite_id=1")["cases"])
+print(count, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+class SyntheticCasesServer(StubServer):
+    """ get_cases answers a single page of size bytes of synthetic cases """
+    size = 0
+
+    def api(self, http_method, method, uri, data):
+        if method == 'get_cases':
+            return 200, synthetic_cases(self.size)
+        return super().api(http_method, method, uri, data)
+
+def bench_stream_memory(args):
+    """ peak memory of decoding a big get_cases answer with send_get vs stream_get """
+    server = SyntheticCasesServer()
+    server.size = args.size_mb * 2**20
+    url = server.start()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    print("get_cases answer of {0} MB".format(args.size_mb))
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in args.modes:
+                output = subprocess.run([sys.executable, '-c', STREAM_CODE % url, mode], cwd=directory, env=env,
+                                        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+                count, elapsed, maxrss = output.split()
+                print("{0:<12} {1:>10} cases {2:>8.1f} s {3:>10.1f} MB peak RSS".format(mode, count, float(elapsed), int(maxrss) / 1024))
+    finally:
+        server.stop()
+
+def case_pages(cases, page_size=250):
+    """ json pages of realistic get_cases answers (all the standard fields, a few custom ones) """
+    for offset in range(0, cases, page_size):
+        page = []
+        for case_id in range(offset + 1, min(offset + page_size, cases) + 1):
+            page.append({
+                'id': case_id, 'title': 'Verify the behaviour of feature %d' % case_id, 'section_id': case_id // 50,
+                'template_id': 1, 'type_id': case_id % 7, 'priority_id': case_id % 4 + 1, 'milestone_id': None,
+                'refs': 'JIRA-%d' % (case_id // 1000), 'created_by': 1, 'created_on': 1600000000 + case_id,
+                'updated_by': 2, 'updated_on': 1610000000 + case_id, 'estimate': '30s', 'estimate_forecast': None,
+                'suite_id': 1, 'display_order': case_id, 'is_deleted': 0,
+                'custom_automation_type': 0, 'custom_preconds': None, 'custom_component': 'storage',
+                'custom_steps': 'Step 1: set up the cluster\nStep 2: run case %d' % case_id,
+                'custom_expected': 'The operation succeeds', 'custom_steps_separated': None, 'custom_mission': None, 'custom_goals': None,
+            })
+        yield json.dumps({'offset': offset, 'limit': page_size, 'size': len(page), 'cases': page})
+
+def _measure(build, cases):
+    """ build time, and memory held by the list returned by build (measured in a second, traced, build) """
+    gc.collect()
+    start = time.perf_counter()
+    items = build(case_pages(cases))
+    elapsed = time.perf_counter() - start
+    del items
+    gc.collect()
+    tracemalloc.start()
+    items = build(case_pages(cases))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return items, size, elapsed
+
+def bench_models(args):
+    """ memory held by a suite of cases as dicts vs api_models.Case records """
+    builds = {
+        'dict': lambda pages: [case for page in pages for case in json.loads(page)['cases']],
+        'Case': lambda pages: [Case.from_dict(case) for page in pages for case in json.loads(page)['cases']],
+    }
+    print("{0} cases".format(args.cases))
+    for name, build in builds.items():
+        items, size, elapsed = _measure(build, args.cases)
+        start = time.perf_counter()
+        titles = sum(len(item['title']) for item in items)
+        read = time.perf_counter() - start
+        print("{0:<8} {1:>10.1f} MB {2:>8.0f} bytes/case {3:>8.2f} s to build {4:>8.3f} s to read {5} titles".format(
+            name, size / 2**20, size / args.cases, elapsed, read, titles and len(items)))
+        del items
+
+SUITE_SCENARIOS = ('get_cases', 'get_tests', 'add_results', 'crawl')
+SUITE_PATHS = ('sync', 'pooled', 'threaded', 'async')
+
+def _suite_runs(server):
+    """ ids of the runs of the fake project (standalone and in plans) """
+    return list(range(1, server.runs + 1)) + [plan_id * 1000 + index for plan_id in range(1, server.plans + 1) for index in range(server.runs_per_plan)]
+
+def _suite_results(server, count):
+    return [{'case_id': index + 1, 'status_id': index % 5 + 1, 'comment': 'result %d' % index, 'elapsed': '3s'} for index in range(count)]
+
+def _suite_sync(scenario, client, server, args, threaded, directory):
+    """ run a scenario with api.Client, returns the number of items read or written """
+    suites = range(1, server.suites + 1)
+    runs = _suite_runs(server)
+    if scenario == 'get_cases':
+        count = lambda suite_id: sum(1 for _ in client.iter_cases(suite_id, prefetch=threaded))
+        items = suites
+    elif scenario == 'get_tests':
+        count = lambda run_id: sum(1 for _ in client.iter_tests(run_id, prefetch=threaded))
+        items = runs
+    elif scenario == 'add_results':
+        results = _suite_results(server, args.results)
+        if threaded:
+            return sum(client.bulk_add_results_for_cases(run_id, results, max_workers=args.threads)['uploaded'] for run_id in runs)
+        count = lambda run_id: sum(len(client.add_results_for_cases(run_id, results[start:start + 250]))
+                                   for start in range(0, len(results), 250))
+        items = runs
+    else:
+        # without --rate, the crawler still needs a limiter: an unreachable one
+        limiter = client.rate_limiter or RateLimiter(requests_per_minute=10**9, burst=10**6)
+        report = Crawler(client, directory, max_workers=args.threads if threaded else 1, rate_limiter=limiter, prefetch=threaded).crawl()
+        return sum(report['items'].values())
+    if threaded:
+        with ThreadPoolExecutor(args.threads) as pool:
+            return sum(pool.map(count, items))
+    return sum(count(item) for item in items)
+
+async def _suite_async(scenario, client, server, args):
+    """ run a scenario with api_async.AsyncClient, returns the number of items read or written """
+    async def count(iterator):
+        total = 0
+        async for _ in iterator:
+            total += 1
+        return total
+
+    runs = _suite_runs(server)
+    async with client:
+        if scenario == 'get_cases':
+            return sum(await asyncio.gather(*[count(client.iter_cases(suite_id, prefetch=True)) for suite_id in range(1, server.suites + 1)]))
+        if scenario == 'get_tests':
+            return sum(await asyncio.gather(*[count(client.iter_tests(run_id, prefetch=True)) for run_id in runs]))
+        results = _suite_results(server, args.results)
+        reports = await asyncio.gather(*[client.bulk_add_results_for_cases(run_id, results, max_workers=args.threads) for run_id in runs])
+        return sum(report['uploaded'] for report in reports)
+
+def _suite_case(scenario, path, args):
+    """ run one scenario on one path against a new fake server, returns its measurements """
+    server = FakeTestRail(suites=args.suites, cases=args.cases, tests_per_run=args.tests_per_run, page_size=args.page_size,
+                          latency=args.latency, throttle_rate=args.throttle, case_bytes=args.case_bytes)
+    url = server.start()
+    metrics = Metrics()
+    limiter = RateLimiter(requests_per_minute=args.rate, burst=args.threads) if args.rate else None
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            if path == 'async':
+                import api_async # pylint: disable=import-outside-toplevel
+                client = api_async.AsyncClient(url, 1, user="user", password="password", rate_limiter=limiter, metrics=metrics, max_concurrency=args.threads)
+                items = asyncio.run(_suite_async(scenario, client, server, args))
+            else:
+                transport = UrllibTransport() if path == 'sync' else PooledTransport(maxsize=args.threads)
+                client = api.Client(url, 1, user="user", password="password", transport=transport, rate_limiter=limiter, metrics=metrics)
+                items = _suite_sync(scenario, client, server, args, path == 'threaded', directory)
+                client.close()
+            elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    methods = metrics.snapshot()
+    # latency of the method the scenario calls the most
+    main_method = max(methods.values(), key=lambda entry: entry['requests'])
+    requests = sum(entry['requests'] + entry['retries'] for entry in methods.values())
+    return {
+        'scenario': scenario, 'path': path, 'seconds': elapsed, 'items': items, 'items_per_s': items / elapsed,
+        'requests': requests, 'requests_per_s': requests / elapsed, 'p50_ms': main_method['p50'] * 1000, 'p99_ms': main_method['p99'] * 1000,
+        'throttled': sum(entry['throttled'] for entry in methods.values()),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(args):
+    """ throughput and latency of the main scenarios on the sync, pooled, threaded and async paths """
+    config = {name: getattr(args, name) for name in ('suites', 'cases', 'tests_per_run', 'results', 'page_size', 'latency', 'throttle', 'case_bytes', 'threads', 'rate')}
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        previous = {(entry['scenario'], entry['path']): entry for entry in old['results']}
+        if old['meta']['config'] != config:
+            print("warning: {0} was run with another configuration: {1}".format(args.compare, old['meta']['config']))
+    print("{0:<12} {1:<9} {2:>9} {3:>10} {4:>9} {5:>9} {6:>9} {7:>9}{8}".format(
+        "scenario", "path", "seconds", "items/s", "req/s", "p50 ms", "p99 ms", "429s", "  vs previous" if previous else ""))
+    results = []
+    skipped = []
+    for scenario in args.scenarios:
+        for path in args.paths:
+            if scenario == 'crawl' and path == 'async':
+                skipped.append({'scenario': scenario, 'path': path, 'reason': "the crawler runs on threads"})
+                print("{0:<12} {1:<9} {2:>9}  ({3})".format(scenario, path, "skipped", skipped[-1]['reason']))
+                continue
+            entry = _suite_case(scenario, path, args)
+            results.append(entry)
+            delta = ""
+            if (scenario, path) in previous:
+                delta = "  {0:+.1f}%".format((entry['items_per_s'] / previous[(scenario, path)]['items_per_s'] - 1) * 100)
+            print("{scenario:<12} {path:<9} {seconds:>9.2f} {items_per_s:>10.0f} {requests_per_s:>9.0f} {p50_ms:>9.2f} {p99_ms:>9.2f} {throttled:>9}".format(**entry) + delta)
+    if args.output:
+        report = {
+            'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': _git_commit(), 'python': platform.python_version(),
+                     'platform': platform.platform(), 'config': config},
+            'results': results,
+            'skipped': skipped,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("report written to {0}".format(args.output))
+
+def main():
+    """ command line entry point """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    transport = commands.add_parser('transport', help=bench_transport.__doc__)
+    transport.add_argument('--requests', type=int, default=2000)
+    transport.add_argument('--threads', type=int, default=1)
+    transport.set_defaults(func=bench_transport)
+
+    startup = commands.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('--runs', type=int, default=20)
+    startup.set_defaults(func=bench_startup)
+
+    stream = commands.add_parser('stream-memory', help=bench_stream_memory.__doc__)
+    stream.add_argument('--size-mb', type=int, default=500)
+    stream.add_argument('--modes', nargs='+', choices=['stream', 'send_get'], default=['stream', 'send_get'])
+    stream.set_defaults(func=bench_stream_memory)
+
+    models = commands.add_parser('models', help=bench_models.__doc__)
+    models.add_argument('--cases', type=int, default=300000)
+    models.set_defaults(func=bench_models)
+
+    suite = commands.add_parser('suite', help=bench_suite.__doc__)
+    suite.add_argument('--scenarios', nargs='+', choices=SUITE_SCENARIOS, default=list(SUITE_SCENARIOS))
+    suite.add_argument('--paths', nargs='+', choices=SUITE_PATHS, default=list(SUITE_PATHS))
+    suite.add_argument('--suites', type=int, default=2)
+    suite.add_argument('--cases', type=int, default=20000, help="cases per suite")
+    suite.add_argument('--tests-per-run', type=int, default=5000)
+    suite.add_argument('--results', type=int, default=2500, help="results posted per run")
+    suite.add_argument('--page-size', type=int, default=250)
+    suite.add_argument('--case-bytes', type=int, default=300)
+    suite.add_argument('--latency', type=float, default=0.002, help="seconds added by the server to every answer")
+    suite.add_argument('--throttle', type=float, default=0.0, help="fraction of the requests answered 429")
+    suite.add_argument('--threads', type=int, default=8)
+    suite.add_argument('--rate', type=float, default=0, help="client rate limit (requests per minute), 0 for none")
+    suite.add_argument('--output', help="write the report (json) to this file")
+    suite.add_argument('--compare', help="report of a previous run to compare with")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
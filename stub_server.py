@@ -0,0 +1,261 @@
+"""
+    local stub of the TestRail API (index.php?/api/v2/) for benchmarks
+
+    Usage:
+        server = StubServer()
+        url = server.start()
+        client = api.Client(url, 1, user="user", password="password")
+        ...
+        server.stop()
+
+    FakeTestRail serves a synthetic paginated project, with configurable
+    latency and 429 answers.
+"""
+# pylint: disable=line-too-long, invalid-name, trailing-whitespace
+import json
+import random
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/index.php?/api/v2/'
+
+def synthetic_cases(total_bytes, case_bytes=1024, key='cases'):
+    """ generator of the json (bytes) of a single page of about total_bytes of cases """
+    yield b'{"offset": 0, "limit": 0, "size": 0, "_links": {"next": null, "prev": null}, "' + key.encode() + b'": ['
+    filler = 'x' * max(0, case_bytes - 160)
+    sent = 0
+    case_id = 0
+    while sent < total_bytes:
+        case_id += 1
+        case = {'id': case_id, 'title': 'case %d' % case_id, 'section_id': case_id % 100, 'suite_id': 1,
+                'priority_id': 2, 'type_id': 1, 'updated_on': 1600000000, 'custom_steps': filler}
+        chunk = (', ' if case_id > 1 else '') + json.dumps(case)
+        sent += len(chunk)
+        yield chunk.encode()
+    yield b']}'
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ answers every API method with canned json, keeping connections alive """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately: avoid the Nagle / delayed ack stall on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+    def _answer(self, status, payload, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        if isinstance(payload, types.GeneratorType):
+            # json produced piece by piece (bytes): sent chunked, never held in memory
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in payload:
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        body = bytes(json.dumps(payload), 'utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, http_method):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = json.loads(self.rfile.read(length)) if length else None
+        if not self.path.startswith(API_PREFIX):
+            self._answer(404, {'error': 'unknown path %s' % self.path})
+            return
+        uri = self.path[len(API_PREFIX):]
+        method = uri.split('&')[0].split('/')[0]
+        self.server.count(method)
+        self._answer(*self.server.api(http_method, method, uri, data))
+
+    def do_GET(self):
+        """ GET requests """
+        self._dispatch('GET')
+
+    def do_POST(self):
+        """ POST requests """
+        self._dispatch('POST')
+
+class StubServer(ThreadingHTTPServer):
+    """ in-process TestRail API stub listening on localhost """
+    daemon_threads = True
+
+    STATUSES = [
+        {'id': 1, 'name': 'passed', 'label': 'Passed'},
+        {'id': 2, 'name': 'blocked', 'label': 'Blocked'},
+        {'id': 3, 'name': 'untested', 'label': 'Untested'},
+        {'id': 4, 'name': 'retest', 'label': 'Retest'},
+        {'id': 5, 'name': 'failed', 'label': 'Failed'},
+    ]
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), StubHandler)
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    def count(self, method):
+        """ count the calls per API method """
+        with self._calls_lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def api(self, http_method, method, uri, data): # pylint: disable=unused-argument
+        """ returns (http status, json payload) or (http status, json payload, headers) for an API call
+
+        The payload can also be a generator of bytes, sent as they come.
+        """
+        if method == 'get_statuses':
+            return 200, self.STATUSES
+        if method == 'add_results_for_cases':
+            return 200, [{'id': i, 'status_id': result.get('status_id')} for i, result in enumerate(data['results'], 1)]
+        if http_method == 'POST':
+            return 200, dict(data or {}, id=1)
+        return 200, {'id': 1, 'name': method}
+
+    @property
+    def base_url(self):
+        """ url to give to api.Client """
+        host, port = self.server_address[:2]
+        return "http://{0}:{1}/".format(host, port)
+
+    def start(self):
+        """ serve in a background thread, returns the base url """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """ stop serving """
+        self.shutdown()
+        self.server_close()
+
+class FakeTestRail(StubServer):
+    """ stub serving a synthetic project, with pagination, latency and 429 injection
+
+    The items are generated from their ids on each request (nothing is
+    stored): suites -> sections, cases; plans -> runs; standalone runs; tests
+    and results of every run.
+
+    Parameters
+    ----------
+    suites : int
+        number of suites of the project
+    sections : int
+        sections per suite
+    cases : int
+        cases per suite
+    plans, runs_per_plan, runs : int
+        number of plans, runs in each plan, and runs outside of the plans
+    tests_per_run : int
+        tests (and results) per run
+    page_size : int
+        items per page of the paginated get_* methods (TestRail: 250)
+    latency : float
+        seconds added to every answer
+    throttle_rate : float
+        fraction of the requests answered 429
+    retry_after : int
+        Retry-After header of the 429 answers
+    case_bytes : int
+        size of the custom_steps field of the cases
+    seed : int
+        seed of the random 429 injection
+    """
+    def __init__(self, suites=2, sections=20, cases=2000, plans=2, runs_per_plan=2, runs=2, tests_per_run=500, page_size=250,
+                 latency=0.0, throttle_rate=0.0, retry_after=0, case_bytes=300, seed=0, host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.suites = suites
+        self.sections = sections
+        self.cases = cases
+        self.plans = plans
+        self.runs_per_plan = runs_per_plan
+        self.runs = runs
+        self.tests_per_run = tests_per_run
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.filler = 'x' * case_bytes
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    @staticmethod
+    def _parse(uri):
+        """ 'get_cases/1&suite_id=2&offset=250' -> ('get_cases/1', 1, {'suite_id': '2', 'offset': '250'}) """
+        path, *params = uri.split('&')
+        parts = path.split('/')
+        arg = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+        return path, arg, dict(param.split('=', 1) for param in params if '=' in param)
+
+    def _page(self, path, params, key, total, make):
+        """ paginated answer of total items built by make(index) """
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', self.page_size)), self.page_size)
+        items = [make(index) for index in range(offset, min(offset + limit, total))]
+        query = "".join("&%s=%s" % (name, value) for name, value in params.items() if name not in ('offset', 'limit'))
+        next_link = "/api/v2/%s%s&offset=%d&limit=%d" % (path, query, offset + limit, limit) if offset + limit < total else None
+        return {'offset': offset, 'limit': limit, 'size': len(items), '_links': {'next': next_link, 'prev': None}, key: items}
+
+    def _case(self, suite_id, index):
+        case_id = suite_id * 1000000 + index + 1
+        return {'id': case_id, 'title': 'case %d' % case_id, 'section_id': suite_id * 10000 + index % self.sections + 1, 'suite_id': suite_id,
+                'template_id': 1, 'type_id': index % 7 + 1, 'priority_id': index % 4 + 1, 'milestone_id': None, 'refs': 'REF-%d' % (index // 100),
+                'created_by': 1, 'created_on': 1600000000 + index, 'updated_by': 1, 'updated_on': 1600000000 + index, 'estimate': None,
+                'custom_steps': self.filler}
+
+    def _run_suite(self, run_id):
+        return run_id % self.suites + 1
+
+    def _run(self, run_id, plan_id=None):
+        return {'id': run_id, 'suite_id': self._run_suite(run_id), 'name': 'run %d' % run_id, 'plan_id': plan_id, 'is_completed': False,
+                'passed_count': 0, 'failed_count': 0, 'untested_count': self.tests_per_run, 'created_on': 1600000000 + run_id}
+
+    def _test(self, run_id, index):
+        return {'id': run_id * 100000 + index + 1, 'run_id': run_id, 'case_id': self._run_suite(run_id) * 1000000 + index % self.cases + 1,
+                'status_id': index % 5 + 1, 'title': 'case %d' % index, 'assignedto_id': None}
+
+    def _result(self, run_id, index):
+        return {'id': run_id * 100000 + index + 1, 'test_id': run_id * 100000 + index + 1, 'status_id': index % 5 + 1,
+                'created_on': 1600000000 + index, 'created_by': 1, 'elapsed': '%ds' % (index % 60 + 1), 'comment': None}
+
+    def api(self, http_method, method, uri, data):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.throttle_rate:
+            with self._random_lock:
+                throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                return 429, {'error': 'API rate limit exceeded'}, {'Retry-After': self.retry_after}
+        path, arg, params = self._parse(uri)
+        if method == 'get_suites':
+            return 200, [{'id': suite_id, 'name': 'suite %d' % suite_id} for suite_id in range(1, self.suites + 1)]
+        if method == 'get_sections':
+            suite_id = int(params['suite_id'])
+            return 200, self._page(path, params, 'sections', self.sections, lambda index: {
+                'id': suite_id * 10000 + index + 1, 'suite_id': suite_id, 'parent_id': None, 'name': 'section %d' % index, 'depth': 0, 'display_order': index})
+        if method == 'get_cases':
+            suite_id = int(params['suite_id'])
+            return 200, self._page(path, params, 'cases', self.cases, lambda index: self._case(suite_id, index))
+        if method == 'get_case':
+            return 200, self._case(arg // 1000000, arg % 1000000 - 1)
+        if method == 'get_plans':
+            return 200, self._page(path, params, 'plans', self.plans, lambda index: {'id': index + 1, 'name': 'plan %d' % (index + 1)})
+        if method == 'get_plan':
+            runs = [dict(self._run(arg * 1000 + index, arg), config_ids=[index + 1], config='config %d' % (index + 1)) for index in range(self.runs_per_plan)]
+            return 200, {'id': arg, 'name': 'plan %d' % arg, 'entries': [{'id': 'entry-%d' % run['id'], 'suite_id': run['suite_id'], 'runs': [run]} for run in runs]}
+        if method == 'get_runs':
+            return 200, self._page(path, params, 'runs', self.runs, lambda index: self._run(index + 1))
+        if method == 'get_run':
+            return 200, self._run(arg)
+        if method == 'get_tests':
+            return 200, self._page(path, params, 'tests', self.tests_per_run, lambda index: self._test(arg, index))
+        if method == 'get_results_for_run':
+            return 200, self._page(path, params, 'results', self.tests_per_run, lambda index: self._result(arg, index))
+        return super().api(http_method, method, uri, data)